@@ -0,0 +1,126 @@
+"""
+多帳戶訊號分發：同一組行情與指標算出的進場、平倉、止損調整決策，同時送往多組 Bitunix API 金鑰（子帳戶）。
+
+- FollowerAccount：跟單帳戶的名稱、API 金鑰與個別覆寫的下單比例 / 槓桿
+- FanoutDispatcher：以 asyncio.Semaphore 限制同時進行的帳戶數，每個帳戶、交易對各自依序執行
+  （同一帳戶的平倉不會搶在開倉之前），每個帳戶的結果記錄於 results，並輸出至 fanout_* 指標
+主帳戶（BITUNIX_API_KEY）照常執行策略；實際的下單動作（依各帳戶餘額以 calculate_trade_size 計算數量、
+設置條件單、平倉、修改止損）定義在 bitunix_trading_bot.py，這裡只負責並行分發與結果追蹤。
+"""
+import asyncio
+import time
+from collections import deque
+
+from metrics import Counter, Histogram
+
+DEFAULT_MAX_CONCURRENCY = 4  # 同時送出請求的帳戶數上限
+RESULT_HISTORY_SIZE = 50  # 每個帳戶保留的最近結果筆數
+
+FANOUT_ORDER_SECONDS = Histogram("fanout_order_seconds", "Follower account action duration in seconds", ("account", "action"))
+FANOUT_SIGNAL_TO_ORDER_SECONDS = Histogram("fanout_signal_to_order_seconds", "Delay from signal evaluation to follower action completion", ("account",))
+FANOUT_RESULTS = Counter("fanout_results_total", "Follower account actions by outcome", ("account", "action", "status"))
+
+
+class FollowerAccount:
+    """跟單帳戶；wallet_percentage / leverage 為 None 時沿用交易對（SymbolContext）的設定。"""
+
+    def __init__(self, name, api_key, secret_key, wallet_percentage=None, leverage=None):
+        self.name = name
+        self.api_key = api_key
+        self.secret_key = secret_key
+        self.wallet_percentage = wallet_percentage
+        self.leverage = leverage
+
+    def __repr__(self):
+        return f"FollowerAccount({self.name!r})"
+
+
+def load_follower_accounts(entries):
+    """
+    由 config.FOLLOWER_ACCOUNTS 建立 FollowerAccount 列表，每個項目為 dict：
+    {"name": "sub1", "api_key": "...", "secret_key": "...", "wallet_percentage": 0.5, "leverage": 10}（後兩項可省略）。
+    """
+    accounts = []
+    seen = set()
+    for entry in entries or []:
+        options = dict(entry)
+        name = options.get("name")
+        if not name or not options.get("api_key") or not options.get("secret_key"):
+            raise ValueError(f"FOLLOWER_ACCOUNTS 項目需要 name、api_key、secret_key: {name or entry.keys()}")
+        if name in seen:
+            raise ValueError(f"FOLLOWER_ACCOUNTS 重複的帳戶名稱: {name}")
+        seen.add(name)
+        accounts.append(FollowerAccount(**options))
+    return accounts
+
+
+def is_success(result):
+    return isinstance(result, dict) and result.get("code") == 0
+
+
+class FanoutDispatcher:
+    """
+    把一個決策分發到所有跟單帳戶。dispatch() 立即回傳 asyncio.Task（不阻塞主帳戶下單），
+    task 完成時回傳 {帳戶名稱: 結果 dict}；action 拋出例外時該帳戶的結果為 {"error": 訊息}，不影響其他帳戶。
+    on_result(account, symbol, action, result) 在每個帳戶完成後呼叫（例如寫入事件日誌）。
+    """
+
+    def __init__(self, accounts, max_concurrency=DEFAULT_MAX_CONCURRENCY, on_result=None):
+        self.accounts = list(accounts)
+        self.on_result = on_result
+        self.results = {account.name: deque(maxlen=RESULT_HISTORY_SIZE) for account in self.accounts}
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self._locks = {}  # (帳戶名稱, 交易對) -> asyncio.Lock
+        self._tasks = set()
+
+    def dispatch(self, symbol, action, handler, signal_time=None):
+        """
+        對每個帳戶執行 handler(account)（協程函數），回傳彙整結果的 task；沒有跟單帳戶時回傳 None。
+        signal_time 為主帳戶開始判斷訊號的 time.perf_counter()，用於量測各帳戶從訊號到完成的延遲。
+        """
+        if not self.accounts:
+            return None
+        task = asyncio.ensure_future(self._dispatch(symbol, action, handler, signal_time))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _dispatch(self, symbol, action, handler, signal_time):
+        results = await asyncio.gather(*(self._run(account, symbol, action, handler, signal_time) for account in self.accounts))
+        return {account.name: result for account, result in zip(self.accounts, results)}
+
+    async def _run(self, account, symbol, action, handler, signal_time):
+        lock = self._locks.setdefault((account.name, symbol), asyncio.Lock())
+        async with lock:
+            async with self._semaphore:
+                start = time.perf_counter()
+                try:
+                    result = await handler(account)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    result = {"error": f"{type(e).__name__}: {e}"}
+                finished = time.perf_counter()
+        ok = is_success(result)
+        FANOUT_ORDER_SECONDS.observe(finished - start, account=account.name, action=action)
+        FANOUT_RESULTS.inc(account=account.name, action=action, status="ok" if ok else "error")
+        if ok and signal_time is not None:
+            FANOUT_SIGNAL_TO_ORDER_SECONDS.observe(finished - signal_time, account=account.name)
+        self.results[account.name].append({"time": time.time(), "symbol": symbol, "action": action, "ok": ok,
+                                           "seconds": finished - start, "result": result})
+        if self.on_result is not None:
+            self.on_result(account, symbol, action, result)
+        return result
+
+    def summary(self):
+        """每個帳戶的成功 / 失敗次數（最近 RESULT_HISTORY_SIZE 筆內）與最後一筆結果。"""
+        summary = {}
+        for name, history in self.results.items():
+            ok = sum(1 for record in history if record["ok"])
+            summary[name] = {"ok": ok, "failed": len(history) - ok, "last": history[-1] if history else None}
+        return summary
+
+    async def drain(self):
+        """等待所有進行中的分發完成（關閉程式前呼叫）。"""
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
@@ -0,0 +1,273 @@
+"""
+事件驅動回測引擎：以歷史 K 線執行與實盤相同的進出場規則（rule_engine 規則集，止損止盈計算見 strategy_rules）。
+
+進場與平倉條件先以 RuleSet.entry_codes / exit_masks 對整段序列向量化算出，每根 K 線依序處理：
+1. 持倉中：以本根 K 線的最高 / 最低價檢查止損、止盈、爆倉（盤中成交，跳空時以開盤價成交；同一根同時觸及止損與止盈時保守視為先止損）
+2. K 線收盤：檢查持倉策略的平倉規則（預設為 RSI 單 EXIT_RSI / exitRSI_short），否則依 ATR 更新固定止損止盈或移動止損
+3. 無持倉：依收盤時優先權最高的進場訊號進場，以收盤價成交
+下單數量與 calculate_trade_size 相同（可用資金 × WALLET_PERCENTAGE × LEVERAGE / 價格），進出場各收一次手續費。
+指標序列一次以 TA-Lib 計算，主迴圈只做純量運算，百萬根 K 線約數秒內完成。
+
+使用方式：
+    python backtest.py --csv ETHUSDT_4h.csv
+    python backtest.py --fetch --since 2020-01-01
+    python backtest.py --synthetic 1000000
+"""
+import argparse
+import math
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from config import TRADING_PAIR, TIMEFRAME, LEVERAGE, WALLET_PERCENTAGE, QUANTITY_PRECISION
+from config import BACKTEST_FEE_RATE, BACKTEST_INITIAL_CAPITAL, CANDLE_CACHE_DIR, STRATEGIES
+from candle_cache import CandleCache, sync_history
+from indicators import indicator_arrays, random_ohlcv
+from rule_engine import RuleSet, STOP_FIXED, load_strategies
+from strategy_rules import StrategyParams, rsi_stop_take_profit, breakout_stop, trailing_stop_update
+
+TRADE_COLUMNS = ['entry_time', 'exit_time', 'side', 'entry_type', 'entry_price', 'exit_price', 'qty', 'fee', 'pnl', 'exit_reason']
+
+
+class BacktestResult:
+    """回測結果：交易明細（trades）與每根 K 線收盤時的權益曲線（equity）。"""
+
+    def __init__(self, params, timestamps, equity, trades, initial_capital):
+        self.params = params
+        self.timestamps = timestamps
+        self.equity = equity
+        self.trades = trades
+        self.initial_capital = initial_capital
+
+    def trades_frame(self):
+        df = pd.DataFrame(self.trades, columns=TRADE_COLUMNS)
+        df['entry_time'] = pd.to_datetime(df['entry_time'], unit='ms')
+        df['exit_time'] = pd.to_datetime(df['exit_time'], unit='ms')
+        return df
+
+    def equity_frame(self):
+        return pd.DataFrame({'timestamp': pd.to_datetime(self.timestamps, unit='ms'), 'equity': self.equity})
+
+    def summary(self):
+        """統計摘要：交易數、勝率、總報酬、最大回撤、獲利因子、手續費。"""
+        pnls = np.array([t[8] for t in self.trades], dtype=np.float64)
+        wins = pnls[pnls > 0]
+        losses = pnls[pnls <= 0]
+        final_equity = float(self.equity[-1]) if len(self.equity) else self.initial_capital
+        if len(self.equity):
+            peak = np.maximum.accumulate(self.equity)
+            max_drawdown = float(np.max((peak - self.equity) / peak))
+        else:
+            max_drawdown = 0.0
+        gross_loss = -losses.sum()
+        return {
+            'trades': len(pnls),
+            'win_rate': len(wins) / len(pnls) if len(pnls) else 0.0,
+            'total_return': final_equity / self.initial_capital - 1,
+            'max_drawdown': max_drawdown,
+            'profit_factor': float(wins.sum() / gross_loss) if gross_loss > 0 else math.inf if len(wins) else 0.0,
+            'fees': float(sum(t[7] for t in self.trades)),
+            'final_equity': final_equity,
+        }
+
+
+def candle_columns(ohlcv):
+    """將 (N, 6) OHLCV 陣列轉為 (timestamp, open, high, low, close) 五個 Python float 列表（simulate 使用）。"""
+    return tuple(ohlcv[:, k].tolist() for k in range(5))
+
+
+def run_backtest(ohlcv, params=None, initial_capital=BACKTEST_INITIAL_CAPITAL, wallet_percentage=WALLET_PERCENTAGE,
+                 leverage=LEVERAGE, fee_rate=BACKTEST_FEE_RATE, indicators=None, strategies=None):
+    """
+    對 (N, 6) OHLCV 陣列執行回測，回傳 BacktestResult。
+
+    indicators 可傳入預先計算好的 (rsi, atr, highest_break, lowest_break) 序列，
+    省略時依 params 的 RSI_LEN / ATR_LEN / BREAKOUT_LOOKBACK 計算。
+    strategies 為 rule_engine.Strategy 列表或 config.STRATEGIES 格式，省略時使用 config.STRATEGIES。
+    """
+    if params is None:
+        params = StrategyParams.from_config()
+    if indicators is None:
+        indicators = indicator_arrays(ohlcv, params.rsi_len, params.atr_len, params.breakout_lookback)
+    indicator_lists = [np.asarray(x, dtype=np.float64).tolist() for x in indicators]
+    return simulate(candle_columns(ohlcv), indicator_lists, params, initial_capital, wallet_percentage, leverage, fee_rate, strategies)
+
+
+def simulate(columns, indicators, params, initial_capital=BACKTEST_INITIAL_CAPITAL, wallet_percentage=WALLET_PERCENTAGE,
+             leverage=LEVERAGE, fee_rate=BACKTEST_FEE_RATE, strategies=None):
+    """
+    回測主迴圈。columns 為 candle_columns() 的輸出，indicators 為四個指標序列的 Python 列表；
+    參數最佳化時可重複使用已轉換好的列表，省去每組參數的轉換成本。
+    """
+    # 主迴圈以 Python float 存取，比逐一索引 NumPy 陣列快得多；NaN 與任何值比較皆為 False，暖機期間自然不會觸發
+    ts_s, open_s, high_s, low_s, close_s = columns
+    rsi_s, atr_s, high_break_s, low_break_s = indicators
+    n = len(ts_s)
+
+    # 所有策略的進場 / 平倉條件一次向量化算出，主迴圈只查表
+    rules = RuleSet(load_strategies(STRATEGIES if strategies is None else strategies), params)
+    arrays = {name: np.asarray(values, dtype=np.float64) for name, values in
+              (("close", close_s), ("rsi", rsi_s), ("atr", atr_s), ("highest_break", high_break_s), ("lowest_break", low_break_s))}
+    entry_codes = rules.entry_codes(arrays).tolist()
+    exit_masks = {name: mask.tolist() for name, mask in rules.exit_masks(arrays).items()}
+    strategies = rules.strategies
+    no_exit = [False] * n
+
+    equity = [0.0] * n
+    trades = []
+    cash = float(initial_capital)
+    side = entry_type = strategy = None
+    exit_s = no_exit
+    qty = entry_price = entry_fee = entry_time = 0.0
+    direction = 0
+    stop = take_profit = liquidation = None
+    blocked_bar = -1  # block_after_exit 策略平倉後的下一根 K 線禁止該策略進場（對應實盤 long_action_taken_on_kline_time）
+
+    def close_position(i, price, reason):
+        nonlocal cash, side, entry_type, strategy, stop, take_profit, liquidation
+        exit_fee = qty * price * fee_rate
+        gross = (price - entry_price) * qty * direction
+        cash += gross - exit_fee
+        trades.append((entry_time, ts_s[i], side, entry_type, entry_price, price, qty, entry_fee + exit_fee, gross - entry_fee - exit_fee, reason))
+        side = entry_type = strategy = stop = take_profit = liquidation = None
+
+    for i in range(n):
+        close = close_s[i]
+        if side is not None:
+            # 1. 盤中止損 / 止盈 / 爆倉
+            o, h, l = open_s[i], high_s[i], low_s[i]
+            if side == "long":
+                stop_level, reason = (stop, "stop_loss") if stop is not None and stop >= liquidation else (liquidation, "liquidation")
+                if l <= stop_level:
+                    close_position(i, min(o, stop_level), reason)
+                elif take_profit is not None and h >= take_profit:
+                    close_position(i, max(o, take_profit), "take_profit")
+            else:
+                stop_level, reason = (stop, "stop_loss") if stop is not None and stop <= liquidation else (liquidation, "liquidation")
+                if h >= stop_level:
+                    close_position(i, max(o, stop_level), reason)
+                elif take_profit is not None and l <= take_profit:
+                    close_position(i, min(o, take_profit), "take_profit")
+
+        if side is not None:
+            # 2. K 線收盤：平倉規則或更新止損止盈
+            if exit_s[i]:
+                if strategy.block_after_exit:
+                    blocked_bar = i + 1
+                close_position(i, close, "rsi_exit")
+                equity[i] = cash
+                continue
+            atr = atr_s[i]
+            if atr == atr:  # 非 NaN
+                if strategy.stop == STOP_FIXED:
+                    stop, take_profit = rsi_stop_take_profit(params, side, entry_price, atr)
+                else:
+                    new_stop = trailing_stop_update(params, side, close, atr, stop)
+                    if new_stop is not None:
+                        stop = new_stop
+            equity[i] = cash + (close - entry_price) * qty * direction
+            continue
+
+        # 3. 無持倉：判斷進場
+        code = entry_codes[i]
+        if code < 0:
+            equity[i] = cash
+            continue
+        atr = atr_s[i]
+        signal = strategies[code]
+        if signal.block_after_exit and i == blocked_bar:
+            signal = None
+        if signal is not None and atr == atr and cash > 0:
+            size = round(cash * wallet_percentage * leverage / close, QUANTITY_PRECISION)
+            if size > 0:
+                strategy = signal
+                side = signal.side
+                entry_type = signal.name
+                exit_s = exit_masks.get(entry_type, no_exit)
+                direction = 1 if side == "long" else -1
+                qty = size
+                entry_price = close
+                entry_time = ts_s[i]
+                entry_fee = qty * close * fee_rate
+                cash -= entry_fee
+                # 逐倉保證金虧損殆盡時爆倉（未計維持保證金）
+                liquidation = close * (1 - direction / leverage)
+                if signal.stop == STOP_FIXED:
+                    stop, take_profit = rsi_stop_take_profit(params, side, close, atr)
+                else:
+                    stop, take_profit = breakout_stop(params, side, close, atr), None
+        equity[i] = cash if side is None else cash + (close - entry_price) * qty * direction
+
+    if side is not None:
+        close_position(n - 1, close_s[-1], "end")
+        equity[-1] = cash
+    return BacktestResult(params, np.asarray(ts_s), np.asarray(equity), trades, float(initial_capital))
+
+
+# === 歷史 K 線載入 === #
+def load_ohlcv(path):
+    """讀取 .npy（N×6，以記憶體映射讀取）或 CSV（timestamp,open,high,low,close,volume；timestamp 為毫秒）。"""
+    if path.endswith(".npy"):
+        data = np.load(path, mmap_mode='r')
+        return data if data.dtype == np.float64 else data.astype(np.float64)
+    df = pd.read_csv(path)
+    return df[['timestamp', 'open', 'high', 'low', 'close', 'volume']].to_numpy(dtype=np.float64)
+
+
+def fetch_history(symbol, timeframe, since_ms, limit=1000):
+    """
+    取得 Binance 歷史已收盤 K 線（從 since_ms 到現在）。
+    經由本地K線快取（candle_cache.py），只下載快取中沒有的區間，回傳記憶體映射上的唯讀切片。
+    """
+    return sync_history(symbol, timeframe, since_ms, CandleCache(CANDLE_CACHE_DIR), limit=limit)
+
+
+def print_summary(summary):
+    print(f"交易次數: {summary['trades']}")
+    print(f"勝率: {summary['win_rate'] * 100:.2f}%")
+    print(f"總報酬: {summary['total_return'] * 100:.2f}%")
+    print(f"最大回撤: {summary['max_drawdown'] * 100:.2f}%")
+    print(f"獲利因子: {summary['profit_factor']:.3f}")
+    print(f"手續費: {summary['fees']:.4f}")
+    print(f"最終權益: {summary['final_equity']:.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="以歷史K線回測實盤策略規則")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--csv", help="K線檔案（.csv 或 .npy）")
+    source.add_argument("--fetch", action="store_true", help="從 Binance 下載 TRADING_PAIR / TIMEFRAME 歷史K線")
+    source.add_argument("--synthetic", type=int, metavar="N", help="以 N 根隨機K線測試回測速度")
+    parser.add_argument("--since", default="2020-01-01", help="--fetch 起始日期（UTC）")
+    parser.add_argument("--capital", type=float, default=BACKTEST_INITIAL_CAPITAL, help="初始資金")
+    parser.add_argument("--fee-rate", type=float, default=BACKTEST_FEE_RATE, help="手續費率（每邊）")
+    parser.add_argument("--trades-out", help="交易明細輸出 CSV")
+    parser.add_argument("--equity-out", help="權益曲線輸出 CSV")
+    args = parser.parse_args()
+
+    if args.csv:
+        ohlcv = load_ohlcv(args.csv)
+    elif args.fetch:
+        since_ms = int(datetime.strptime(args.since, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp() * 1000)
+        ohlcv = fetch_history(TRADING_PAIR, TIMEFRAME, since_ms)
+    else:
+        ohlcv = random_ohlcv(args.synthetic)
+
+    params = StrategyParams.from_config()
+    start = time.perf_counter()
+    result = run_backtest(ohlcv, params, initial_capital=args.capital, fee_rate=args.fee_rate)
+    elapsed = time.perf_counter() - start
+    print(f"回測 {len(ohlcv)} 根K線，耗時 {elapsed:.2f} 秒")
+    print_summary(result.summary())
+    if args.trades_out:
+        result.trades_frame().to_csv(args.trades_out, index=False)
+        print(f"交易明細已寫入 {args.trades_out}")
+    if args.equity_out:
+        result.equity_frame().to_csv(args.equity_out, index=False)
+        print(f"權益曲線已寫入 {args.equity_out}")
+
+
+if __name__ == "__main__":
+    main()
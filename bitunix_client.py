@@ -0,0 +1,524 @@
+"""
+Bitunix 合約 REST API 非同步客戶端。
+
+所有對 Bitunix 的請求統一經由 BitunixClient 發送：
+- 共用同一個 aiohttp.ClientSession（連線池 + keep-alive），避免每次請求重新 TLS 握手
+- 每個請求都有逾時設定，不會無限期卡住主循環
+- 簽名統一由 get_signed_params 產生
+- 所有客戶端（所有交易對、所有帳戶）共用同一個請求排程器（RequestScheduler）：
+  全域 token bucket + 每個帳戶每個端點群組各自的 token bucket，額度不足時依優先順序放行
+  （平倉 / 止損止盈 > 開倉 / 槓桿 > 持倉 / 餘額 / 歷史查詢）
+"""
+import asyncio
+import hashlib
+import heapq
+import json
+import time
+import uuid
+from itertools import count
+
+import aiohttp
+
+from metrics import REQUEST_SECONDS, REQUEST_QUEUE_SECONDS, REQUEST_ERRORS, Gauge
+
+BITUNIX_BASE_URL = "https://fapi.bitunix.com"
+DEFAULT_TIMEOUT_SECONDS = 10  # 單一請求逾時（秒）
+POOL_LIMIT = 20  # 連線池最大連線數
+KEEPALIVE_TIMEOUT_SECONDS = 60  # 閒置連線保留時間（秒）
+DEFAULT_RATE_LIMIT = 10  # 每秒請求數上限（所有交易對共用）
+DEFAULT_RATE_BURST = 20  # 瞬間可連續送出的請求數
+# 每個帳戶每個端點群組的額度 (每秒請求數, 瞬間上限)，依 Bitunix 文件的 per-UID 限制保守設定
+DEFAULT_ENDPOINT_LIMITS = {
+    "trade": (10, 10),  # 下單 / 平倉
+    "tpsl": (10, 10),  # 止盈止損
+    "position": (10, 10),  # 持倉查詢
+    "account": (10, 10),  # 餘額、槓桿
+    "history": (5, 5),  # 歷史訂單
+}
+# 端點路徑前綴 -> 群組（依序比對，先符合者優先）
+ENDPOINT_GROUPS = (
+    ("/api/v1/futures/trade/", "trade"),
+    ("/api/v1/futures/tpsl/", "tpsl"),
+    ("/api/v1/futures/position/", "position"),
+    ("/api/v1/futures/account", "account"),
+    ("/api/v1/futures/order/", "history"),
+)
+# 優先順序（數字越小越先放行）
+PRIORITY_CRITICAL = 0  # 平倉、止損止盈設置與修改
+PRIORITY_ENTRY = 1  # 開倉、設定槓桿
+PRIORITY_STATUS = 2  # 持倉、餘額、歷史訂單等查詢
+PRIORITY_NAMES = {PRIORITY_CRITICAL: "critical", PRIORITY_ENTRY: "entry", PRIORITY_STATUS: "status"}
+BACKPRESSURE_WARN_SECONDS = 2.0  # 單一請求排隊超過此秒數時印出警告
+
+
+def sha256_hex(s: str) -> str:
+    return hashlib.sha256(s.encode('utf-8')).hexdigest()
+
+
+def get_signed_params(api_key, secret_key, query_params: dict = None, body: dict = None, path: str = None, method: str = None):
+    """
+    按照 Bitunix 官方雙重 SHA256 簽名方式對請求參數進行簽名。
+
+    參數:
+        api_key (str): 用戶 API Key
+        secret_key (str): 用戶 Secret Key
+        query_params (dict): 查詢參數 (GET 方法)
+        body (dict or None): 請求 JSON 主體 (POST 方法)
+
+    返回:
+        headers (dict): 包含簽名所需的請求頭（api-key, sign, nonce, timestamp 等）
+    """
+    nonce = uuid.uuid4().hex
+    timestamp = str(int(time.time() * 1000))
+
+    # 構造 query string: 將參數按鍵名 ASCII 升序排序後，鍵名與鍵值依次拼接
+    if query_params:
+        params_str = {k: str(v) for k, v in query_params.items()}
+        sorted_items = sorted(params_str.items(), key=lambda x: x[0])
+        query_str = "".join([f"{k}{v}" for k, v in sorted_items])
+    else:
+        query_str = ""
+
+    # 構造 body string: 將 JSON 體壓縮成字符串 (無空格)
+    if body is not None:
+        if isinstance(body, (dict, list)):
+            body_str = json.dumps(body, separators=(',', ':'), ensure_ascii=False)
+        else:
+            body_str = str(body)
+    else:
+        body_str = ""
+
+    # 根據 method 決定簽名內容
+    if method == "GET":
+        digest_input = nonce + timestamp + api_key + query_str
+    else:
+        digest_input = nonce + timestamp + api_key + body_str
+    # 第一次 SHA256
+    digest = sha256_hex(digest_input)
+    # 第二次 SHA256
+    sign = sha256_hex(digest + secret_key)
+
+    # 構造標頭
+    headers = {
+        "api-key": api_key,
+        "sign": sign,
+        "nonce": nonce,
+        "timestamp": timestamp,
+        "language": "en-US",
+        "Content-Type": "application/json"
+    }
+    return nonce, timestamp, sign, headers
+
+
+def endpoint_group(path):
+    """端點路徑所屬的額度群組，不屬於任何群組時回傳 None（只受全域額度限制）。"""
+    for prefix, group in ENDPOINT_GROUPS:
+        if path.startswith(prefix):
+            return group
+    return None
+
+
+def request_priority(method, path, body=None):
+    """
+    請求的預設優先順序：平倉與止損止盈最先，開倉與槓桿其次，查詢最後。
+    """
+    if method == "GET":
+        return PRIORITY_STATUS
+    if path.startswith("/api/v1/futures/tpsl/"):
+        return PRIORITY_CRITICAL
+    if path == "/api/v1/futures/trade/place_order":
+        body = body or {}
+        closing = str(body.get("tradeSide", "")).upper() == "CLOSE" or body.get("reduceOnly") in (True, "true")
+        return PRIORITY_CRITICAL if closing else PRIORITY_ENTRY
+    if path.startswith("/api/v1/futures/trade/") and ("close" in path or "cancel" in path):
+        return PRIORITY_CRITICAL
+    return PRIORITY_ENTRY
+
+
+class RateLimiter:
+    """
+    非同步 token bucket：每秒補充 rate 個額度，最多累積 burst 個。
+    acquire() 在額度不足時等待，不會丟棄請求；等待中的協程依先來後到取得額度。
+    """
+
+    def __init__(self, rate=DEFAULT_RATE_LIMIT, burst=DEFAULT_RATE_BURST):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self):
+        """距離下一個額度可用還需等待的秒數（0 表示目前即可取得）。"""
+        self._refill()
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def take(self):
+        self._tokens -= 1
+
+    async def acquire(self, group=None, priority=None, account=None):
+        """取得一個額度；參數與 RequestScheduler.acquire 相同但不使用（單一 bucket 不分群組與優先順序）。"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+
+class RequestScheduler:
+    """
+    優先順序請求排程器：每個請求同時需要一個全域額度與一個 (帳戶, 端點群組) 額度。
+    額度足夠且沒有人在排隊時 acquire() 立即返回；否則排入佇列，由背景 task 依
+    (優先順序, 到達順序) 放行——額度不足時平倉與止損修改永遠排在查詢之前。
+    某個群組額度耗盡只會擋住該群組的請求，不影響其他群組的低優先請求。
+    metrics() 回傳每個優先順序的請求數、排隊次數、等待時間與目前佇列長度（背壓指標）。
+    """
+
+    def __init__(self, rate=DEFAULT_RATE_LIMIT, burst=DEFAULT_RATE_BURST, endpoint_limits=None):
+        self.global_bucket = RateLimiter(rate, burst)
+        self.endpoint_limits = dict(DEFAULT_ENDPOINT_LIMITS if endpoint_limits is None else endpoint_limits)
+        self.buckets = {}  # (account, group) -> RateLimiter
+        self._queue = []  # heap: (priority, seq, bucket, future, enqueued_at)
+        self._seq = count()
+        self._wakeup = None
+        self._task = None
+        self._stats = {priority: {"requests": 0, "queued": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+                       for priority in PRIORITY_NAMES}
+
+    @property
+    def rate(self):
+        return self.global_bucket.rate
+
+    @property
+    def burst(self):
+        return self.global_bucket.burst
+
+    def _bucket(self, group, account):
+        if group not in self.endpoint_limits:
+            return None
+        key = (account, group)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            rate, burst = self.endpoint_limits[group]
+            bucket = self.buckets[key] = RateLimiter(rate, burst)
+        return bucket
+
+    def _ready(self, bucket):
+        return self.global_bucket.delay() == 0 and (bucket is None or bucket.delay() == 0)
+
+    def _take(self, bucket):
+        self.global_bucket.take()
+        if bucket is not None:
+            bucket.take()
+
+    async def acquire(self, group=None, priority=PRIORITY_STATUS, account=None):
+        """取得一次請求額度；額度不足時依優先順序排隊等待。"""
+        bucket = self._bucket(group, account)
+        stats = self._stats.setdefault(priority, {"requests": 0, "queued": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0})
+        stats["requests"] += 1
+        if not self._queue and self._ready(bucket):
+            self._take(bucket)
+            return
+        future = asyncio.get_running_loop().create_future()
+        enqueued_at = time.monotonic()
+        heapq.heappush(self._queue, (priority, next(self._seq), bucket, future, enqueued_at))
+        stats["queued"] += 1
+        self._ensure_dispatcher()
+        self._wakeup.set()
+        await future
+        waited = time.monotonic() - enqueued_at
+        stats["wait_seconds"] += waited
+        stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+        if waited > BACKPRESSURE_WARN_SECONDS:
+            print(f"[RequestScheduler] {PRIORITY_NAMES.get(priority, priority)} 請求（{group}）排隊 {waited:.1f} 秒，目前佇列 {self.queue_depth} 筆")
+
+    def _ensure_dispatcher(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self._dispatch())
+
+    async def _dispatch(self):
+        while self._queue:
+            self._wakeup.clear()
+            delay = self._release()
+            if not self._queue:
+                break
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _release(self):
+        """依優先順序放行目前額度允許的請求，回傳下一次需要檢查的等待秒數。"""
+        waiting = []
+        delay = None
+        while self._queue:
+            item = heapq.heappop(self._queue)
+            priority, _, bucket, future, _ = item
+            if future.done():  # 等待中的協程已被取消
+                continue
+            global_delay = self.global_bucket.delay()
+            if global_delay > 0:
+                heapq.heappush(self._queue, item)
+                delay = global_delay if delay is None else min(delay, global_delay)
+                break
+            bucket_delay = bucket.delay() if bucket is not None else 0.0
+            if bucket_delay > 0:
+                # 只有該群組額度不足：保留位置，讓其他群組的請求先走
+                waiting.append(item)
+                delay = bucket_delay if delay is None else min(delay, bucket_delay)
+                continue
+            self._take(bucket)
+            future.set_result(None)
+        for item in waiting:
+            heapq.heappush(self._queue, item)
+        return delay if delay is not None else 0.0
+
+    @property
+    def queue_depth(self):
+        return sum(1 for item in self._queue if not item[3].done())
+
+    def metrics(self):
+        """
+        背壓指標：{"queue_depth", "lanes": {lane: {requests, queued, queued_now, wait_seconds, max_wait_seconds, avg_wait_seconds}}}。
+        """
+        queued_now = {}
+        for priority, _, _, future, _ in self._queue:
+            if not future.done():
+                queued_now[priority] = queued_now.get(priority, 0) + 1
+        lanes = {}
+        for priority, stats in self._stats.items():
+            lane = dict(stats, queued_now=queued_now.get(priority, 0))
+            lane["avg_wait_seconds"] = stats["wait_seconds"] / stats["queued"] if stats["queued"] else 0.0
+            lanes[PRIORITY_NAMES.get(priority, str(priority))] = lane
+        return {"queue_depth": sum(queued_now.values()), "lanes": lanes}
+
+
+# === 共用 HTTP 連線池 === #
+_shared_session = None
+_clients = {}
+_rate_limiter = RequestScheduler()
+_base_url = BITUNIX_BASE_URL
+
+
+def set_rate_limit(rate, burst=None, endpoint_limits=None):
+    """
+    設定全程式共用的請求排程器：全域每秒 rate 個、瞬間最多 burst 個，
+    endpoint_limits 為 {群組: (每秒請求數, 瞬間上限)}（每個帳戶各自計算），None 使用 DEFAULT_ENDPOINT_LIMITS。
+    """
+    global _rate_limiter
+    _rate_limiter = RequestScheduler(rate, burst if burst is not None else max(rate, 1), endpoint_limits)
+
+
+def set_base_url(base_url):
+    """
+    設定之後由 get_client 建立的客戶端連線的 API 位址（例如本地模擬交易所 mock_exchange.py），
+    並清除已建立的客戶端。
+    """
+    global _base_url
+    _base_url = base_url.rstrip("/")
+    _clients.clear()
+
+
+def get_rate_limiter():
+    return _rate_limiter
+
+
+def _scheduler_queue_depth():
+    metrics = getattr(get_rate_limiter(), "metrics", None)
+    if metrics is None:
+        return {}
+    return {(lane,): stats["queued_now"] for lane, stats in metrics()["lanes"].items()}
+
+
+SCHEDULER_QUEUE_DEPTH = Gauge("bitunix_scheduler_queue_depth", "Requests currently waiting in the scheduler per lane", ("lane",),
+                              collect=_scheduler_queue_depth)
+
+
+def get_shared_session():
+    """
+    取得（必要時建立）全程式共用的 aiohttp.ClientSession。
+    必須在事件循環內呼叫。
+    """
+    global _shared_session
+    if _shared_session is None or _shared_session.closed:
+        connector = aiohttp.TCPConnector(limit=POOL_LIMIT, keepalive_timeout=KEEPALIVE_TIMEOUT_SECONDS)
+        _shared_session = aiohttp.ClientSession(connector=connector)
+    return _shared_session
+
+
+async def close_shared_session():
+    """關閉共用連線池（程式結束時呼叫）。"""
+    global _shared_session
+    if _shared_session is not None and not _shared_session.closed:
+        await _shared_session.close()
+    _shared_session = None
+    _clients.clear()
+
+
+def get_client(api_key, secret_key):
+    """
+    依 API 金鑰取得對應的 BitunixClient，同一組金鑰只建立一次，所有客戶端共用連線池。
+    """
+    key = (api_key, secret_key)
+    client = _clients.get(key)
+    if client is None:
+        client = BitunixClient(api_key, secret_key, base_url=_base_url)
+        _clients[key] = client
+    return client
+
+
+def register_client(client):
+    """
+    以 client 取代 get_client 對該組金鑰建立的客戶端（例如模擬交易的 paper_trading.PaperClient）；
+    client 需提供 api_key、secret_key、get、post、snapshot。
+    """
+    _clients[(client.api_key, client.secret_key)] = client
+    return client
+
+
+class BitunixClient:
+    """
+    Bitunix 合約 API 非同步客戶端。
+
+    get/post 回傳解析後的 JSON；HTTP 錯誤會拋出 aiohttp.ClientResponseError，
+    連線錯誤拋出 aiohttp.ClientError，逾時拋出 asyncio.TimeoutError，由呼叫端自行處理。
+    """
+
+    def __init__(self, api_key, secret_key, base_url=BITUNIX_BASE_URL, timeout=DEFAULT_TIMEOUT_SECONDS, session=None, rate_limiter=None):
+        self.api_key = api_key
+        self.secret_key = secret_key
+        self.base_url = base_url
+        self.timeout = timeout
+        self._session = session
+        self._rate_limiter = rate_limiter
+        self.snapshot = ExchangeSnapshot(self)
+
+    @property
+    def rate_limiter(self):
+        return self._rate_limiter if self._rate_limiter is not None else get_rate_limiter()
+
+    @property
+    def session(self):
+        if self._session is not None and not self._session.closed:
+            return self._session
+        return get_shared_session()
+
+    def _timeout(self, timeout):
+        return aiohttp.ClientTimeout(total=timeout if timeout is not None else self.timeout)
+
+    async def _acquire(self, method, path, body, priority):
+        if priority is None:
+            priority = request_priority(method, path, body)
+        start = time.perf_counter()
+        await self.rate_limiter.acquire(endpoint_group(path), priority, self.api_key)
+        REQUEST_QUEUE_SECONDS.observe(time.perf_counter() - start, lane=PRIORITY_NAMES.get(priority, priority))
+
+    async def _send(self, method, path, **kwargs):
+        """送出請求並記錄端點延遲與錯誤指標（code != 0 也計為錯誤，但照常回傳）。"""
+        start = time.perf_counter()
+        try:
+            async with self.session.request(method, f"{self.base_url}{path}", **kwargs) as response:
+                response.raise_for_status()
+                data = await response.json(content_type=None)
+        except aiohttp.ClientResponseError as e:
+            REQUEST_ERRORS.inc(endpoint=path, kind=f"http_{e.status}")
+            raise
+        except asyncio.TimeoutError:
+            REQUEST_ERRORS.inc(endpoint=path, kind="timeout")
+            raise
+        except aiohttp.ClientError:
+            REQUEST_ERRORS.inc(endpoint=path, kind="connection")
+            raise
+        finally:
+            REQUEST_SECONDS.observe(time.perf_counter() - start, method=method, endpoint=path)
+        if isinstance(data, dict) and data.get("code", 0) != 0:
+            REQUEST_ERRORS.inc(endpoint=path, kind="api")
+        return data
+
+    async def get(self, path, params=None, timeout=None, priority=None):
+        """發送已簽名的 GET 請求；priority 為 None 時依端點決定優先順序（見 request_priority）。"""
+        params = {k: str(v) for k, v in (params or {}).items()}
+        await self._acquire("GET", path, None, priority)
+        _, _, _, headers = get_signed_params(self.api_key, self.secret_key, params, path=path, method="GET")
+        return await self._send("GET", path, headers=headers, params=params, timeout=self._timeout(timeout))
+
+    async def post(self, path, body, timeout=None, priority=None):
+        """發送已簽名的 POST 請求，body 以無空格 JSON 傳送（與簽名內容一致）。"""
+        await self._acquire("POST", path, body, priority)
+        _, _, _, headers = get_signed_params(self.api_key, self.secret_key, {}, body, path, method="POST")
+        body_str = json.dumps(body, separators=(',', ':'), ensure_ascii=False)
+        return await self._send("POST", path, headers=headers, data=body_str.encode('utf-8'), timeout=self._timeout(timeout))
+
+    async def close(self):
+        """關閉客戶端自有的 session（共用連線池請用 close_shared_session）。"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+class ExchangeSnapshot:
+    """
+    每輪主循環的交易所狀態快照。
+
+    同一輪內持倉（含 margin）與帳戶餘額各只向交易所查詢一次，其餘讀取直接使用快取；
+    新一輪開始或下單成交後呼叫 invalidate()，下次讀取時才重新查詢。
+    只快取 code == 0 的成功回應，失敗的查詢不會被快取。
+    請求進行中若呼叫了 invalidate()（例如同時有下單），該回應可能是下單前的狀態，只回傳給呼叫端、不寫入快取。
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._cache = {}
+        self._inflight = {}
+        self._generation = 0  # invalidate() 每次加一
+
+    async def _cached(self, key, path, params, refresh=False):
+        if not refresh and key in self._cache:
+            return self._cache[key]
+        # 同一個查詢若已在進行中（例如多個協程同時讀取），共用同一個請求
+        task = self._inflight.get(key)
+        if task is None:
+            generation = self._generation
+            task = asyncio.ensure_future(self.client.get(path, params))
+            self._inflight[key] = task
+            try:
+                data = await task
+            finally:
+                if self._inflight.get(key) is task:
+                    del self._inflight[key]
+            if generation == self._generation and isinstance(data, dict) and data.get("code") == 0:
+                self._cache[key] = data
+            return data
+        return await asyncio.shield(task)
+
+    async def pending_positions(self, symbol, refresh=False):
+        """get_pending_positions 的原始回應（每輪快取）。"""
+        return await self._cached(("positions", symbol), "/api/v1/futures/position/get_pending_positions", {"symbol": symbol}, refresh)
+
+    async def account(self, margin_coin, refresh=False):
+        """帳戶餘額的原始回應（每輪快取）。"""
+        return await self._cached(("account", margin_coin), "/api/v1/futures/account", {"marginCoin": margin_coin}, refresh)
+
+    def peek_positions(self, symbol):
+        """本輪已快取的持倉回應，沒有快取時回傳 None（不發出請求，供通知等非交易用途讀取）。"""
+        return self._cache.get(("positions", symbol))
+
+    def invalidate(self, symbol=None):
+        """
+        清除快取：新一輪主循環開始或有下單動作後呼叫。
+        指定 symbol 時只清除該交易對的持倉與帳戶餘額（多交易對時不影響其他交易對本輪的快取）。
+        """
+        self._generation += 1
+        # 進行中的查詢一併移除，之後的讀取重新查詢，不共用可能是下單前狀態的回應
+        for entries in (self._cache, self._inflight):
+            for key in list(entries):
+                if symbol is None or key == ("positions", symbol) or key[0] == "account":
+                    del entries[key]
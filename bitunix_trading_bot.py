@@ -1,8 +1,4 @@
-import ccxt
-import numpy as np
-import requests
-import hashlib
-import uuid
+import aiohttp
 import time
 import json
 import random
@@ -10,16 +6,40 @@ import discord
 import asyncio
 from discord.ext import tasks
 import os
-import pandas as pd
+import sqlite3
 from discord.ext import commands
-from config import BITUNIX_API_KEY, BITUNIX_SECRET_KEY, DISCORD_WEBHOOK_URL, STOP_MULT, LIMIT_MULT, RSI_BUY, RSI_LEN, EXIT_RSI, BREAKOUT_LOOKBACK, ATR_LEN, ATR_MULT, TIMEFRAME, LEVERAGE, TRADING_PAIR, SYMBOL, MARGIN_COIN, LOOP_INTERVAL_SECONDS, QUANTITY_PRECISION
-from config import rsiSell, exitRSI_short, CONDITIONAL_ORDER_MAX_RETRIES, CONDITIONAL_ORDER_RETRY_INTERVAL
-import threading
+from config import BITUNIX_API_KEY, BITUNIX_SECRET_KEY, DISCORD_WEBHOOK_URL, LEVERAGE, MARGIN_COIN, LOOP_INTERVAL_SECONDS, QUANTITY_PRECISION
+from config import CONDITIONAL_ORDER_MAX_RETRIES, CONDITIONAL_ORDER_RETRY_INTERVAL
 import re
 import logging
 import sys
 from config import DISCORD_BOT_TOKEN, DISCORD_CHANNEL_ID
 import traceback
+from bitunix_client import get_client, get_shared_session, close_shared_session, set_rate_limit, register_client
+from candle_store import CandleFeed
+from candle_cache import CandleCache
+from market_stream import MarketStream
+from private_stream import PrivateStream, parse_pnl
+from strategy_rules import rsi_stop_take_profit, breakout_stop, trailing_stop_update
+from rule_engine import STOP_FIXED, STOP_TRAILING, live_values
+from config import MARKET_DATA_MODE, STREAM_MIN_EVAL_INTERVAL, CANDLE_CLOSE_SETTLE_SECONDS
+from config import SYMBOLS, BITUNIX_RATE_LIMIT, BITUNIX_RATE_BURST, BITUNIX_ENDPOINT_LIMITS
+from config import CANDLE_CACHE_DIR, CANDLE_CACHE_ENABLED, EVENT_LOG_FILE
+from event_journal import EventJournal
+from discord_notifier import DiscordNotifier
+from config import DISCORD_NOTIFY_BATCH_DELAY, POSITION_MESSAGE_MIN_INTERVAL, STATE_DB_FILE
+from config import PRIVATE_STREAM_ENABLED, PRIVATE_STREAM_WAIT_SECONDS
+from config import METRICS_PORT, METRICS_TEXTFILE, METRICS_TEXTFILE_INTERVAL
+from config import PAPER_TRADING, PAPER_INITIAL_BALANCE, PAPER_FEE_RATE, PAPER_STATE_DIR
+from config import FOLLOWER_ACCOUNTS, FANOUT_MAX_CONCURRENCY
+from state_store import StateStore
+from metrics import MetricsServer, run_textfile_writer, LOOP_PHASE_SECONDS, LOOP_ITERATION_SECONDS, SIGNAL_TO_ORDER_SECONDS, ERRORS
+from metrics import CANDLE_CLOSE_LAG_SECONDS, LOOP_WAKES
+from candle_clock import CandleScheduler, CLOSE
+from symbol_context import load_symbol_contexts
+from matching_engine import PaperExchange
+from paper_trading import PaperClient
+from account_fanout import FanoutDispatcher, load_follower_accounts, is_success
 
 # 設定 logging，寫入 log.txt
 logging.basicConfig(
@@ -39,185 +59,115 @@ def log_uncaught_exception(exc_type, exc_value, exc_traceback):
 
 sys.excepthook = log_uncaught_exception
 
-# === 全域變數與統計檔案設定 ===
-STATS_FILE = os.path.join(os.path.dirname(__file__), "stats.json")
+# === 全域變數與狀態儲存設定 ===
+# 勝負統計、持倉進場方式、已通知平倉單、K線旗標統一存於 SQLite（state_store.py），首次啟動自動匯入舊 JSON 檔
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# 模擬交易的狀態資料庫、事件日誌與模擬帳戶寫入 PAPER_STATE_DIR，不與實盤檔案混用
+DATA_DIR = os.path.join(BASE_DIR, PAPER_STATE_DIR) if PAPER_TRADING else BASE_DIR
+STATS_FILE = os.path.join(BASE_DIR, "stats.json")  # 舊格式，只用於匯入
+NOTIFIED_ORDERS_FILE = os.path.join(BASE_DIR, "notified_orders.json")  # 舊格式，只用於匯入
+POSITION_ENTRY_TYPE_FILE = os.path.join(BASE_DIR, "position_entry_type.json")  # 舊格式，只用於匯入
+LONG_ACTION_FLAG = "long_action"  # candle_flags 名稱：本K棒已有 block_after_exit 策略（RSI 多單）平倉
 win_count = 0
 loss_count = 0
 
-# === 移動止損相關全域變數 ===
-current_pos_entry_type = None # 記錄持倉的進場信號類型 ('rsi' 或 'breakout')
-current_stop_loss_price = None # 記錄當前持倉的止損價格
-current_position_id_global = None # 記錄當前持倉的 positionId
-last_checked_kline_time = None  # 新增：記錄上一次檢查的K棒時間
-# === 新增：記錄開倉價 ===
-current_entry_price_long = None
-current_entry_price_short = None
-
-# === 新增：本地已通知平倉單ID記錄 ===
-NOTIFIED_ORDERS_FILE = os.path.join(os.path.dirname(__file__), "notified_orders.json")
-notified_orders_lock = threading.Lock()
-
-POSITION_ENTRY_TYPE_FILE = "position_entry_type.json"
-try:
-    with open(POSITION_ENTRY_TYPE_FILE, "r", encoding="utf-8") as f:
-        position_entry_type_map = json.load(f)
-except Exception:
-    position_entry_type_map = {}
-
-def save_position_entry_type_map():
-    with open(POSITION_ENTRY_TYPE_FILE, "w", encoding="utf-8") as f:
-        json.dump(position_entry_type_map, f)
+# === 每個交易對的持倉狀態（進場類型、止損價、positionId、開倉價、K棒時間）存於 SymbolContext（symbol_context.py） ===
+# 進場鎖：多個交易對同時觸發進場時依序計算下單數量並送出開倉單，避免以同一份可用餘額重複下單
+# （只涵蓋查餘額與下單，positionId 等待與條件單設置在鎖外進行）
+entry_lock = asyncio.Lock()
+# 所有交易對共用的 Bitunix 請求排程器（全域額度 + 各端點群組額度，平倉/止損修改優先放行）
+set_rate_limit(BITUNIX_RATE_LIMIT, BITUNIX_RATE_BURST, BITUNIX_ENDPOINT_LIMITS)
+
+state_store = None
+
+def get_state_store():
+    global state_store
+    if state_store is None:
+        state_store = StateStore(os.path.join(DATA_DIR, STATE_DB_FILE))
+        if not PAPER_TRADING:
+            state_store.migrate_json(STATS_FILE, POSITION_ENTRY_TYPE_FILE, NOTIFIED_ORDERS_FILE)
+    return state_store
 
 def load_stats():
     global win_count, loss_count
-    if os.path.exists(STATS_FILE):
-        try:
-            with open(STATS_FILE, 'r') as f:
-                stats = json.load(f)
-                win_count = stats.get('win_count', 0)
-                loss_count = stats.get('loss_count', 0)
-            print(f"載入統計數據: 勝 {win_count}, 負 {loss_count}")
-        except (IOError, json.JSONDecodeError):
-            print(f"統計數據讀取失敗，初始化為 0")
-            win_count = 0
-            loss_count = 0
-    else:
-        print("未找到統計數據檔案，初始化為 0")
-        win_count = 0
-        loss_count = 0
+    win_count, loss_count = get_state_store().get_stats()
+    print(f"載入統計數據: 勝 {win_count}, 負 {loss_count}")
 
 def save_stats():
-    global win_count, loss_count
     try:
-        with open(STATS_FILE, 'w') as f:
-            json.dump({'win_count': win_count, 'loss_count': loss_count}, f)
+        get_state_store().save_stats(win_count, loss_count)
         print(f"儲存統計數據: 勝 {win_count}, 負 {loss_count}")
-    except IOError:
-        print(f"無法儲存統計數據")
+    except sqlite3.Error as e:
+        print(f"無法儲存統計數據: {e}")
 
-def load_notified_order_ids():
-    if os.path.exists(NOTIFIED_ORDERS_FILE):
-        try:
-            with open(NOTIFIED_ORDERS_FILE, 'r') as f:
-                return json.load(f)
-        except Exception:
-            return []
-    return []
+def save_position_state(ctx, entry_type=None):
+    """
+    記錄 ctx 目前持倉的進場方式（'RSI' / 'Breakout'）、策略進場類型與止損價，重啟後可還原。
+    entry_type 為 None 時只更新止損價。
+    """
+    if not ctx.position_id:
+        return
+    try:
+        if entry_type is None:
+            get_state_store().update_stop_loss(ctx.position_id, ctx.stop_loss_price)
+        else:
+            get_state_store().save_position(ctx.position_id, ctx.symbol, entry_type, ctx.pos_entry_type, ctx.stop_loss_price)
+    except sqlite3.Error as e:
+        print(f"寫入持倉狀態失敗: {e}")
 
-def save_notified_order_ids(order_ids):
-    with notified_orders_lock:
+def close_position_state(position_id):
+    if position_id:
         try:
-            with open(NOTIFIED_ORDERS_FILE, 'w') as f:
-                json.dump(order_ids, f)
-        except Exception as e:
-            print(f"寫入已通知平倉單ID失敗: {e}")
+            get_state_store().close_position(position_id)
+        except sqlite3.Error as e:
+            print(f"寫入持倉狀態失敗: {e}")
 
+def save_long_action_flag(ctx, kline_time):
+    """記錄本K棒已有 RSI 多單（block_after_exit 策略）平倉，重啟後同一根K棒仍禁止該策略再進場。"""
+    ctx.long_action_taken_on_kline_time[kline_time] = True
+    try:
+        get_state_store().set_candle_flag(ctx.symbol, LONG_ACTION_FLAG, kline_time)
+    except sqlite3.Error as e:
+        print(f"寫入K棒旗標失敗: {e}")
 
+def is_order_notified(order_id):
+    return get_state_store().is_order_notified(order_id)
 
+def mark_order_notified(order_id, symbol=None):
+    """記錄已通知的平倉單，回傳 True 表示先前未通知過。"""
+    return get_state_store().mark_order_notified(order_id, symbol)
 
 
-# === Bitunix API 函數 === #
-def sha256_hex(s: str) -> str:
-    return hashlib.sha256(s.encode('utf-8')).hexdigest()
 
 
-# 完全按照ccc.py中的get_signed_params函數實現
 
-print(f"[Config Check] SYMBOL from config: {SYMBOL}")
-print(f"[Config Check] TRADING_PAIR from config: {TRADING_PAIR}")
+# === Bitunix API 函數 === #
+# 簽名與 HTTP 連線池統一由 bitunix_client.py 提供（get_signed_params / BitunixClient）
 
-def get_signed_params(api_key, secret_key, query_params: dict = None, body: dict = None, path: str = None, method: str = None):
-    """
-    按照 Bitunix 官方雙重 SHA256 簽名方式對請求參數進行簽名。
-    
-    參數:
-        api_key (str): 用戶 API Key
-        secret_key (str): 用戶 Secret Key
-        query_params (dict): 查詢參數 (GET 方法)
-        body (dict or None): 請求 JSON 主體 (POST 方法)
-    
-    返回:
-        headers (dict): 包含簽名所需的請求頭（api-key, sign, nonce, timestamp 等）
-    """
-    nonce = uuid.uuid4().hex
-    timestamp = str(int(time.time() * 1000))
-
-    # 構造 query string: 將參數按鍵名 ASCII 升序排序後，鍵名與鍵值依次拼接
-    if query_params:
-        params_str = {k: str(v) for k, v in query_params.items()}
-        sorted_items = sorted(params_str.items(), key=lambda x: x[0])
-        query_str = "".join([f"{k}{v}" for k, v in sorted_items])
-    else:
-        query_str = ""
+print(f"[Config Check] SYMBOLS from config: {SYMBOLS}")
 
-    # 構造 body string: 將 JSON 體壓縮成字符串 (無空格)
-    if body is not None:
-        if isinstance(body, (dict, list)):
-            body_str = json.dumps(body, separators=(',', ':'), ensure_ascii=False)
-        else:
-            body_str = str(body)
-    else:
-        body_str = ""
+# === 日誌紀錄函數 ===
+# 交易事件日誌（只追加的 JSON Lines，並以事件類型 + positionId 建索引，見 event_journal.py）
+event_journal = None
 
-    # 根據 method 決定簽名內容
-    if method == "GET":
-        digest_input = nonce + timestamp + api_key + query_str
-    else:
-        digest_input = nonce + timestamp + api_key + body_str
-    # 第一次 SHA256
-    digest = hashlib.sha256(digest_input.encode('utf-8')).hexdigest()
-    # 第二次 SHA256
-    sign = hashlib.sha256((digest + secret_key).encode('utf-8')).hexdigest()
-
-  
-
-    # 構造標頭
-    headers = {
-        "api-key": api_key,
-        "sign": sign,
-        "nonce": nonce,
-        "timestamp": timestamp,
-        "language": "en-US",
-        "Content-Type": "application/json"
-    }
-    return nonce, timestamp, sign, headers
+def get_event_journal():
+    global event_journal
+    if event_journal is None:
+        event_journal = EventJournal(os.path.join(DATA_DIR, EVENT_LOG_FILE))
+    return event_journal
 
-# === 日誌紀錄函數 ===
-def log_event(event_type, message):
-    import re
-    log_file = os.path.join(os.path.dirname(__file__), "log.txt")
-    if event_type == "RSI多單動態止損/止盈調整":
-        # 從 message 取出 positionId
-        match = re.search(r"positionId=([0-9]+)", message)
-        if match:
-            position_id = match.group(1)
-            # 讀取所有行
-            try:
-                with open(log_file, "r", encoding="utf-8") as f:
-                    lines = f.readlines()
-            except FileNotFoundError:
-                lines = []
-            # 過濾掉同 event_type 且同 positionId 的舊紀錄
-            pattern = re.compile(r"\[RSI多單動態止損/止盈調整\].*positionId=" + position_id)
-            lines = [line for line in lines if not pattern.search(line)]
-            # 加入新紀錄
-            lines.append(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] [{event_type}] {message}\n")
-            # 寫回檔案
-            with open(log_file, "w", encoding="utf-8") as f:
-                f.writelines(lines)
-        else:
-            # 若沒抓到 positionId，則直接追加
-            with open(log_file, "a", encoding="utf-8") as f:
-                f.write(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] [{event_type}] {message}\n")
-    else:
-        with open(log_file, "a", encoding="utf-8") as f:
-            f.write(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] [{event_type}] {message}\n")
+def log_event(event_type, message, symbol=None, position_id=None):
+    """
+    寫入交易事件日誌。止損/止盈調整等事件請帶 position_id，
+    之後可用 get_event_journal().latest(event_type, position_id) 直接取得該持倉最新一筆紀錄。
+    """
+    get_event_journal().append(event_type, message, symbol=symbol, position_id=position_id)
 
-def send_order(api_key, secret_key, symbol, margin_coin, side, size, leverage=LEVERAGE, position_id=None):
+async def send_order(api_key, secret_key, symbol, margin_coin, side, size, leverage=LEVERAGE, position_id=None, signal_time=None):
     # 直接下單，不再自動設置槓桿/槓桿
+    # signal_time：策略開始判斷訊號的 time.perf_counter()，下單成功時記錄訊號到下單回應的延遲
     # 正確的API端點路徑
     path = "/api/v1/futures/trade/place_order"
-    url = f"https://fapi.bitunix.com{path}"
     
     # 根據cc.py中的格式調整請求參數
     # 將side轉換為適當的side和tradeSide參數
@@ -254,79 +204,126 @@ def send_order(api_key, secret_key, symbol, margin_coin, side, size, leverage=LE
     print(f"準備發送訂單: {body}")
     log_event("下單請求", f"{body}")
     
+    client = get_client(api_key, secret_key)
     try:
-        # 使用更新後的get_signed_params獲取完整的headers
-        _, _, _, headers = get_signed_params(BITUNIX_API_KEY, BITUNIX_SECRET_KEY, {}, body)
-        
-        response = requests.post(url, headers=headers, data=json.dumps(body, separators=(',', ':'), ensure_ascii=False))
-        response.raise_for_status()  # 檢查HTTP錯誤
-        result = response.json()
+        # 經由共用連線池的 BitunixClient 發送（簽名由 get_signed_params 產生）
+        result = await client.post(path, body)
+        if signal_time is not None and result.get("code") == 0:
+            SIGNAL_TO_ORDER_SECONDS.observe(time.perf_counter() - signal_time, side=side)
         print(f"API響應: {result}")
         log_event("下單回應", f"{result}")
         return result
-    except requests.exceptions.HTTPError as e:
-        error_msg = f"HTTP錯誤: {e}, 響應: {response.text if 'response' in locals() else '無響應'}"
+    except aiohttp.ClientResponseError as e:
+        error_msg = f"HTTP錯誤: {e.status} {e.message}"
         print(error_msg)
-        log_event("下單錯誤", error_msg)
-        send_discord_message(f"🔴 **下單錯誤**: {error_msg} 🔴", api_key, secret_key)
+        log_event("下單錯誤", error_msg, symbol=symbol)
+        await send_discord_message(f"🔴 **下單錯誤**: {error_msg} 🔴", api_key, secret_key, symbol=symbol)
         return {"error": error_msg}
-    except requests.exceptions.RequestException as e:
-        error_msg = f"請求錯誤: {e}"
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        error_msg = f"請求錯誤: {e!r}"
         print(error_msg)
-        log_event("下單錯誤", error_msg)
-        send_discord_message(f"🔴 **下單錯誤**: {error_msg} 🔴", api_key, secret_key)
+        log_event("下單錯誤", error_msg, symbol=symbol)
+        await send_discord_message(f"🔴 **下單錯誤**: {error_msg} 🔴", api_key, secret_key, symbol=symbol)
         return {"error": error_msg}
     except Exception as e:
         error_msg = f"未知錯誤: {e}"
         print(error_msg)
-        log_event("下單錯誤", error_msg)
-        send_discord_message(f"🔴 **下單錯誤**: {error_msg} 🔴", api_key, secret_key)
+        log_event("下單錯誤", error_msg, symbol=symbol)
+        await send_discord_message(f"🔴 **下單錯誤**: {error_msg} 🔴", api_key, secret_key, symbol=symbol)
         return {"error": error_msg}
+    finally:
+        # 下單後持倉與餘額可能已變動（即使請求逾時也可能已成交），清除本輪快照
+        client.snapshot.invalidate()
+
+# === 保證金不足時縮減數量重試 ===
+AUTO_REDUCE_STEPS = 3  # 最多縮減重試次數
+AUTO_REDUCE_RATIO = 0.95  # 每次重試的數量比例
+INSUFFICIENT_BALANCE_CODES = ("20003",)  # Bitunix 錯誤碼：Insufficient balance
+INSUFFICIENT_BALANCE_MESSAGES = ("insufficient balance", "insufficient margin")
+
+def is_insufficient_balance(result):
+    """
+    下單回應是否為保證金 / 可用餘額不足：以交易所錯誤碼判斷，訊息只接受完全相同的餘額不足文字，
+    避免「balance query failed」之類的其他錯誤也被縮減數量重試。
+    """
+    if not result or result.get("code") in (0, None):
+        return False
+    if str(result.get("code")) in INSUFFICIENT_BALANCE_CODES:
+        return True
+    return str(result.get("msg", "")).strip().rstrip(".").lower() in INSUFFICIENT_BALANCE_MESSAGES
+
+async def try_place_order_with_auto_reduce(api_key, secret_key, symbol, margin_coin, side, size, leverage=LEVERAGE, quantity_precision=QUANTITY_PRECISION, signal_time=None):
+    """
+    開倉下單；交易所以保證金不足拒絕時（手續費或價格變動讓計算出的數量略超過可用餘額），
+    將數量乘以 AUTO_REDUCE_RATIO 後重試，最多 AUTO_REDUCE_STEPS 次。回傳最後一次的下單回應。
+    """
+    result = await send_order(api_key, secret_key, symbol, margin_coin, side, size, leverage, signal_time=signal_time)
+    for _ in range(AUTO_REDUCE_STEPS):
+        if not is_insufficient_balance(result):
+            break
+        size = round(size * AUTO_REDUCE_RATIO, quantity_precision)
+        if size <= 0:
+            break
+        log_event("下單數量縮減", f"{side} 保證金不足，改以數量 {size} 重試", symbol=symbol)
+        result = await send_order(api_key, secret_key, symbol, margin_coin, side, size, leverage, signal_time=signal_time)
+    return result
+# === 模擬交易：PAPER_TRADING = True 時以 PaperClient 取代該組金鑰的 BitunixClient，下單與查詢函數不需修改 ===
+paper_exchange = None
+
+def get_paper_exchange():
+    global paper_exchange
+    if paper_exchange is None:
+        paper_exchange = PaperExchange(PAPER_INITIAL_BALANCE, PAPER_FEE_RATE, path=os.path.join(DATA_DIR, "paper_account.json"))
+        register_client(PaperClient(paper_exchange, BITUNIX_API_KEY, BITUNIX_SECRET_KEY))
+    return paper_exchange
+
+# === 私有頻道推送：每組 API 金鑰一條連線，下單後優先等待推送，斷線或逾時才輪詢 ===
+private_streams = {}
+
+def get_private_stream(api_key, secret_key):
+    stream = private_streams.get(api_key)
+    if stream is None:
+        stream = private_streams[api_key] = PrivateStream(api_key, secret_key, session=get_shared_session())
+    return stream
+
+def live_private_stream(api_key):
+    """已登入並訂閱的私有頻道連線，未啟用或斷線中回傳 None。"""
+    stream = private_streams.get(api_key)
+    return stream if stream is not None and stream.live else None
+
 # === 新增：根據 orderId 查詢 positionId 的輔助函數 ===
-def get_position_id_by_order_id(api_key, secret_key, symbol, order_id, max_retries=3, retry_interval=2):
+async def get_position_id_by_order_id(api_key, secret_key, symbol, order_id, max_retries=3, retry_interval=2):
     """
-    根據 orderId 查詢 positionId，輪詢持倉列表，找到最新持倉。
+    根據 orderId 查詢 positionId：私有頻道連線中時等待訂單/持倉推送，
+    未連線或逾時則輪詢持倉列表，找到最新持倉。
     """
+    stream = live_private_stream(api_key)
+    if stream is not None and order_id:
+        position_id = await stream.wait_position_id(order_id, PRIVATE_STREAM_WAIT_SECONDS)
+        if position_id:
+            return position_id
+        print(f"{symbol} 未在 {PRIVATE_STREAM_WAIT_SECONDS} 秒內收到 orderId={order_id} 的持倉推送，改為輪詢")
     for attempt in range(max_retries):
         try:
-            url = "https://fapi.bitunix.com/api/v1/futures/position/get_pending_positions"
-            params = {"symbol": symbol}
-            nonce = uuid.uuid4().hex
-            timestamp = str(int(time.time() * 1000))
-            sorted_items = sorted((k, str(v)) for k, v in params.items())
-            query_string = "".join(f"{k}{v}" for k, v in sorted_items)
-            digest_input = nonce + timestamp + api_key + query_string
-            digest = hashlib.sha256(digest_input.encode('utf-8')).hexdigest()
-            sign = hashlib.sha256((digest + secret_key).encode('utf-8')).hexdigest()
-            headers = {
-                "api-key": api_key,
-                "sign": sign,
-                "nonce": nonce,
-                "timestamp": timestamp,
-                "Content-Type": "application/json"
-            }
-            res = requests.get(url, headers=headers, params=params)
-            data = res.json()
-            if data.get("code") == 0 and data.get("data"):
-                for pos in data["data"]:
-                    # 只找有數量的持倉
-                    if float(pos.get("qty", 0)) > 0:
-                        # 這裡假設最新的持倉就是剛剛下單的（Bitunix API 沒有直接 orderId 對應 positionId）
-                        # 可根據 avgOpenPrice、side、qty 等進一步比對
-                        return pos.get("positionId")
-            time.sleep(retry_interval)
+            positions = await get_pending_positions(api_key, secret_key, symbol, refresh=True)
+            for pos in positions:
+                # 只找有數量的持倉
+                if float(pos.get("qty", 0)) > 0:
+                    # 這裡假設最新的持倉就是剛剛下單的（Bitunix API 沒有直接 orderId 對應 positionId）
+                    # 可根據 avgOpenPrice、side、qty 等進一步比對
+                    return pos.get("positionId")
+            await asyncio.sleep(retry_interval)
         except Exception as e:
             print(f"查詢 positionId 失敗: {e}")
-            time.sleep(retry_interval)
+            await asyncio.sleep(retry_interval)
     return None
 
-def place_conditional_orders(api_key, secret_key, symbol, margin_coin, position_id, stop_price=None, limit_price=None, max_retries=CONDITIONAL_ORDER_MAX_RETRIES, retry_interval=CONDITIONAL_ORDER_RETRY_INTERVAL):
+async def place_conditional_orders(api_key, secret_key, symbol, margin_coin, position_id, stop_price=None, limit_price=None, max_retries=CONDITIONAL_ORDER_MAX_RETRIES, retry_interval=CONDITIONAL_ORDER_RETRY_INTERVAL):
     """
     Place Stop Loss and Take Profit orders for a given position using Bitunix API.
     自動重試設置條件單，最多 max_retries 次。
     """
     path = "/api/v1/futures/tpsl/position/place_order"
-    url = f"https://fapi.bitunix.com{path}"
 
     body = {
         "symbol": symbol,
@@ -349,10 +346,7 @@ def place_conditional_orders(api_key, secret_key, symbol, margin_coin, position_
     for attempt in range(1, max_retries + 1):
         print(f"[Conditional Orders] 嘗試第 {attempt} 次設置條件單: {body}")
         try:
-            _, _, _, headers = get_signed_params(api_key, secret_key, {}, body, path, method="POST")
-            response = requests.post(url, headers=headers, data=json.dumps(body, separators=(',', ':'), ensure_ascii=False))
-            response.raise_for_status()
-            result = response.json()
+            result = await get_client(api_key, secret_key).post(path, body)
             print(f"[Conditional Orders] API 響應: {result}")
             if result.get("code") == 0:
                 print(f"[Conditional Orders] 成功為持倉 {position_id} 設置條件訂單（第 {attempt} 次）")
@@ -361,35 +355,35 @@ def place_conditional_orders(api_key, secret_key, symbol, margin_coin, position_
                 error_msg = f"[Conditional Orders] API 返回錯誤: {result.get('msg', '未知錯誤')} (第 {attempt} 次)"
                 print(error_msg)
                 if attempt == max_retries:
-                    send_discord_message(f"🔴 **條件訂單設置失敗（重試{max_retries}次）** 🔴", api_key, secret_key, operation_details={
+                    await send_discord_message(f"🔴 **條件訂單設置失敗（重試{max_retries}次）** 🔴", api_key, secret_key, symbol=symbol, operation_details={
                         "type": "error",
                         "details": error_msg,
                         "force_send": True
                     })
                 else:
-                    time.sleep(retry_interval)
+                    await asyncio.sleep(retry_interval)
         except Exception as e:
             error_msg = f"[Conditional Orders] 未知錯誤: {e} (第 {attempt} 次)"
             print(error_msg)
             if attempt == max_retries:
-                send_discord_message(f"🔴 **條件訂單設置失敗（重試{max_retries}次）** 🔴", api_key, secret_key, operation_details={
+                await send_discord_message(f"🔴 **條件訂單設置失敗（重試{max_retries}次）** 🔴", api_key, secret_key, symbol=symbol, operation_details={
                     "type": "error",
                     "details": error_msg,
                     "force_send": True
                 })
             else:
-                time.sleep(retry_interval)
+                await asyncio.sleep(retry_interval)
     return {"error": f"設置條件單失敗，已重試{max_retries}次"}
 
 # Note: As of current information, automatic trailing stop placement for breakout entries is not implemented due to lack of specific API details.
 
-def modify_position_tpsl(api_key, secret_key, symbol, position_id, stop_price=None, limit_price=None):
+async def modify_position_tpsl(api_key, secret_key, symbol, position_id, stop_price=None, limit_price=None, notify=True):
     """
     Modify Stop Loss and/or Take Profit orders for a given position using Bitunix API.
     Endpoint: /api/v1/futures/tpsl/modify_position_tp_sl_order
+    notify=False 時失敗不發送 Discord 通知（呼叫端另有備援流程）。
     """
     path = "/api/v1/futures/tpsl/modify_position_tp_sl_order"
-    url = f"https://fapi.bitunix.com{path}"
 
     body = {
         "symbol": symbol,
@@ -412,12 +406,7 @@ def modify_position_tpsl(api_key, secret_key, symbol, position_id, stop_price=No
     print(f"[Modify Conditional Orders] 準備為持倉 {position_id} 在 {symbol} 上修改條件訂單: {body}")
 
     try:
-        # 使用 get_signed_params 獲取完整的 headers
-        _, _, _, headers = get_signed_params(api_key, secret_key, {}, body, path, method="POST")
-
-        response = requests.post(url, headers=headers, data=json.dumps(body, separators=(',', ':'), ensure_ascii=False))
-        response.raise_for_status()  # 檢查HTTP錯誤
-        result = response.json()
+        result = await get_client(api_key, secret_key).post(path, body)
         print(f"[Modify Conditional Orders] API 響應: {result}")
 
         if result.get("code") == 0:
@@ -426,81 +415,105 @@ def modify_position_tpsl(api_key, secret_key, symbol, position_id, stop_price=No
         else:
             error_msg = f"[Modify Conditional Orders] API 返回錯誤: {result.get('msg', '未知錯誤')}"
             print(error_msg)
-            send_discord_message(f"🔴 **修改條件訂單失敗** 🔴", api_key, secret_key, operation_details={
+            if notify:
+                await send_discord_message(f"🔴 **修改條件訂單失敗** 🔴", api_key, secret_key, symbol=symbol, operation_details={
+                    "type": "error",
+                    "details": error_msg,
+                    "force_send": True
+                })
+            return {"error": error_msg}
+
+    except aiohttp.ClientResponseError as e:
+        error_msg = f"[Modify Conditional Orders] HTTP 錯誤: {e.status} {e.message}"
+        print(error_msg)
+        if notify:
+            await send_discord_message(f"🔴 **修改條件訂單失敗** 🔴", api_key, secret_key, symbol=symbol, operation_details={
                 "type": "error",
                 "details": error_msg,
                 "force_send": True
             })
-            return {"error": error_msg}
-
-    except requests.exceptions.HTTPError as e:
-        error_msg = f"[Modify Conditional Orders] HTTP 錯誤: {e}, 響應: {response.text if 'response' in locals() else '無響應'}"
-        print(error_msg)
-        send_discord_message(f"🔴 **修改條件訂單失敗** 🔴", api_key, secret_key, operation_details={
-            "type": "error",
-            "details": error_msg,
-            "force_send": True
-        })
         return {"error": error_msg}
-    except requests.exceptions.RequestException as e:
-        error_msg = f"[Modify Conditional Orders] 請求錯誤: {e}"
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        error_msg = f"[Modify Conditional Orders] 請求錯誤: {e!r}"
         print(error_msg)
-        send_discord_message(f"🔴 **修改條件訂單失敗** 🔴", api_key, secret_key, operation_details={
-            "type": "error",
-            "details": error_msg,
-            "force_send": True
-        })
+        if notify:
+            await send_discord_message(f"🔴 **修改條件訂單失敗** 🔴", api_key, secret_key, symbol=symbol, operation_details={
+                "type": "error",
+                "details": error_msg,
+                "force_send": True
+            })
         return {"error": error_msg}
     except Exception as e:
         error_msg = f"[Modify Conditional Orders] 未知錯誤: {e}"
         print(error_msg)
-        send_discord_message(f"🔴 **修改條件訂單失敗** 🔴", api_key, secret_key, operation_details={
-            "type": "error",
-            "details": error_msg,
-            "force_send": True
-        })
+        if notify:
+            await send_discord_message(f"🔴 **修改條件訂單失敗** 🔴", api_key, secret_key, symbol=symbol, operation_details={
+                "type": "error",
+                "details": error_msg,
+                "force_send": True
+            })
         return {"error": error_msg}
 
 
 # === Discord 提醒設定 === #
 # DISCORD_WEBHOOK_URL = 'https://discordapp.com/api/webhooks/1366780723864010813/h_CPbJX3THcOElVVHYOeJPR4gTgZGHJ1ehSeXuOAceGTNz3abY0XlljPzzxkaimAcE77'
 
-# 消息緩衝區和計時器設置
-message_buffer = []
-last_send_time = 0
-BUFFER_TIME_LIMIT = 180  # 3分鐘 = 180秒
+# Webhook 通知佇列：交易流程只負責放入 Embed，由背景 task 批次送出（見 discord_notifier.py）
+discord_notifier = None
 
-# 記錄上一次的餘額，用於比較變化
-last_balance = None
+def get_discord_notifier():
+    global discord_notifier
+    if discord_notifier is None:
+        discord_notifier = DiscordNotifier(DISCORD_WEBHOOK_URL, batch_delay=DISCORD_NOTIFY_BATCH_DELAY)
+    return discord_notifier
 
-# 修改函數簽名以包含 operation_details
-def send_discord_message(core_message, api_key=None, secret_key=None, operation_details=None):
-    global message_buffer, last_send_time, win_count, loss_count # 確保能訪問全域勝敗計數
-    current_time = time.time()
+# 記錄上一次查詢到的可用餘額（持倉訊息顯示用，不另外查詢）
+last_balance = None
 
+def cached_position_summary(api_key, secret_key, symbol):
+    """
+    由本輪交易所快照中已查詢過的持倉組出 (持倉狀態, 未實現盈虧) 文字，不發出任何請求；
+    快照中沒有資料時回傳 (None, "")。
+    """
+    data = get_client(api_key, secret_key).snapshot.peek_positions(symbol)
+    if data is None:
+        return None, ""
+    long_pos = short_pos = None
+    for pos_detail in data.get("data") or []:
+        if float(pos_detail.get("qty", "0")) > 0:
+            if pos_detail.get("side") == "BUY":
+                long_pos = pos_detail
+            elif pos_detail.get("side") == "SELL":
+                short_pos = pos_detail
+    # 優先顯示多單，若無多單則顯示空單，否則顯示無持倉
+    if long_pos is not None:
+        return f"📈 多單 (數量: {long_pos['qty']})", f"{float(long_pos.get('unrealizedPNL', 0.0)):.4f} USDT"
+    if short_pos is not None:
+        return f"📉 空單 (數量: {short_pos['qty']})", f"{float(short_pos.get('unrealizedPNL', 0.0)):.4f} USDT"
+    return "🔄 無持倉", ""
+
+async def send_discord_message(core_message, api_key=None, secret_key=None, operation_details=None, symbol=None):
+    """
+    組出交易通知 Embed 並放入 Webhook 通知佇列後立即返回，不等待 Discord 回應。
+    持倉欄位使用已知狀態（開平倉通知本身的內容、本輪交易所快照），不為了通知另外查詢交易所。
+    同一交易對尚未送出的狀態更新會被較新的一筆取代。
+    """
     # 預設顏色與 emoji
     embed_color = 0x3498db  # 藍色
     title_emoji = "ℹ️"
-    if operation_details:
-        op_type = operation_details.get("type")
-        if op_type == "close_success":
-            embed_color = 0xf39c12  # 橘色
-            title_emoji = "🟠"
-        elif op_type == "open_success":
-            embed_color = 0x2ecc71  # 綠色
-            title_emoji = "🟢"
-        elif op_type == "error":
-            embed_color = 0xe74c3c  # 紅色
-            title_emoji = "🔴"
-        elif op_type == "status_update":
-            embed_color = 0xf1c40f  # 黃色
-            title_emoji = "⚠️"
-        else:
-            embed_color = 0x3498db
-            title_emoji = "ℹ️"
-    else:
-        embed_color = 0x3498db
-        title_emoji = "ℹ️"
+    op_type = operation_details.get("type") if operation_details else None
+    if op_type == "close_success":
+        embed_color = 0xf39c12  # 橘色
+        title_emoji = "🟠"
+    elif op_type == "open_success":
+        embed_color = 0x2ecc71  # 綠色
+        title_emoji = "🟢"
+    elif op_type == "error":
+        embed_color = 0xe74c3c  # 紅色
+        title_emoji = "🔴"
+    elif op_type == "status_update":
+        embed_color = 0xf1c40f  # 黃色
+        title_emoji = "⚠️"
 
     # 構造勝率字符串
     total_trades = win_count + loss_count
@@ -508,139 +521,96 @@ def send_discord_message(core_message, api_key=None, secret_key=None, operation_
 
     # 主要內容區塊
     action_specific_msg = core_message
-    current_pos_status_for_discord = ""
+    current_pos_status_for_discord = None
     current_pos_pnl_msg = ""
-    if api_key and secret_key:
-        pos_info = get_current_position_details(api_key, secret_key, SYMBOL, MARGIN_COIN)
-        long_pos = pos_info["long"]
-        short_pos = pos_info["short"]
-        # 優先顯示多單，若無多單則顯示空單，否則顯示無持倉
-        if long_pos is not None:
-            current_pos_status_for_discord = f"📈 多單 (數量: {long_pos['qty']})"
-            if long_pos.get("unrealized_pnl") is not None:
-                current_pos_pnl_msg = f"{long_pos['unrealized_pnl']:.4f} USDT"
-        elif short_pos is not None:
-            current_pos_status_for_discord = f"📉 空單 (數量: {short_pos['qty']})"
-            if short_pos.get("unrealized_pnl") is not None:
-                current_pos_pnl_msg = f"{short_pos['unrealized_pnl']:.4f} USDT"
-        else:
-            current_pos_status_for_discord = "🔄 無持倉"
-            current_pos_pnl_msg = ""
-    if operation_details:
-        op_type = operation_details.get("type")
-        if op_type == "close_success":
-            side_closed_display = "多單" if operation_details.get("side_closed") == "long" else "空單"
-            closed_qty = operation_details.get("qty", "N/A")
-            pnl = operation_details.get("pnl", 0.0)
-            margin = operation_details.get("margin", None)
-            pnl_display = f"{pnl:.4f}" if pnl is not None else "N/A"
-            margin_display = f"{margin:.4f}" if margin is not None else "N/A"
-            action_specific_msg = f"**{title_emoji} 平倉成功**\n\n**平倉類型：**{side_closed_display}\n**數量：**{closed_qty}\n**本金：**`{margin_display} USDT`\n**本次已實現盈虧（已扣本金與手續費）：**`{pnl_display} USDT`"
-            signal_info = operation_details.get("signal")
-            if signal_info:
-                action_specific_msg += f"\n**平倉信號：**{signal_info}"
-            current_pos_status_for_discord = "🔄 無持倉"
-            current_pos_pnl_msg = ""
-        elif op_type == "open_success":
-            side_opened_display = "多單" if operation_details.get("side_opened") == "long" else "空單"
-            opened_qty = operation_details.get("qty", "N/A")
-            entry_price_display = f"{operation_details.get('entry_price', 'N/A'):.2f}"
-            action_specific_msg = f"**{title_emoji} 開倉成功**\n\n**開倉類型：**{side_opened_display}\n**數量：**{opened_qty}\n**進場價格：**`{entry_price_display} USDT`"
-            signal_info = operation_details.get("signal")
-            if signal_info:
-                action_specific_msg += f"\n**開倉信號：**{signal_info}"
-        elif op_type == "error":
-            action_specific_msg = f"**{title_emoji} 錯誤**\n\n{core_message}\n{operation_details.get('details', '')}"
-            signal_info = operation_details.get("signal")
-            if signal_info:
-                action_specific_msg += f"\n**相關信號：**{signal_info}"
-        elif op_type == "status_update":
-            action_specific_msg = f"**{title_emoji} 狀態更新**\n\n{core_message}"
-    # 決定最終的持倉狀態顯示
-    if not (operation_details and operation_details.get("type") == "close_success"):
-        if api_key and secret_key:
-            pos_info = get_current_position_details(api_key, secret_key, SYMBOL, MARGIN_COIN)
-            long_pos = pos_info["long"]
-            short_pos = pos_info["short"]
-            if long_pos is not None:
-                current_pos_status_for_discord = f"📈 多單 (數量: {long_pos['qty']})"
-            elif short_pos is not None:
-                current_pos_status_for_discord = f"📉 空單 (數量: {short_pos['qty']})"
-            else:
-                current_pos_status_for_discord = "🔄 無持倉"
+    if api_key and secret_key and symbol:
+        current_pos_status_for_discord, current_pos_pnl_msg = cached_position_summary(api_key, secret_key, symbol)
+    if op_type == "close_success":
+        side_closed_display = "多單" if operation_details.get("side_closed") == "long" else "空單"
+        closed_qty = operation_details.get("qty", "N/A")
+        pnl = operation_details.get("pnl", 0.0)
+        margin = operation_details.get("margin", None)
+        pnl_display = f"{pnl:.4f}" if pnl is not None else "N/A"
+        margin_display = f"{margin:.4f}" if margin is not None else "N/A"
+        action_specific_msg = f"**{title_emoji} 平倉成功**\n\n**平倉類型：**{side_closed_display}\n**數量：**{closed_qty}\n**本金：**`{margin_display} USDT`\n**本次已實現盈虧（已扣本金與手續費）：**`{pnl_display} USDT`"
+        signal_info = operation_details.get("signal")
+        if signal_info:
+            action_specific_msg += f"\n**平倉信號：**{signal_info}"
+        current_pos_status_for_discord = "🔄 無持倉"
+        current_pos_pnl_msg = ""
+    elif op_type == "open_success":
+        side_opened = operation_details.get("side_opened")
+        side_opened_display = "多單" if side_opened == "long" else "空單"
+        opened_qty = operation_details.get("qty", "N/A")
+        entry_price_display = f"{operation_details.get('entry_price', 'N/A'):.2f}"
+        action_specific_msg = f"**{title_emoji} 開倉成功**\n\n**開倉類型：**{side_opened_display}\n**數量：**{opened_qty}\n**進場價格：**`{entry_price_display} USDT`"
+        signal_info = operation_details.get("signal")
+        if signal_info:
+            action_specific_msg += f"\n**開倉信號：**{signal_info}"
+        # 剛開倉時快照已失效，直接以本次開倉內容顯示持倉
+        current_pos_status_for_discord = f"📈 多單 (數量: {opened_qty})" if side_opened == "long" else f"📉 空單 (數量: {opened_qty})"
+        current_pos_pnl_msg = ""
+    elif op_type == "error":
+        action_specific_msg = f"**{title_emoji} 錯誤**\n\n{core_message}\n{operation_details.get('details', '')}"
+        signal_info = operation_details.get("signal")
+        if signal_info:
+            action_specific_msg += f"\n**相關信號：**{signal_info}"
+    elif op_type == "status_update":
+        action_specific_msg = f"**{title_emoji} 狀態更新**\n\n{core_message}"
     # 構造 Discord Embed
     embed = discord.Embed(
-        title=f"{title_emoji} {SYMBOL} 交易通知",
+        title=("（模擬）" if PAPER_TRADING else "") + (f"{title_emoji} {symbol} 交易通知" if symbol else f"{title_emoji} 交易通知"),
         description=action_specific_msg,
         color=embed_color
     )
     embed.add_field(name="🏆 勝率統計", value=win_rate_str, inline=True)
-    embed.add_field(name="📊 目前持倉", value=current_pos_status_for_discord, inline=True)
+    if current_pos_status_for_discord:
+        embed.add_field(name="📊 目前持倉", value=current_pos_status_for_discord, inline=True)
     if current_pos_pnl_msg:
         embed.add_field(name="💰 未實現盈虧", value=f"`{current_pos_pnl_msg}`", inline=True)
     embed.add_field(name="🕒 時間", value=time.strftime('%Y-%m-%d %H:%M:%S'), inline=False)
-    # 發送訊息
-    data_payload = {"embeds": [embed.to_dict()]}
-    try:
-        response = requests.post(DISCORD_WEBHOOK_URL, json=data_payload)
-        response.raise_for_status()
-    except Exception as e:
-        print(f"Discord 發送失敗: {e}")
-
-# 強制發送緩衝區中的所有消息，不管時間限制
-def flush_discord_messages():
-    # 由於 send_discord_message 已改為直接發送 Embed，此函數暫時不需要實現複雜的緩衝區處理
-    # 如果未來需要緩衝多個 Embeds，需要重新設計此函數
-    print("flush_discord_messages 函數被呼叫，但目前不執行任何操作 (Embeds 直接發送)")
-    pass
+    # 放入通知佇列（狀態更新以交易對合併，其餘每則都會送出）
+    coalesce_key = ("status_update", symbol) if op_type == "status_update" else None
+    get_discord_notifier().notify(embed, coalesce_key=coalesce_key)
 
 
 
 
 
 # === 策略邏輯 === #
-def fetch_ohlcv(api_key=None, secret_key=None): # 移除了未使用的 symbol 參數
-    """獲取指定交易對的K線數據，並添加錯誤處理"""
+# 全程式（所有交易對）共用的 K 線緩衝區（共用同一個 Binance 連線，首次播種 100 根，之後只補最新 K 線）
+candle_feed = None
+
+def get_candle_feed():
+    global candle_feed
+    if candle_feed is None:
+        # 啟用本地K線快取時由快取播種，重啟只需補抓停機期間的K線
+        candle_feed = CandleFeed(cache=CandleCache(CANDLE_CACHE_DIR) if CANDLE_CACHE_ENABLED else None)
+    return candle_feed
+
+async def fetch_ohlcv(ctx):
+    """獲取指定交易對（SymbolContext）的K線數據，並添加錯誤處理"""
     try:
-        # 使用ccxt庫連接到Binance交易所
-        exchange = ccxt.binance()
-        # 獲取指定交易對的4小時K線數據，限制為最近100根
-        # 這將確保我們總是獲取最新的市場數據
-        ohlcv = exchange.fetch_ohlcv(TRADING_PAIR, timeframe=TIMEFRAME, limit=100) # 使用 TRADING_PAIR
-        return np.array(ohlcv)
+        feed = get_candle_feed()
+        # WebSocket 連線正常時緩衝區已由推送即時更新，不需再走 REST
+        if ctx.market_stream is not None and ctx.market_stream.live:
+            return feed.store(ctx.trading_pair, ctx.timeframe).to_array()
+        # 從 K 線緩衝區取得最近100根（只向 Binance 補抓最後一根之後的數據）
+        return await feed.fetch(ctx.trading_pair, ctx.timeframe)
     except Exception as e:
-        error_msg = f"獲取 {TRADING_PAIR} K線數據失敗: {e}"
+        error_msg = f"獲取 {ctx.trading_pair} K線數據失敗: {e}"
         print(f"錯誤：{error_msg}")
         return None
 
 
 
 
-def compute_indicators(df, rsi_len, atr_len, breakout_len, api_key=None, secret_key=None, symbol=None):
-    """計算技術指標，並添加錯誤處理"""
-    try:
-        # 確保 talib 庫已安裝並導入
-        try:
-            import talib
-        except ImportError:
-            error_msg = "錯誤：TA-Lib 未正確安裝。請按照以下步驟操作：\n1. 確保虛擬環境已激活\n2. 檢查是否已安裝 TA-Lib C 函式庫\n3. 執行 'pip install TA_Lib‑*.whl' 安裝 Python 套件\n詳細安裝指引請參考 README.md"
-            print(error_msg)
-            return None # 返回 None 表示計算失敗
-
-        df["rsi"] = talib.RSI(df["close"], timeperiod=rsi_len)
-        df["atr"] = talib.ATR(df["high"], df["low"], df["close"], timeperiod=atr_len)
-        # 使用 shift(1) 確保不包含當前 K 線的最高價
-        df["highest_break"] = df["high"].shift(1).rolling(window=breakout_len).max()
-        # 新增：空單指標
-        df["lowest_break"] = df["low"].shift(1).rolling(window=breakout_len).min()
-        return df
-    except Exception as e:
-        error_msg = f"計算指標失敗: {e}"
-        print(f"錯誤：{error_msg}")
-        return None # 返回 None 表示計算失敗
+# 增量指標引擎、策略參數與規則集（rule_engine，與 backtest.py 共用）存於各交易對的 SymbolContext：
+# ctx.indicators.sync(ohlcv) 每輪只更新最後一根K線，ctx.params 為策略參數，ctx.rules 為進出場規則
+# 實盤路徑直接讀取 K 線緩衝區的 NumPy 陣列（不建立 DataFrame），K棒時間以開盤時間毫秒（int）表示
 
-def calculate_trade_size(api_key, secret_key, symbol, wallet_percentage, leverage, current_price):
-    available_balance = check_wallet_balance(api_key, secret_key)
+async def calculate_trade_size(api_key, secret_key, symbol, wallet_percentage, leverage, current_price, quantity_precision=QUANTITY_PRECISION):
+    available_balance = await check_wallet_balance(api_key, secret_key)
     if available_balance is None or available_balance <= 0:
         print("錯誤：無法獲取錢包餘額或餘額不足")
         return 0
@@ -650,37 +620,189 @@ def calculate_trade_size(api_key, secret_key, symbol, wallet_percentage, leverag
     contract_value = trade_capital * leverage
     if current_price > 0:
         quantity = contract_value / current_price
-        quantity = round(quantity, QUANTITY_PRECISION)
+        quantity = round(quantity, quantity_precision)
         print(f"計算下單數量: 可用餘額={available_balance:.4f}, 使用比例={wallet_percentage}, 槓桿={leverage}, 合約價值={contract_value:.4f}, 當前價格={current_price:.2f}, 計算數量={quantity:.3f}")
         return quantity
     else:
         print("錯誤：當前價格無效")
         return 0
 
+# === 策略下單動作（依 rule_engine.Strategy 的方向與止損方式，所有策略共用） === #
+async def submit_entry_order(ctx, strategy, api_key, secret_key, trade_size, signal_time=None):
+    """主帳戶依 strategy 送出開倉單：多單以 send_order、空單以 try_place_order_with_auto_reduce 下單，回傳下單回應。"""
+    if strategy.side == "long":
+        return await send_order(api_key, secret_key, ctx.symbol, ctx.margin_coin, "open_long", trade_size, ctx.leverage, signal_time=signal_time)
+    return await try_place_order_with_auto_reduce(api_key, secret_key, ctx.symbol, ctx.margin_coin, "open_short", trade_size, ctx.leverage, ctx.quantity_precision, signal_time=signal_time)
+
+async def open_strategy_position(ctx, strategy, api_key, secret_key, order_result, trade_size, price, atr):
+    """
+    處理 submit_entry_order 的開倉結果：取得 positionId 並記錄持倉狀態。
+    固定止損止盈（STOP_FIXED）以實際開倉價設置條件單；移動止損（STOP_TRAILING）只記錄初始止損，之後每輪由 update_trailing_stop 調整。
+    回傳是否開倉成功並取得 positionId，呼叫端據此決定是否分發給跟單帳戶。
+    """
+    symbol = ctx.symbol
+    side = strategy.side
+    side_display = "多單" if side == "long" else "空單"
+    if not (order_result and order_result.get('code') == 0):
+        log_event("開倉失敗", f"{side_display} {strategy.label}, 數量={trade_size}, 價格={price}, 錯誤={order_result}", symbol=symbol)
+        await send_discord_message(f"🔴 **{strategy.title}開倉失敗** 🔴", api_key, secret_key, symbol=symbol, operation_details={"type": "error", "details": order_result.get("msg", order_result.get("error", "未知錯誤")), "signal": strategy.signal, "force_send": True})
+        return False
+    # 嘗試取得 positionId，若沒有則用 orderId 查詢
+    data = order_result.get("data") or {}
+    order_id = data.get("orderId")
+    new_position_id = data.get("positionId") or await get_position_id_by_order_id(api_key, secret_key, symbol, order_id)
+    if not new_position_id:
+        log_event("條件單設置失敗", f"無法取得 positionId，條件單未設置。orderId={order_id}", symbol=symbol)
+        await send_discord_message(f"🔴 **{strategy.title}開倉成功但無法取得 positionId，條件單設置失敗** 🔴", api_key, secret_key, symbol=symbol, operation_details={"type": "error", "details": f"orderId={order_id}", "signal": strategy.signal, "force_send": True})
+        return False
+    ctx.position_id = new_position_id
+    ctx.pos_entry_type = strategy.name
+    save_position_state(ctx, strategy.label)
+    if strategy.stop == STOP_FIXED:
+        # 開倉後查詢並記錄開倉價，止損止盈以實際開倉價計算
+        position = (await get_current_position_details(api_key, secret_key, symbol, ctx.margin_coin))[side]
+        entry_price = position.get("avgOpenPrice") if position is not None else None
+        if side == "long":
+            ctx.entry_price_long = entry_price
+        else:
+            ctx.entry_price_short = entry_price
+        if entry_price is not None:
+            stop_loss, take_profit = rsi_stop_take_profit(ctx.params, side, entry_price, atr)
+        else:
+            log_event("止損止盈錯誤", f"無法取得{side_display}開倉價，跳過止損止盈計算", symbol=symbol)
+            stop_loss = None
+            take_profit = None
+        record_tpsl_orders(ctx, await place_conditional_orders(api_key, secret_key, symbol, ctx.margin_coin, new_position_id, stop_price=stop_loss, limit_price=take_profit))
+        ctx.stop_loss_price = stop_loss
+        stop_details = f"止損={stop_loss}, 止盈={take_profit}"
+    else:
+        ctx.stop_loss_price = breakout_stop(ctx.params, side, price, atr)
+        stop_details = f"初始移動止損={ctx.stop_loss_price}"
+    save_position_state(ctx)
+    log_event("開倉成功", f"{side_display} {strategy.label}, 數量={trade_size}, 價格={price}, {stop_details}", symbol=symbol)
+    await send_discord_message(f"🟢 **{strategy.title}開倉成功** 🟢", api_key, secret_key, symbol=symbol, operation_details={"type": "open_success", "side_opened": side, "qty": trade_size, "entry_price": price, "signal": strategy.signal, "force_send": True})
+    return True
+
+async def close_strategy_position(ctx, strategy, api_key, secret_key, qty, position_id, price, kline_time, signal_time=None):
+    """依平倉規則市價平倉，查詢實際盈虧並更新勝負統計；block_after_exit 策略另標記本K棒已平倉。回傳是否平倉成功。"""
+    global win_count, loss_count
+    symbol = ctx.symbol
+    side = strategy.side
+    side_display = "多單" if side == "long" else "空單"
+    # 查詢平倉前的本金（margin）
+    margin_before_close = None
+    try:
+        for pos in await get_pending_positions(api_key, secret_key, symbol):
+            if pos.get("positionId") == position_id:
+                margin_before_close = float(pos.get("margin", 0))
+                break
+    except Exception as e:
+        print(f"查詢平倉前本金失敗: {e}")
+    order_result = await send_order(api_key, secret_key, symbol, ctx.margin_coin, f"close_{side}", qty, position_id=position_id, signal_time=signal_time)
+    if not (order_result and order_result.get('code') == 0):
+        log_event("平倉失敗", f"{side_display} {strategy.label}, 數量={qty}, 價格={price}, 錯誤={order_result}", symbol=symbol)
+        await send_discord_message(f"🔴 **{strategy.title}平倉失敗** 🔴", api_key, secret_key, symbol=symbol, operation_details={"type": "error", "details": order_result.get("msg", order_result.get("error", "未知錯誤")), "signal": strategy.signal, "force_send": True})
+        return False
+    # 直接查詢 Bitunix 歷史訂單的 profit 欄位
+    order_info = await query_last_closed_order(api_key, secret_key, symbol, position_id)
+    profit = order_info.get('profit', None) if order_info else None
+    log_event("平倉成功", f"{side_display} {strategy.label}, 數量={qty}, 價格={price}, 本金={margin_before_close}, 實際盈虧={profit}", symbol=symbol)
+    await send_discord_message(
+        f"🟠 **{strategy.title}平倉成功** 🟠",
+        api_key, secret_key, symbol=symbol,
+        operation_details={
+            "type": "close_success",
+            "side_closed": side,
+            "qty": qty,
+            "pnl": profit,
+            "margin": margin_before_close,
+            "force_send": True
+        }
+    )
+    if profit is not None:
+        if profit > 0:
+            win_count += 1
+        else:
+            loss_count += 1
+        save_stats()
+    ctx.reset_position_state()
+    if strategy.block_after_exit:
+        # 標記本K棒已平倉，同一根K棒不再以此策略開倉
+        save_long_action_flag(ctx, kline_time)
+    close_position_state(position_id)
+    return True
+
+async def update_trailing_stop(ctx, strategy, api_key, secret_key, close, atr, rsi, signal_time=None):
+    """移動止損：新止損只往有利方向移動，有變動時修改交易所止損（尚無條件單時改為設置）並同步跟單帳戶。"""
+    symbol = ctx.symbol
+    side = strategy.side
+    side_display = "多單" if side == "long" else "空單"
+    new_trailing_stop = trailing_stop_update(ctx.params, side, close, atr, ctx.stop_loss_price)
+    if new_trailing_stop is None:
+        return
+    fan_out(ctx, f"trailing_stop_{side}", lambda account: follower_update_stop(account, ctx, side, stop_price=new_trailing_stop), signal_time)
+    modify_result = await amend_position_tpsl(ctx, api_key, secret_key, stop_price=new_trailing_stop)
+    if modify_result and modify_result.get('code') == 0:
+        log_event("移動止損調整", f"{side_display} {strategy.label}, positionId={ctx.position_id}, 新止損={new_trailing_stop}, ATR={atr}, RSI={rsi}", symbol=symbol, position_id=ctx.position_id)
+        ctx.stop_loss_price = new_trailing_stop
+        save_position_state(ctx)
+        arrow, direction = ("⬆️", "上調") if side == "long" else ("⬇️", "下調")
+        await send_discord_message(f"{arrow} **{strategy.title}移動止損{direction}** {arrow} 新止損: {new_trailing_stop:.4f}", api_key, secret_key, symbol=symbol, operation_details={"type": "status_update", "details": f"新止損: {new_trailing_stop:.4f}", "force_send": True})
+    else:
+        log_event("移動止損失敗", f"{side_display} {strategy.label}, positionId={ctx.position_id}, 嘗試新止損={new_trailing_stop}, 錯誤={modify_result}", symbol=symbol, position_id=ctx.position_id)
+        await send_discord_message(f"🔴 **{strategy.title}移動止損調整失敗** 🔴", api_key, secret_key, symbol=symbol, operation_details={"type": "error", "details": modify_result.get("msg", modify_result.get("error", "未知錯誤")), "force_send": True})
+
+async def update_fixed_tpsl(ctx, strategy, api_key, secret_key, atr, rsi, signal_time=None):
+    """固定止損止盈依最新 ATR 自動更新（原地修改，被拒絕才取消後重新設置）；僅當止損價格有變動才更新。"""
+    symbol = ctx.symbol
+    side = strategy.side
+    side_display = "多單" if side == "long" else "空單"
+    entry_price = ctx.entry_price_long if side == "long" else ctx.entry_price_short
+    if entry_price is None:
+        log_event("止損止盈錯誤", f"無法取得{side_display}開倉價，跳過動態止損止盈計算", symbol=symbol)
+        return
+    new_stop_loss, new_take_profit = rsi_stop_take_profit(ctx.params, side, entry_price, atr)
+    if ctx.stop_loss_price is not None and abs(new_stop_loss - ctx.stop_loss_price) <= 1e-6:
+        return
+    fan_out(ctx, f"rsi_tpsl_{side}", lambda account: follower_update_stop(account, ctx, side, atr=atr), signal_time)
+    place_result = await amend_position_tpsl(ctx, api_key, secret_key, stop_price=new_stop_loss, limit_price=new_take_profit)
+    if place_result and place_result.get('code') == 0:
+        log_event(f"{strategy.label}{side_display}動態止損/止盈調整", f"{side_display} {strategy.label}, positionId={ctx.position_id}, 新止損={new_stop_loss}, 新止盈={new_take_profit}, ATR={atr}, RSI={rsi}", symbol=symbol, position_id=ctx.position_id)
+        ctx.stop_loss_price = new_stop_loss
+        save_position_state(ctx)
+    else:
+        log_event(f"{strategy.label}{side_display}動態止損/止盈調整失敗", f"{side_display} {strategy.label}, positionId={ctx.position_id}, 嘗試新止損={new_stop_loss}, 新止盈={new_take_profit}, 錯誤={place_result}", symbol=symbol, position_id=ctx.position_id)
+
 # === 交易策略核心邏輯 === #
-def execute_trading_strategy(api_key, secret_key, symbol, margin_coin, wallet_percentage, leverage, rsi_buy_signal, breakout_lookback, atr_multiplier):
-    global win_count, loss_count, current_pos_entry_type, current_stop_loss_price, current_position_id_global
-    global last_checked_kline_time
+async def execute_trading_strategy(ctx, api_key, secret_key, ohlcv_data=None, indicators=None):
+    """
+    對單一交易對（SymbolContext）執行一輪策略判斷；持倉狀態讀寫 ctx，不再使用模組全域變數。
+    進出場條件由 ctx.rules（rule_engine 規則集）判斷，下單動作依策略的方向與止損方式共用同一組函數。
+    indicators 為主循環已與 ohlcv_data 同步的 ctx.indicators，省略時在此同步。
+    """
+    symbol = ctx.symbol
+    margin_coin = ctx.margin_coin
+    wallet_percentage = ctx.wallet_percentage
+    leverage = ctx.leverage
     print(f"執行交易策略: {symbol}")
 
-    # 新增：記錄本K棒是否已經有多單平倉行為
-    if not hasattr(execute_trading_strategy, "long_action_taken_on_kline_time"):
-        execute_trading_strategy.long_action_taken_on_kline_time = {}
-
     try:
-        ohlcv_data = fetch_ohlcv(api_key, secret_key)
-        df = pd.DataFrame(ohlcv_data, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        # 新增：計算 RSI/ATR/突破等指標
-        df = compute_indicators(df, RSI_LEN, ATR_LEN, BREAKOUT_LOOKBACK, api_key, secret_key, symbol)
-
-        latest_kline_time = df['timestamp'].iloc[-1]
-        latest_close = df['close'].iloc[-1]
-        latest_rsi = df['rsi'].iloc[-1] if 'rsi' in df.columns else None
-        latest_highest_break = df['highest_break'].iloc[-1] if 'highest_break' in df.columns and pd.notna(df['highest_break'].iloc[-1]) else None
-        latest_atr = df['atr'].iloc[-1] if 'atr' in df.columns else None
-        # 新增：空單指標
-        lowest_break = df['lowest_break'].iloc[-1] if 'lowest_break' in df.columns and pd.notna(df['lowest_break'].iloc[-1]) else None
+        # 主循環已取得本輪K線時直接沿用，避免同一輪重複請求
+        if ohlcv_data is None:
+            ohlcv_data = await fetch_ohlcv(ctx)
+        # 模擬交易：以本輪K線更新模擬撮合引擎的最新價並檢查盤中止盈止損
+        if paper_exchange is not None and ohlcv_data is not None:
+            paper_exchange.on_candles(symbol, ohlcv_data)
+        # 新增：計算 RSI/ATR/突破等指標（增量引擎，只更新最後一根K線）
+        if indicators is None:
+            indicators = ctx.indicators.sync(ohlcv_data)
+        # 訊號判斷起點：之後的下單回應延遲記錄於 signal_to_order_seconds
+        signal_time = time.perf_counter()
+
+        latest_kline_time = int(ohlcv_data[-1, 0])
+        latest_close = float(ohlcv_data[-1, 4])
+        latest_rsi = indicators.rsi
+        latest_atr = indicators.atr
 
         # 新增：終端機輸出 RSI
         if latest_rsi is not None:
@@ -688,13 +810,14 @@ def execute_trading_strategy(api_key, secret_key, symbol, margin_coin, wallet_pe
         else:
             print("RSI: 無法取得")
 
-        # 檢查是否新K棒，若是則重置
-        if (last_checked_kline_time is None) or (latest_kline_time != last_checked_kline_time):
-            execute_trading_strategy.long_action_taken_on_kline_time[latest_kline_time] = False
-            last_checked_kline_time = latest_kline_time
+        # 檢查是否新K棒，若是則重置（is_new_kline 供 RSI 平倉判斷使用：上一根K棒剛收盤）
+        is_new_kline = ctx.last_checked_kline_time is not None and latest_kline_time != ctx.last_checked_kline_time
+        if (ctx.last_checked_kline_time is None) or (latest_kline_time != ctx.last_checked_kline_time):
+            ctx.long_action_taken_on_kline_time[latest_kline_time] = False
+            ctx.last_checked_kline_time = latest_kline_time
 
         # 檢查當前持倉狀態
-        pos_info = get_current_position_details(api_key, secret_key, symbol, margin_coin)
+        pos_info = await get_current_position_details(api_key, secret_key, symbol, margin_coin)
         long_pos = pos_info["long"]
         short_pos = pos_info["short"]
         # 多單資訊
@@ -702,387 +825,71 @@ def execute_trading_strategy(api_key, secret_key, symbol, margin_coin, wallet_pe
             current_pos_side = "long"
             current_pos_qty_str = long_pos["qty"]
             current_position_id = long_pos["positionId"]
-            current_unrealized_pnl = long_pos["unrealized_pnl"]
         elif short_pos is not None:
             current_pos_side = "short"
             current_pos_qty_str = short_pos["qty"]
             current_position_id = short_pos["positionId"]
-            current_unrealized_pnl = short_pos["unrealized_pnl"]
         else:
             current_pos_side = None
             current_pos_qty_str = None
             current_position_id = None
-            current_unrealized_pnl = None
         current_pos_qty = float(current_pos_qty_str) if current_pos_qty_str else 0.0
 
         # 只允許同時一張單
         if current_pos_side is None:
-            # 若本K棒已經有多單平倉行為，則禁止RSI多單開倉
-            rsi_long_blocked = execute_trading_strategy.long_action_taken_on_kline_time.get(latest_kline_time, False)
-            # RSI 多單進場
-            if not rsi_long_blocked and latest_rsi is not None and latest_rsi < RSI_BUY:
-                trade_size = calculate_trade_size(api_key, secret_key, symbol, wallet_percentage, leverage, latest_close)
-                if trade_size > 0:
-                    log_event("策略判斷", f"觸發RSI多單條件，RSI={latest_rsi:.2f} < {RSI_BUY}")
-                    order_result = send_order(api_key, secret_key, symbol, margin_coin, "open_long", trade_size, leverage)
-                    if order_result and order_result.get('code') == 0:
-                        # 嘗試取得 positionId
-                        new_position_id = order_result.get("data", {}).get("positionId")
-                        if not new_position_id:
-                            # 若沒有，則用 orderId 查詢
-                            order_id = order_result.get("data", {}).get("orderId")
-                            new_position_id = get_position_id_by_order_id(api_key, secret_key, symbol, order_id)
-                        current_position_id_global = new_position_id
-                        current_pos_entry_type = "rsi"
-                        position_entry_type_map[str(new_position_id)] = "RSI"
-                        save_position_entry_type_map()
-                        # 在 execute_trading_strategy() 新開倉時，開倉後自動查詢並記錄開倉價
-                        # 新開倉多單
-                        pos_info = get_current_position_details(api_key, secret_key, symbol, margin_coin)
-                        long_pos = pos_info["long"]
-                        if long_pos is not None:
-                            current_entry_price_long = long_pos.get("avgOpenPrice")
-                        # 止損止盈計算改用 current_entry_price_long
-                        if current_entry_price_long is not None:
-                            stop_loss = current_entry_price_long - latest_atr * STOP_MULT
-                            take_profit = current_entry_price_long + latest_atr * LIMIT_MULT
-                        else:
-                            log_event("止損止盈錯誤", "無法取得多單開倉價，跳過止損止盈計算")
-                            stop_loss = None
-                            take_profit = None
-                        if new_position_id:
-                            place_conditional_orders(api_key, secret_key, symbol, margin_coin, new_position_id, stop_price=stop_loss, limit_price=take_profit)
-                        else:
-                            log_event("條件單設置失敗", f"無法取得 positionId，條件單未設置。orderId={order_id}")
-                        current_stop_loss_price = stop_loss
-                        log_event("開倉成功", f"多單 RSI, 數量={trade_size}, 價格={latest_close}, 止損={stop_loss}, 止盈={take_profit}")
-                        send_discord_message("🟢 **RSI 多單開倉成功** 🟢", api_key, secret_key, operation_details={"type": "open_success", "side_opened": "long", "qty": trade_size, "entry_price": latest_close, "signal": "RSI", "force_send": True})
-                    else:
-                        log_event("開倉失敗", f"多單 RSI, 數量={trade_size}, 價格={latest_close}, 錯誤={order_result}")
-                        send_discord_message("🔴 **RSI 多單開倉失敗** 🔴", api_key, secret_key, operation_details={"type": "error", "details": order_result.get("msg", order_result.get("error", "未知錯誤")), "signal": "RSI", "force_send": True})
-                else:
-                    log_event("策略判斷", f"RSI多單條件成立但下單數量為0，RSI={latest_rsi:.2f}")
-            elif rsi_long_blocked and latest_rsi is not None and latest_rsi < RSI_BUY:
-                print("本K棒已多單平倉，禁止RSI多單開倉")
-            # Breakout 多單進場（不受限制）
-            elif latest_highest_break is not None and latest_close > latest_highest_break:
-                trade_size = calculate_trade_size(api_key, secret_key, symbol, wallet_percentage, leverage, latest_close)
-                if trade_size > 0:
-                    log_event("策略判斷", f"觸發突破多單條件，close={latest_close} > highestBreak={latest_highest_break}")
-                    order_result = send_order(api_key, secret_key, symbol, margin_coin, "open_long", trade_size, leverage)
-                    if order_result and order_result.get('code') == 0:
-                        new_position_id = order_result.get("data", {}).get("positionId")
-                        current_position_id_global = new_position_id
-                        current_pos_entry_type = "breakout"
-                        position_entry_type_map[str(new_position_id)] = "Breakout"
-                        save_position_entry_type_map()
-                        current_stop_loss_price = latest_close - latest_atr * ATR_MULT
-                        log_event("開倉成功", f"多單 Breakout, 數量={trade_size}, 價格={latest_close}, 初始移動止損={current_stop_loss_price}")
-                        send_discord_message("🟢 **突破多單開倉成功** 🟢", api_key, secret_key, operation_details={"type": "open_success", "side_opened": "long", "qty": trade_size, "entry_price": latest_close, "signal": "Breakout", "force_send": True})
-                    else:
-                        log_event("開倉失敗", f"多單 Breakout, 數量={trade_size}, 價格={latest_close}, 錯誤={order_result}")
-                        send_discord_message("🔴 **突破多單開倉失敗** 🔴", api_key, secret_key, operation_details={"type": "error", "details": order_result.get("msg", order_result.get("error", "未知錯誤")), "signal": "Breakout", "force_send": True})
-                else:
-                    log_event("策略判斷", f"突破多單條件成立但下單數量為0，close={latest_close}")
-            # 空單進場不受限制
-            elif latest_rsi is not None and latest_rsi > rsiSell:
-                trade_size = calculate_trade_size(api_key, secret_key, symbol, wallet_percentage, leverage, latest_close)
-                if trade_size > 0:
-                    log_event("策略判斷", f"觸發RSI空單條件，RSI={latest_rsi:.2f} > {rsiSell}")
-                    order_result = try_place_order_with_auto_reduce(api_key, secret_key, symbol, margin_coin, "open_short", trade_size, leverage)
-                    if order_result and order_result.get('code') == 0:
-                        # 嘗試取得 positionId
-                        new_position_id = order_result.get("data", {}).get("positionId")
-                        if not new_position_id:
-                            order_id = order_result.get("data", {}).get("orderId")
-                            new_position_id = get_position_id_by_order_id(api_key, secret_key, symbol, order_id)
-                        if new_position_id:
-                            current_position_id_global = new_position_id
-                            current_pos_entry_type = "rsi_short"
-                            position_entry_type_map[str(new_position_id)] = "RSI"
-                            save_position_entry_type_map()
-                            # 在 execute_trading_strategy() 新開倉時，開倉後自動查詢並記錄開倉價
-                            # 新開倉空單
-                            pos_info = get_current_position_details(api_key, secret_key, symbol, margin_coin)
-                            short_pos = pos_info["short"]
-                            if short_pos is not None:
-                                current_entry_price_short = short_pos.get("avgOpenPrice")
-                            if current_entry_price_short is not None:
-                                stop_loss = current_entry_price_short + latest_atr * STOP_MULT
-                                take_profit = current_entry_price_short - latest_atr * LIMIT_MULT
-                            else:
-                                log_event("止損止盈錯誤", "無法取得空單開倉價，跳過止損止盈計算")
-                                stop_loss = None
-                                take_profit = None
-                            place_conditional_orders(api_key, secret_key, symbol, margin_coin, new_position_id, stop_price=stop_loss, limit_price=take_profit)
-                            current_stop_loss_price = stop_loss
-                            log_event("開倉成功", f"空單 RSI, 數量={trade_size}, 價格={latest_close}, 止損={stop_loss}, 止盈={take_profit}")
-                            send_discord_message("🟢 **RSI 空單開倉成功** 🟢", api_key, secret_key, operation_details={"type": "open_success", "side_opened": "short", "qty": trade_size, "entry_price": latest_close, "signal": "RSI 空", "force_send": True})
-                        else:
-                            log_event("條件單設置失敗", f"無法取得 positionId，條件單未設置。orderId={order_id}")
-                            send_discord_message("🔴 **RSI 空單開倉成功但無法取得 positionId，條件單設置失敗** 🔴", api_key, secret_key, operation_details={"type": "error", "details": "無法取得 positionId，條件單未設置。", "signal": "RSI 空", "force_send": True})
-                    else:
-                        log_event("開倉失敗", f"空單 RSI, 數量={trade_size}, 價格={latest_close}, 錯誤={order_result}")
-                        send_discord_message("🔴 **RSI 空單開倉失敗** 🔴", api_key, secret_key, operation_details={"type": "error", "details": order_result.get("msg", order_result.get("error", "未知錯誤")), "signal": "RSI 空", "force_send": True})
-                else:
-                    log_event("策略判斷", f"RSI空單條件成立但下單數量為0，RSI={latest_rsi:.2f}")
-            elif lowest_break is not None and latest_close < lowest_break:
-                trade_size = calculate_trade_size(api_key, secret_key, symbol, wallet_percentage, leverage, latest_close)
-                if trade_size > 0:
-                    log_event("策略判斷", f"觸發突破空單條件，close={latest_close} < lowestBreak={lowest_break}")
-                    order_result = try_place_order_with_auto_reduce(api_key, secret_key, symbol, margin_coin, "open_short", trade_size, leverage)
-                    if order_result and order_result.get('code') == 0:
-                        new_position_id = order_result.get("data", {}).get("positionId")
-                        if not new_position_id:
-                            order_id = order_result.get("data", {}).get("orderId")
-                            new_position_id = get_position_id_by_order_id(api_key, secret_key, symbol, order_id)
-                        if new_position_id:
-                            current_position_id_global = new_position_id
-                            current_pos_entry_type = "breakout_short"
-                            position_entry_type_map[str(new_position_id)] = "Breakout"
-                            save_position_entry_type_map()
-                            current_stop_loss_price = latest_close + latest_atr * ATR_MULT
-                            log_event("開倉成功", f"空單 Breakout, 數量={trade_size}, 價格={latest_close}, 初始移動止損={current_stop_loss_price}")
-                            send_discord_message("🟢 **突破空單開倉成功** 🟢", api_key, secret_key, operation_details={"type": "open_success", "side_opened": "short", "qty": trade_size, "entry_price": latest_close, "signal": "Breakout 空", "force_send": True})
-                        else:
-                            log_event("條件單設置失敗", f"無法取得 positionId，條件單未設置。orderId={order_id}")
-                            send_discord_message("🔴 **突破空單開倉成功但無法取得 positionId，條件單設置失敗** 🔴", api_key, secret_key, operation_details={"type": "error", "details": "無法取得 positionId，條件單未設置。", "signal": "Breakout 空", "force_send": True})
-                    else:
-                        log_event("開倉失敗", f"空單 Breakout, 數量={trade_size}, 價格={latest_close}, 錯誤={order_result}")
-                        send_discord_message("🔴 **突破空單開倉失敗** 🔴", api_key, secret_key, operation_details={"type": "error", "details": order_result.get("msg", order_result.get("error", "未知錯誤")), "signal": "Breakout 空", "force_send": True})
-                else:
-                    log_event("策略判斷", f"突破空單條件成立但下單數量為0，close={latest_close}")
-            else:
-                log_event("策略判斷", f"無進場條件觸發，RSI={latest_rsi}, close={latest_close}")
-
-        # RSI 多單平倉（只在新K棒結束時檢查）
-        if current_pos_side == "long" and current_pos_entry_type == "rsi":
-            if last_checked_kline_time is None or latest_kline_time != last_checked_kline_time:
-                # 新K棒結束，檢查 RSI > EXIT_RSI
-                if latest_rsi is not None and latest_rsi > EXIT_RSI:
-                    if current_pos_qty > 0 and current_position_id:
-                        balance_before_close = check_wallet_balance(api_key, secret_key)
-                        # 查詢平倉前的本金（margin）
-                        margin_before_close = None
-                        try:
-                            url = "https://fapi.bitunix.com/api/v1/futures/position/get_pending_positions"
-                            params = {"symbol": symbol}
-                            nonce = uuid.uuid4().hex
-                            timestamp = str(int(time.time() * 1000))
-                            sorted_items = sorted((k, str(v)) for k, v in params.items())
-                            query_string = "".join(f"{k}{v}" for k, v in sorted_items)
-                            digest_input = nonce + timestamp + api_key + query_string
-                            digest = hashlib.sha256(digest_input.encode('utf-8')).hexdigest()
-                            sign = hashlib.sha256((digest + secret_key).encode('utf-8')).hexdigest()
-                            headers = {
-                                "api-key": api_key,
-                                "sign": sign,
-                                "nonce": nonce,
-                                "timestamp": timestamp,
-                                "Content-Type": "application/json"
-                            }
-                            res = requests.get(url, headers=headers, params=params)
-                            data = res.json()
-                            if data.get("code") == 0 and data.get("data"):
-                                for pos in data["data"]:
-                                    if pos.get("positionId") == current_position_id:
-                                        margin_before_close = float(pos.get("margin", 0))
-                                        break
-                        except Exception as e:
-                            print(f"查詢平倉前本金失敗: {e}")
-                        order_result = send_order(api_key, secret_key, symbol, margin_coin, "close_long", current_pos_qty, position_id=current_position_id)
-                        if order_result and order_result.get('code') == 0:
-                            # === 新增：直接查詢 Bitunix 歷史訂單的 profit 欄位 ===
-                            order_info = query_last_closed_order(api_key, secret_key, symbol, current_position_id)
-                            profit = None
-                            if order_info:
-                                profit = order_info.get('profit', None)
-                            log_event("平倉成功", f"多單 RSI, 數量={current_pos_qty}, 價格={latest_close}, 本金={margin_before_close}, 實際盈虧={profit}")
-                            send_discord_message(
-                                "🟠 **RSI 多單平倉成功** 🟠",
-                                api_key, secret_key,
-                                operation_details={
-                                    "type": "close_success",
-                                    "side_closed": "long",
-                                    "qty": current_pos_qty,
-                                    "pnl": profit,
-                                    "margin": margin_before_close,
-                                    "force_send": True
-                                }
-                            )
-                            if profit is not None:
-                                if profit > 0:
-                                    win_count += 1
-                                else:
-                                    loss_count += 1
-                                save_stats()
-                            current_pos_entry_type = None
-                            current_stop_loss_price = None
-                            current_position_id_global = None
-                            # 標記本K棒已多單平倉
-                            execute_trading_strategy.long_action_taken_on_kline_time[latest_kline_time] = True
-                            save_long_action_flag(execute_trading_strategy.long_action_taken_on_kline_time)
-                            if current_position_id:
-                                position_entry_type_map.pop(str(current_position_id), None)
-                                save_position_entry_type_map()
-                        else:
-                            log_event("平倉失敗", f"多單 RSI, 數量={current_pos_qty}, 價格={latest_close}, 錯誤={order_result}")
-                            send_discord_message("🔴 **RSI 多單平倉失敗** 🔴", api_key, secret_key, operation_details={"type": "error", "details": order_result.get("msg", order_result.get("error", "未知錯誤")), "force_send": True})
-                last_checked_kline_time = latest_kline_time
-        # RSI 空單平倉（只在新K棒結束時檢查）
-        if current_pos_side == "short" and current_pos_entry_type == "rsi_short":
-            if last_checked_kline_time is None or latest_kline_time != last_checked_kline_time:
-                # 新K棒結束，檢查 RSI < exitRSI_short
-                if latest_rsi is not None and latest_rsi < exitRSI_short:
-                    if current_pos_qty > 0 and current_position_id:
-                        balance_before_close = check_wallet_balance(api_key, secret_key)
-                        # 查詢平倉前的本金（margin）
-                        margin_before_close = None
-                        try:
-                            url = "https://fapi.bitunix.com/api/v1/futures/position/get_pending_positions"
-                            params = {"symbol": symbol}
-                            nonce = uuid.uuid4().hex
-                            timestamp = str(int(time.time() * 1000))
-                            sorted_items = sorted((k, str(v)) for k, v in params.items())
-                            query_string = "".join(f"{k}{v}" for k, v in sorted_items)
-                            digest_input = nonce + timestamp + api_key + query_string
-                            digest = hashlib.sha256(digest_input.encode('utf-8')).hexdigest()
-                            sign = hashlib.sha256((digest + secret_key).encode('utf-8')).hexdigest()
-                            headers = {
-                                "api-key": api_key,
-                                "sign": sign,
-                                "nonce": nonce,
-                                "timestamp": timestamp,
-                                "Content-Type": "application/json"
-                            }
-                            res = requests.get(url, headers=headers, params=params)
-                            data = res.json()
-                            if data.get("code") == 0 and data.get("data"):
-                                for pos in data["data"]:
-                                    if pos.get("positionId") == current_position_id:
-                                        margin_before_close = float(pos.get("margin", 0))
-                                        break
-                        except Exception as e:
-                            print(f"查詢平倉前本金失敗: {e}")
-                        order_result = send_order(api_key, secret_key, symbol, margin_coin, "close_short", current_pos_qty, position_id=current_position_id)
-                        if order_result and order_result.get('code') == 0:
-                            # === 新增：直接查詢 Bitunix 歷史訂單的 profit 欄位 ===
-                            order_info = query_last_closed_order(api_key, secret_key, symbol, current_position_id)
-                            profit = None
-                            if order_info:
-                                profit = order_info.get('profit', None)
-                            log_event("平倉成功", f"空單 RSI, 數量={current_pos_qty}, 價格={latest_close}, 本金={margin_before_close}, 實際盈虧={profit}")
-                            send_discord_message(
-                                "🟠 **RSI 空單平倉成功** 🟠",
-                                api_key, secret_key,
-                                operation_details={
-                                    "type": "close_success",
-                                    "side_closed": "short",
-                                    "qty": current_pos_qty,
-                                    "pnl": profit,
-                                    "margin": margin_before_close,
-                                    "force_send": True
-                                }
-                            )
-                            if profit is not None:
-                                if profit > 0:
-                                    win_count += 1
-                                else:
-                                    loss_count += 1
-                                save_stats()
-                            current_pos_entry_type = None
-                            current_stop_loss_price = None
-                            current_position_id_global = None
-                            if current_position_id:
-                                position_entry_type_map.pop(str(current_position_id), None)
-                                save_position_entry_type_map()
-                        else:
-                            log_event("平倉失敗", f"空單 RSI, 數量={current_pos_qty}, 價格={latest_close}, 錯誤={order_result}")
-                            send_discord_message("🔴 **RSI 空單平倉失敗** 🔴", api_key, secret_key, operation_details={"type": "error", "details": order_result.get("msg", order_result.get("error", "未知錯誤")), "force_send": True})
-                last_checked_kline_time = latest_kline_time
-        # Breakout 多單移動止損（每次循環都檢查）
-        if current_pos_side == "long" and current_pos_entry_type == "breakout" and current_position_id_global:
-            new_trailing_stop = latest_close - latest_atr * ATR_MULT
-            if current_stop_loss_price is not None and new_trailing_stop > current_stop_loss_price:
-                modify_result = modify_position_tpsl(api_key, secret_key, symbol, current_position_id_global, stop_price=new_trailing_stop)
-                if modify_result and modify_result.get('code') == 0:
-                    log_event("移動止損調整", f"多單 Breakout, positionId={current_position_id_global}, 新止損={new_trailing_stop}, ATR={latest_atr}, RSI={latest_rsi}")
-                    current_stop_loss_price = new_trailing_stop
-                    send_discord_message(f"⬆️ **突破多單移動止損上調** ⬆️ 新止損: {new_trailing_stop:.4f}", api_key, secret_key, operation_details={"type": "status_update", "details": f"新止損: {new_trailing_stop:.4f}", "force_send": True})
-                else:
-                    log_event("移動止損失敗", f"多單 Breakout, positionId={current_position_id_global}, 嘗試新止損={new_trailing_stop}, 錯誤={modify_result}")
-                    send_discord_message(f"🔴 **突破多單移動止損調整失敗** 🔴", api_key, secret_key, operation_details={"type": "error", "details": modify_result.get("msg", modify_result.get("error", "未知錯誤")), "force_send": True})
-        # Breakout 空單移動止損（每次循環都檢查）
-        if current_pos_side == "short" and current_pos_entry_type == "breakout_short" and current_position_id_global:
-            new_trailing_stop = latest_close + latest_atr * ATR_MULT
-            if current_stop_loss_price is not None and new_trailing_stop < current_stop_loss_price:
-                modify_result = modify_position_tpsl(api_key, secret_key, symbol, current_position_id_global, stop_price=new_trailing_stop)
-                if modify_result and modify_result.get('code') == 0:
-                    log_event("移動止損調整", f"空單 Breakout, positionId={current_position_id_global}, 新止損={new_trailing_stop}, ATR={latest_atr}, RSI={latest_rsi}")
-                    current_stop_loss_price = new_trailing_stop
-                    send_discord_message(f"⬇️ **突破空單移動止損下調** ⬇️ 新止損: {new_trailing_stop:.4f}", api_key, secret_key, operation_details={"type": "status_update", "details": f"新止損: {new_trailing_stop:.4f}", "force_send": True})
-                else:
-                    log_event("移動止損失敗", f"空單 Breakout, positionId={current_position_id_global}, 嘗試新止損={new_trailing_stop}, 錯誤={modify_result}")
-                    send_discord_message(f"🔴 **突破空單移動止損調整失敗** 🔴", api_key, secret_key, operation_details={"type": "error", "details": modify_result.get("msg", modify_result.get("error", "未知錯誤")), "force_send": True})
-
-        # RSI 多單動態止盈止損自動更新（先查詢、取消、再設置）
-        if current_pos_side == "long" and current_pos_entry_type == "rsi" and current_position_id_global:
-            if current_entry_price_long is not None:
-                new_stop_loss = current_entry_price_long - latest_atr * STOP_MULT
-                new_take_profit = current_entry_price_long + latest_atr * LIMIT_MULT
+            values = live_values(indicators, latest_close)
+            entry_strategy = ctx.rules.strategy(ctx.rules.first_entry(values))
+            # 若本K棒已經有 block_after_exit 策略（RSI 多單）平倉行為，則禁止該策略再開倉
+            if entry_strategy is not None and entry_strategy.block_after_exit and ctx.long_action_taken_on_kline_time.get(latest_kline_time, False):
+                print(f"本K棒已{entry_strategy.title}平倉，禁止{entry_strategy.title}開倉")
+            elif entry_strategy is not None:
+                # 查餘額與下單在進場鎖內進行：多個交易對同時進場時依序以最新餘額計算下單數量
+                async with entry_lock:
+                    trade_size = await calculate_trade_size(api_key, secret_key, symbol, wallet_percentage, leverage, latest_close, ctx.quantity_precision)
+                    if trade_size > 0:
+                        log_event("策略判斷", f"觸發{entry_strategy.title}條件，{ctx.rules.describe(entry_strategy.name, values)}", symbol=symbol)
+                        order_result = await submit_entry_order(ctx, entry_strategy, api_key, secret_key, trade_size, signal_time)
+                if trade_size <= 0:
+                    log_event("策略判斷", f"{entry_strategy.title}條件成立但下單數量為0，{ctx.rules.describe(entry_strategy.name, values)}", symbol=symbol)
+                # 主帳戶開倉成功後才分發給跟單帳戶，避免主帳戶下單失敗時跟單帳戶單獨持倉
+                elif await open_strategy_position(ctx, entry_strategy, api_key, secret_key, order_result, trade_size, latest_close, latest_atr):
+                    fan_out(ctx, f"open_{entry_strategy.name}", lambda account: follower_open(account, ctx, entry_strategy, latest_close, latest_atr), signal_time)
             else:
-                log_event("止損止盈錯誤", "無法取得多單開倉價，跳過動態止損止盈計算")
-                new_stop_loss = None
-                new_take_profit = None
-            # 僅當止損或止盈價格有變動才更新
-            if (current_stop_loss_price is None or abs(new_stop_loss - current_stop_loss_price) > 1e-6):
-                tpsl_order_ids = get_pending_tpsl_orders(api_key, secret_key, symbol, current_position_id_global)
-                for oid in tpsl_order_ids:
-                    cancel_tpsl_order(api_key, secret_key, symbol, oid)
-                place_result = place_conditional_orders(api_key, secret_key, symbol, margin_coin, current_position_id_global, stop_price=new_stop_loss, limit_price=new_take_profit)
-                if place_result and place_result.get('code') == 0:
-                    log_event("RSI多單動態止損/止盈調整", f"多單 RSI, positionId={current_position_id_global}, 新止損={new_stop_loss}, 新止盈={new_take_profit}, ATR={latest_atr}, RSI={latest_rsi}")
-                    current_stop_loss_price = new_stop_loss
-                else:
-                    log_event("RSI多單動態止損/止盈調整失敗", f"多單 RSI, positionId={current_position_id_global}, 嘗試新止損={new_stop_loss}, 新止盈={new_take_profit}, 錯誤={place_result}")
-
-        # RSI 空單動態止盈止損自動更新（先查詢、取消、再設置）
-        if current_pos_side == "short" and current_pos_entry_type == "rsi_short" and current_position_id_global:
-            if current_entry_price_short is not None:
-                new_stop_loss = current_entry_price_short + latest_atr * STOP_MULT
-                new_take_profit = current_entry_price_short - latest_atr * LIMIT_MULT
+                log_event("策略判斷", f"無進場條件觸發，RSI={latest_rsi}, close={latest_close}", symbol=symbol)
+
+        # 持倉策略的平倉規則（只在新K棒結束時檢查，使用剛收盤K棒的 RSI 與收盤價）
+        position_strategy = ctx.rules.strategy(ctx.pos_entry_type)
+        if position_strategy is not None and current_pos_side == position_strategy.side and is_new_kline:
+            closed_values = {"rsi": indicators.closed_rsi, "close": float(ohlcv_data[-2, 4])}
+            if ctx.rules.exit_signal(position_strategy.name, closed_values):
+                if current_pos_qty > 0 and current_position_id:
+                    if await close_strategy_position(ctx, position_strategy, api_key, secret_key, current_pos_qty, current_position_id, latest_close, latest_kline_time, signal_time):
+                        fan_out(ctx, f"close_{current_pos_side}", lambda account: follower_close(account, ctx, current_pos_side), signal_time)
+
+        # 移動止損（每次循環都檢查）或固定止損止盈依 ATR 自動更新；本輪已平倉時 ctx.pos_entry_type 為 None
+        position_strategy = ctx.rules.strategy(ctx.pos_entry_type)
+        if position_strategy is not None and current_pos_side == position_strategy.side and ctx.position_id:
+            if position_strategy.stop == STOP_TRAILING:
+                await update_trailing_stop(ctx, position_strategy, api_key, secret_key, latest_close, latest_atr, latest_rsi, signal_time)
             else:
-                log_event("止損止盈錯誤", "無法取得空單開倉價，跳過動態止損止盈計算")
-                new_stop_loss = None
-                new_take_profit = None
-            if (current_stop_loss_price is None or abs(new_stop_loss - current_stop_loss_price) > 1e-6):
-                tpsl_order_ids = get_pending_tpsl_orders(api_key, secret_key, symbol, current_position_id_global)
-                for oid in tpsl_order_ids:
-                    cancel_tpsl_order(api_key, secret_key, symbol, oid)
-                place_result = place_conditional_orders(api_key, secret_key, symbol, margin_coin, current_position_id_global, stop_price=new_stop_loss, limit_price=new_take_profit)
-                if place_result and place_result.get('code') == 0:
-                    log_event("RSI空單動態止損/止盈調整", f"空單 RSI, positionId={current_position_id_global}, 新止損={new_stop_loss}, 新止盈={new_take_profit}, ATR={latest_atr}, RSI={latest_rsi}")
-                    current_stop_loss_price = new_stop_loss
-                else:
-                    log_event("RSI空單動態止損/止盈調整失敗", f"空單 RSI, positionId={current_position_id_global}, 嘗試新止損={new_stop_loss}, 新止盈={new_take_profit}, 錯誤={place_result}")
+                await update_fixed_tpsl(ctx, position_strategy, api_key, secret_key, latest_atr, latest_rsi, signal_time)
 
     except Exception as e:
+        ERRORS.inc(component="strategy")
         error_msg = f"執行交易策略時發生未知錯誤: {e}"
         print(f"錯誤：{error_msg}")
-        log_event("策略錯誤", error_msg)
+        log_event("策略錯誤", error_msg, symbol=symbol)
 
 # === 查詢錢包餘額 === #
-def check_wallet_balance(api_key, secret_key):
-    query_params = {"marginCoin": MARGIN_COIN}
-    path = "/api/v1/futures/account"
-    url = f"https://fapi.bitunix.com{path}?marginCoin={MARGIN_COIN}"
-    _, _, _, headers = get_signed_params(api_key, secret_key, query_params, method="GET")
+async def check_wallet_balance(api_key, secret_key, refresh=False):
+    """
+    查詢可用餘額；同一輪主循環內重複呼叫會使用快照快取，refresh=True 強制重新查詢。
+    """
+    global last_balance
+    current_wallet_balance = None
     try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        print(f"Response from API: {response.text}")
-        balance_info = response.json()
-        current_balance = None
+        balance_info = await get_client(api_key, secret_key).snapshot.account(MARGIN_COIN, refresh=refresh)
+        print(f"Response from API: {balance_info}")
         if "data" in balance_info and balance_info["data"] is not None:
             print(f"完整的數據結構: {balance_info['data']}")
             if isinstance(balance_info["data"], dict):
@@ -1095,6 +902,7 @@ def check_wallet_balance(api_key, secret_key):
                 total_asset = available_balance + margin_balance + total_unrealized_pnl
                 print(f"已獲取並發送餘額信息: 可用 {available_balance}, 保證金 {margin_balance}, 未實現盈虧 {total_unrealized_pnl}, 總資產 {total_asset}")
                 current_wallet_balance = available_balance
+                last_balance = available_balance
                 return available_balance
             else:
                 error_message = "餘額數據格式不正確"
@@ -1103,182 +911,95 @@ def check_wallet_balance(api_key, secret_key):
         else:
             error_message = balance_info.get("message", "無法獲取餘額信息")
             return current_wallet_balance
-    except requests.exceptions.HTTPError as err:
-        print(f"HTTP Error: {err}")
+    except aiohttp.ClientResponseError as err:
+        print(f"HTTP Error: {err.status} {err.message}")
         return current_wallet_balance
-    except requests.exceptions.RequestException as err:
-        print(f"Request Exception: {err}")
+    except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+        print(f"Request Exception: {err!r}")
         return current_wallet_balance
     except Exception as e:
         error_msg = f"執行交易策略時發生未知錯誤: {e}"
         print(f"錯誤：{error_msg}")
 
+# === 查詢未平倉持倉（原始資料） === #
+async def get_pending_positions(api_key, secret_key, symbol, refresh=False):
+    """
+    查詢指定交易對的未平倉持倉，回傳 API 原始的持倉列表（查無資料時回傳空列表）。
+    同一輪主循環內使用快照快取（含 margin），refresh=True 強制重新查詢。
+    請求失敗時拋出例外，由呼叫端處理。
+    """
+    data = await get_client(api_key, secret_key).snapshot.pending_positions(symbol, refresh=refresh)
+    if data.get("code") == 0 and data.get("data"):
+        return data["data"]
+    return []
+
 # === 查詢持倉狀態（新版：同時回傳多單與空單） === #
-def get_current_position_details(api_key, secret_key, symbol, margin_coin=MARGIN_COIN):
+async def get_current_position_details(api_key, secret_key, symbol, margin_coin=MARGIN_COIN):
     """
     回傳 {'long': {...}, 'short': {...}} 結構，分別包含 qty, positionId, unrealized_pnl, avgOpenPrice。
     """
-    import hashlib, uuid, time, requests
-    url = "https://fapi.bitunix.com/api/v1/futures/position/get_pending_positions"
-    params = {"symbol": symbol}
-    nonce = uuid.uuid4().hex
-    timestamp = str(int(time.time() * 1000))
-    sorted_items = sorted((k, str(v)) for k, v in params.items())
-    query_string = "".join(f"{k}{v}" for k, v in sorted_items)
-    digest_input = nonce + timestamp + api_key + query_string
-    digest = hashlib.sha256(digest_input.encode('utf-8')).hexdigest()
-    sign = hashlib.sha256((digest + secret_key).encode('utf-8')).hexdigest()
-    headers = {
-        "api-key": api_key,
-        "sign": sign,
-        "nonce": nonce,
-        "timestamp": timestamp,
-        "Content-Type": "application/json"
-    }
     result = {"long": None, "short": None}
     try:
-        res = requests.get(url, headers=headers, params=params)
-        data = res.json()
-        if data.get("code") == 0 and data.get("data"):
-            for pos_detail in data["data"]:
-                pos_qty_str = pos_detail.get("qty", "0")
-                position_id = pos_detail.get("positionId")
-                unrealized_pnl = float(pos_detail.get("unrealizedPNL", 0.0))
-                avg_open_price = float(pos_detail.get("avgOpenPrice", 0.0)) if pos_detail.get("avgOpenPrice") else None
-                if float(pos_qty_str) > 0:
-                    if pos_detail.get("side") == "BUY":
-                        result["long"] = {"qty": pos_qty_str, "positionId": position_id, "unrealized_pnl": unrealized_pnl, "avgOpenPrice": avg_open_price}
-                    elif pos_detail.get("side") == "SELL":
-                        result["short"] = {"qty": pos_qty_str, "positionId": position_id, "unrealized_pnl": unrealized_pnl, "avgOpenPrice": avg_open_price}
+        for pos_detail in await get_pending_positions(api_key, secret_key, symbol):
+            pos_qty_str = pos_detail.get("qty", "0")
+            position_id = pos_detail.get("positionId")
+            unrealized_pnl = float(pos_detail.get("unrealizedPNL", 0.0))
+            avg_open_price = float(pos_detail.get("avgOpenPrice", 0.0)) if pos_detail.get("avgOpenPrice") else None
+            if float(pos_qty_str) > 0:
+                if pos_detail.get("side") == "BUY":
+                    result["long"] = {"qty": pos_qty_str, "positionId": position_id, "unrealized_pnl": unrealized_pnl, "avgOpenPrice": avg_open_price}
+                elif pos_detail.get("side") == "SELL":
+                    result["short"] = {"qty": pos_qty_str, "positionId": position_id, "unrealized_pnl": unrealized_pnl, "avgOpenPrice": avg_open_price}
         return result
     except Exception as e:
         print(f"查詢持倉詳細失敗: {e}")
         return {"long": None, "short": None}
 
-def get_recent_closed_orders(api_key, secret_key, symbol, page_size=10):
-    url = "https://fapi.bitunix.com/api/v1/futures/order/history"
-    params = {"symbol": symbol, "pageSize": page_size}
-    nonce = uuid.uuid4().hex
-    timestamp = str(int(time.time() * 1000))
-    sorted_items = sorted((k, str(v)) for k, v in params.items())
-    query_string = "".join(f"{k}{v}" for k, v in sorted_items)
-    digest_input = nonce + timestamp + api_key + query_string
-    digest = hashlib.sha256(digest_input.encode('utf-8')).hexdigest()
-    sign = hashlib.sha256((digest + secret_key).encode('utf-8')).hexdigest()
-    headers = {
-        "api-key": api_key,
-        "sign": sign,
-        "nonce": nonce,
-        "timestamp": timestamp,
-        "Content-Type": "application/json"
-    }
+async def get_recent_closed_orders(api_key, secret_key, symbol, page_size=10):
     try:
-        res = requests.get(url, headers=headers, params=params)
-        data = res.json()
+        data = await get_client(api_key, secret_key).get("/api/v1/futures/order/history", {"symbol": symbol, "pageSize": page_size})
         if data.get("code") == 0 and data.get("data"):
             return data["data"]
     except Exception as e:
         print(f"查詢歷史訂單失敗: {e}")
     return []
 # === 新增：查詢最近平倉訂單的輔助函數 ===
-def query_last_closed_order(api_key, secret_key, symbol, prev_pos_id, max_retries=3, retry_interval=1):
+async def query_last_closed_order(api_key, secret_key, symbol, prev_pos_id, max_retries=3, retry_interval=1):
     """
     查詢最近的平倉訂單，並判斷是TP還是SL，增加debug print與重試機制。
+    私有頻道連線中時優先等待該持倉的平倉推送（已實現盈虧），未連線或逾時才查詢歷史訂單。
     """
-    url = "https://fapi.bitunix.com/api/v1/futures/order/history"
+    stream = live_private_stream(api_key)
+    if stream is not None and prev_pos_id:
+        closed = await stream.wait_position_closed(prev_pos_id, PRIVATE_STREAM_WAIT_SECONDS)
+        if closed is not None and closed.get("profit") is not None:
+            return closed
+        print(f"{symbol} 未在 {PRIVATE_STREAM_WAIT_SECONDS} 秒內收到 positionId={prev_pos_id} 的平倉推送，改為查詢歷史訂單")
+    client = get_client(api_key, secret_key)
     params = {"symbol": symbol, "pageSize": 5}
-    nonce = uuid.uuid4().hex
-    timestamp = str(int(time.time() * 1000))
-    sorted_items = sorted((k, str(v)) for k, v in params.items())
-    query_string = "".join(f"{k}{v}" for k, v in sorted_items)
-    digest_input = nonce + timestamp + api_key + query_string
-    digest = hashlib.sha256(digest_input.encode('utf-8')).hexdigest()
-    sign = hashlib.sha256((digest + secret_key).encode('utf-8')).hexdigest()
-    headers = {
-        "api-key": api_key,
-        "sign": sign,
-        "nonce": nonce,
-        "timestamp": timestamp,
-        "Content-Type": "application/json"
-    }
     for attempt in range(max_retries):
         try:
-            res = requests.get(url, headers=headers, params=params)
-            data = res.json()
+            data = await client.get("/api/v1/futures/order/history", params)
             print(f"[DEBUG] 歷史訂單查詢結果 (第{attempt+1}次): {data}")
             if data.get("code") == 0 and data.get("data"):
                 for order in data["data"]:
                     if str(order.get("positionId")) == str(prev_pos_id) and order.get("status") == "FILLED":
                         trigger_type = order.get("triggerType", "")
                         close_price = order.get("avgPrice", order.get("price", ""))
-                        profit = order.get("profit", None)
+                        profit = parse_pnl(order.get("profit"))
                         return {"trigger_type": trigger_type, "close_price": close_price, "profit": profit}
         except Exception as e:
             print(f"查詢歷史訂單失敗: {e}")
-        time.sleep(retry_interval)
+        await asyncio.sleep(retry_interval)
     return None
 
-def send_profit_loss_to_discord(api_key, secret_key, symbol_param, message): # Renamed symbol to symbol_param
-    position = get_current_position(api_key, secret_key, symbol_param)
-    if position in ['long', 'short']:
-        url = "https://fapi.bitunix.com/api/v1/futures/position/get_pending_positions"
-        params = {"symbol": symbol_param} # Use symbol_param
-        nonce = uuid.uuid4().hex
-        timestamp = str(int(time.time() * 1000))
-        digest_input = nonce + timestamp + api_key + "symbol" + symbol_param # Use symbol_param
-        digest = hashlib.sha256(digest_input.encode('utf-8')).hexdigest()
-        sign = hashlib.sha256((digest + secret_key).encode('utf-8')).hexdigest()
-        headers = {
-            "api-key": api_key,
-            "sign": sign,
-            "nonce": nonce,
-            "timestamp": timestamp,
-            "Content-Type": "application/json"
-        }
-        try:
-            res = requests.get(url, headers=headers, params=params)
-            data = res.json()
-            if data.get("code") == 0 and data.get("data"):
-                for pos in data["data"]:
-                    if ((position == "long" and pos.get("side") == "BUY") or
-                        (position == "short" and pos.get("side") == "SELL")):
-                        pnl = float(pos.get("unrealizedPNL", 0))
-                        margin = float(pos.get("margin", 0))
-                        if margin:
-                            profit_pct = (pnl / margin) * 100
-                            message += f"\n💰 盈虧: {pnl:.4f} USDT｜收益率: {profit_pct:.2f}%"
-                        else:
-                            message += f"\n💰 盈虧: {pnl:.4f} USDT"
-        except Exception as e:
-            message += f"\n查詢盈虧失敗: {e}"
-    
-    # 根據需求，移除持倉和盈虧更新的 Discord 通知
-    pass
-
-def get_pending_tpsl_orders(api_key, secret_key, symbol, position_id):
+async def get_pending_tpsl_orders(api_key, secret_key, symbol, position_id):
     """
     查詢目前持倉的 TP/SL 單，回傳 orderId list。
     參考官方文件：https://openapidoc.bitunix.com/doc/tp_sl/cancel_tp_sl_order.html
     """
-    url = "https://fapi.bitunix.com/api/v1/futures/tpsl/get_pending_tp_sl_order"
-    params = {"symbol": symbol}
-    nonce = uuid.uuid4().hex
-    timestamp = str(int(time.time() * 1000))
-    sorted_items = sorted((k, str(v)) for k, v in params.items())
-    query_string = "".join(f"{k}{v}" for k, v in sorted_items)
-    digest_input = nonce + timestamp + api_key + query_string
-    digest = hashlib.sha256(digest_input.encode('utf-8')).hexdigest()
-    sign = hashlib.sha256((digest + secret_key).encode('utf-8')).hexdigest()
-    headers = {
-        "api-key": api_key,
-        "sign": sign,
-        "nonce": nonce,
-        "timestamp": timestamp,
-        "Content-Type": "application/json"
-    }
     try:
-        res = requests.get(url, headers=headers, params=params)
-        data = res.json()
+        data = await get_client(api_key, secret_key).get("/api/v1/futures/tpsl/get_pending_tp_sl_order", {"symbol": symbol})
         order_ids = []
         if data.get("code") == 0 and data.get("data"):
             for order in data["data"]:
@@ -1291,29 +1012,14 @@ def get_pending_tpsl_orders(api_key, secret_key, symbol, position_id):
         print(f"查詢 TP/SL 單失敗: {e}")
         return []
 
-def cancel_tpsl_order(api_key, secret_key, symbol, order_id):
+async def cancel_tpsl_order(api_key, secret_key, symbol, order_id):
     """
     取消指定 TP/SL 單。
     參考官方文件：https://openapidoc.bitunix.com/doc/tp_sl/cancel_tp_sl_order.html
     """
-    url = "https://fapi.bitunix.com/api/v1/futures/tpsl/cancel_order"
     body = {"symbol": symbol, "orderId": order_id}
-    nonce = uuid.uuid4().hex
-    timestamp = str(int(time.time() * 1000))
-    body_str = json.dumps(body, separators=(',', ':'), ensure_ascii=False)
-    digest_input = nonce + timestamp + api_key + body_str
-    digest = hashlib.sha256(digest_input.encode('utf-8')).hexdigest()
-    sign = hashlib.sha256((digest + secret_key).encode('utf-8')).hexdigest()
-    headers = {
-        "api-key": api_key,
-        "sign": sign,
-        "nonce": nonce,
-        "timestamp": timestamp,
-        "Content-Type": "application/json"
-    }
     try:
-        res = requests.post(url, headers=headers, data=body_str)
-        data = res.json()
+        data = await get_client(api_key, secret_key).post("/api/v1/futures/tpsl/cancel_order", body)
         if data.get("code") == 0:
             print(f"成功取消 TP/SL 單: {order_id}")
             return True
@@ -1324,117 +1030,371 @@ def cancel_tpsl_order(api_key, secret_key, symbol, order_id):
         print(f"取消 TP/SL 單失敗: {e}")
         return False
 
-def set_leverage_to_config():
+def record_tpsl_orders(ctx, result):
+    """由設置條件單的回應記錄 TP/SL orderId（data 可能是單筆 dict 或 list）。"""
+    if not result or result.get("code") != 0:
+        return
+    data = result.get("data") or []
+    ctx.tpsl_order_ids = [str(item["orderId"]) for item in (data if isinstance(data, list) else [data])
+                          if isinstance(item, dict) and item.get("orderId")]
+
+async def amend_position_tpsl(ctx, api_key, secret_key, stop_price=None, limit_price=None):
+    """
+    調整當前持倉的止損止盈：以 modify_position_tpsl 一次原地修改，調整期間持倉始終保有止損；
+    修改被拒絕（例如持倉尚無條件單）才取消舊條件單並重新設置。舊條件單 orderId 優先使用本地紀錄，沒有紀錄才查詢。
+    """
+    symbol = ctx.symbol
+    result = await modify_position_tpsl(api_key, secret_key, symbol, ctx.position_id, stop_price=stop_price, limit_price=limit_price, notify=False)
+    if result and result.get("code") == 0:
+        return result
+    log_event("止損止盈修改失敗", f"positionId={ctx.position_id}, 錯誤={result}，改為取消後重新設置", symbol=symbol, position_id=ctx.position_id)
+    order_ids = ctx.tpsl_order_ids or await get_pending_tpsl_orders(api_key, secret_key, symbol, ctx.position_id)
+    for oid in order_ids:
+        await cancel_tpsl_order(api_key, secret_key, symbol, oid)
+    ctx.tpsl_order_ids = []
+    result = await place_conditional_orders(api_key, secret_key, symbol, ctx.margin_coin, ctx.position_id, stop_price=stop_price, limit_price=limit_price)
+    record_tpsl_orders(ctx, result)
+    return result
+
+# === 多帳戶訊號分發：主帳戶的進場、RSI 平倉與止損調整決策同時送往 FOLLOWER_ACCOUNTS（account_fanout.py） ===
+# 行情與指標只計算一次；各跟單帳戶以自己的餘額計算數量、以自己的開倉價計算 RSI 止損止盈，持倉一律即時向交易所查詢
+follower_dispatcher = None
+
+def get_follower_dispatcher():
+    global follower_dispatcher
+    if follower_dispatcher is None:
+        accounts = load_follower_accounts(FOLLOWER_ACCOUNTS)
+        if accounts and PAPER_TRADING:
+            print(f"模擬交易模式不分發跟單，已略過 {len(accounts)} 個跟單帳戶")
+            accounts = []
+        follower_dispatcher = FanoutDispatcher(accounts, FANOUT_MAX_CONCURRENCY, on_result=log_follower_result)
+    return follower_dispatcher
+
+def log_follower_result(account, symbol, action, result):
+    status = "成功" if is_success(result) else "失敗"
+    log_event(f"跟單{status}", f"帳戶={account.name}, 動作={action}, 結果={result}", symbol=symbol)
+
+def fan_out(ctx, action, handler, signal_time=None):
+    """把一個決策分發到所有跟單帳戶（不等待完成）。開倉與平倉在主帳戶成功後才分發，止損調整與主帳戶同時進行。"""
+    return get_follower_dispatcher().dispatch(ctx.symbol, action, handler, signal_time)
+
+async def follower_position(account, ctx, side):
+    return (await get_current_position_details(account.api_key, account.secret_key, ctx.symbol, ctx.margin_coin))[side]
+
+async def follower_open(account, ctx, strategy, price, atr):
+    """
+    跟單帳戶開倉：以該帳戶餘額計算數量；固定止損止盈（RSI 單）以該帳戶的開倉價設置止損止盈，
+    移動止損（突破單）設置與主帳戶相同的初始止損。該帳戶已有同方向持倉時不重複開倉。
+    """
+    side = strategy.side
+    if await follower_position(account, ctx, side) is not None:
+        return {"error": "已有同方向持倉，略過開倉"}
+    leverage = account.leverage or ctx.leverage
+    wallet_percentage = account.wallet_percentage if account.wallet_percentage is not None else ctx.wallet_percentage
+    size = await calculate_trade_size(account.api_key, account.secret_key, ctx.symbol, wallet_percentage, leverage, price, ctx.quantity_precision)
+    if size <= 0:
+        return {"error": "下單數量為0（餘額不足或無法查詢餘額）"}
+    result = await try_place_order_with_auto_reduce(account.api_key, account.secret_key, ctx.symbol, ctx.margin_coin, f"open_{side}", size, leverage, ctx.quantity_precision)
+    if not is_success(result):
+        return result
+    data = result.get("data") or {}
+    position_id = data.get("positionId") or await get_position_id_by_order_id(account.api_key, account.secret_key, ctx.symbol, data.get("orderId"))
+    if not position_id:
+        return {"error": f"已開倉但無法取得 positionId，條件單未設置。orderId={data.get('orderId')}"}
+    if strategy.stop == STOP_FIXED:
+        position = await follower_position(account, ctx, side)
+        if position is None or not position.get("avgOpenPrice"):
+            return {"error": f"已開倉但無法取得持倉，條件單未設置。orderId={data.get('orderId')}"}
+        stop_loss, take_profit = rsi_stop_take_profit(ctx.params, side, position["avgOpenPrice"], atr)
+        tpsl_result = await place_conditional_orders(account.api_key, account.secret_key, ctx.symbol, ctx.margin_coin, position_id, stop_price=stop_loss, limit_price=take_profit)
+    else:
+        tpsl_result = await place_conditional_orders(account.api_key, account.secret_key, ctx.symbol, ctx.margin_coin, position_id, stop_price=breakout_stop(ctx.params, side, price, atr))
+    if not is_success(tpsl_result):
+        return {"error": f"已開倉但條件單設置失敗: {tpsl_result}"}
+    return {"code": 0, "data": {"orderId": data.get("orderId"), "positionId": position_id, "qty": size}}
+
+async def follower_close(account, ctx, side):
+    """跟單帳戶平掉該方向的持倉（數量以該帳戶的持倉為準）。"""
+    position = await follower_position(account, ctx, side)
+    if position is None:
+        return {"error": "無對應持倉"}
+    return await send_order(account.api_key, account.secret_key, ctx.symbol, ctx.margin_coin, f"close_{side}", float(position["qty"]), position_id=position["positionId"])
+
+async def follower_update_stop(account, ctx, side, stop_price=None, atr=None):
+    """
+    調整跟單帳戶的止損：突破單直接使用主帳戶算出的移動止損（stop_price）；
+    RSI 單（stop_price 為 None）以該帳戶的開倉價與 atr 重新計算止損止盈。修改被拒絕（尚無條件單）時改為設置。
+    """
+    position = await follower_position(account, ctx, side)
+    if position is None:
+        return {"error": "無對應持倉"}
+    limit_price = None
+    if stop_price is None:
+        if not position.get("avgOpenPrice"):
+            return {"error": "無法取得開倉價"}
+        stop_price, limit_price = rsi_stop_take_profit(ctx.params, side, position["avgOpenPrice"], atr)
+    result = await modify_position_tpsl(account.api_key, account.secret_key, ctx.symbol, position["positionId"], stop_price=stop_price, limit_price=limit_price, notify=False)
+    if is_success(result):
+        return result
+    return await place_conditional_orders(account.api_key, account.secret_key, ctx.symbol, ctx.margin_coin, position["positionId"], stop_price=stop_price, limit_price=limit_price)
+
+async def set_leverage_to_config(ctx):
     """
-    使用 Bitunix API 將槓桿設為 config.py 的 LEVERAGE
+    使用 Bitunix API 將交易對的槓桿設為 config.py 的 LEVERAGE（或 SYMBOLS 中該交易對的 leverage）
     """
-    url = "https://fapi.bitunix.com/api/v1/futures/account/change_leverage"
     body = {
-        "symbol": SYMBOL,
-        "leverage": LEVERAGE,
-        "marginCoin": MARGIN_COIN
-    }
-    import uuid, time, hashlib, json
-    nonce = uuid.uuid4().hex
-    timestamp = str(int(time.time() * 1000))
-    body_str = json.dumps(body, separators=(',', ':'), ensure_ascii=False)
-    digest_input = nonce + timestamp + BITUNIX_API_KEY + body_str
-    digest = hashlib.sha256(digest_input.encode('utf-8')).hexdigest()
-    sign = hashlib.sha256((digest + BITUNIX_SECRET_KEY).encode('utf-8')).hexdigest()
-    headers = {
-        "api-key": BITUNIX_API_KEY,
-        "sign": sign,
-        "nonce": nonce,
-        "timestamp": timestamp,
-        "language": "en-US",
-        "Content-Type": "application/json"
+        "symbol": ctx.symbol,
+        "leverage": ctx.leverage,
+        "marginCoin": ctx.margin_coin
     }
     try:
-        res = requests.post(url, headers=headers, data=body_str)
-        print(f"[DEBUG] 槓桿設定API回應: {res.text}")
-        data = res.json()
+        data = await get_client(BITUNIX_API_KEY, BITUNIX_SECRET_KEY).post("/api/v1/futures/account/change_leverage", body)
+        print(f"[DEBUG] 槓桿設定API回應: {data}")
         if data.get("code") == 0:
-            print(f"[INFO] 槓桿已設為 {LEVERAGE}")
+            print(f"[INFO] {ctx.symbol} 槓桿已設為 {ctx.leverage}")
         else:
             print(f"[WARNING] 槓桿設定失敗: {data}")
-            log_event("槓桿設定失敗", str(data))
+            log_event("槓桿設定失敗", str(data), symbol=ctx.symbol)
     except Exception as e:
         print(f"[ERROR] 設定槓桿時發生錯誤: {e}")
-        log_event("槓桿設定異常", str(e))
+        log_event("槓桿設定異常", str(e), symbol=ctx.symbol)
+
+def tick_may_trigger(ctx):
+    """
+    盤中推送的快速判斷：無持倉時以本K線預先算好的 RSI 觸發價與突破高低點等規則門檻比較最新價，
+    只有可能觸發進場時才需要執行完整的策略評估。有持倉（移動止損、止損止盈更新）或指標尚未同步到最新K線時一律回傳 True。
+    """
+    if ctx.pos_entry_type is not None or ctx.market_stream is None:
+        return True
+    store = ctx.market_stream.store
+    indicators = ctx.indicators
+    if len(store) == 0 or indicators.timestamp is None or store.last_timestamp != indicators.timestamp:
+        return True
+    price = store.view()[-1, 4]
+    blocked = ctx.long_action_taken_on_kline_time.get(ctx.last_checked_kline_time, False)
+    return ctx.rules.entry_signal_at_price(indicators.rsi_prices, price, live_values(indicators, price), blocked) is not None
 
 class BitunixBot(discord.Client):
-    def __init__(self, **kwargs):
+    def __init__(self, contexts=None, **kwargs):
         super().__init__(intents=discord.Intents.default())
-        self.position_message_id = None
-        self.last_position_status = None
-        self.bg_task = None
+        # 每個交易對一個 SymbolContext，各自以一個 asyncio task 執行主循環
+        self.contexts = contexts if contexts is not None else load_symbol_contexts()
+        self.symbol_tasks = {}
+        self.private_stream_tasks = []
+        self.metrics_server = None
+        self.metrics_task = None
+        self.started = False
+        # 啟動時手動補 entry_type 的終端提問一次只問一個交易對，避免多個交易對的提示交錯
+        self.prompt_lock = asyncio.Lock()
 
     async def on_ready(self):
         print(f'Logged in as {self.user}')
-        self.bg_task = asyncio.create_task(self.trading_loop())
-
-    async def trading_loop(self):
-        global win_count, loss_count, current_pos_entry_type, current_stop_loss_price, current_position_id_global, last_checked_kline_time
+        # Discord 斷線重連也會觸發 on_ready，只啟動一次
+        if self.started:
+            return
+        self.started = True
+        asyncio.create_task(self.start_trading())
+
+    async def close(self):
+        # 停止行情推送與各交易對主循環，關閉 Bitunix 共用連線池與 K 線連線後再關閉 Discord 連線
+        for ctx in self.contexts:
+            if ctx.market_stream is not None:
+                ctx.market_stream.stop()
+            if ctx.stream_task is not None:
+                ctx.stream_task.cancel()
+        for task in self.symbol_tasks.values():
+            task.cancel()
+        for stream in private_streams.values():
+            stream.stop()
+        for task in self.private_stream_tasks:
+            task.cancel()
+        if self.metrics_task is not None:
+            self.metrics_task.cancel()
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        # 等待進行中的跟單分發完成，再送完佇列中的通知（Webhook 走共用連線池）
+        if follower_dispatcher is not None:
+            await follower_dispatcher.drain()
+        if discord_notifier is not None:
+            await discord_notifier.close()
+        await close_shared_session()
+        if candle_feed is not None:
+            await candle_feed.close()
+        if event_journal is not None:
+            event_journal.close()
+        if state_store is not None:
+            state_store.close()
+        await super().close()
+
+    async def on_market_update(self, ctx, kind, closed):
+        # WebSocket 推送更新了 K 線緩衝區，喚醒該交易對的主循環進行策略評估；無持倉且報價未觸及任何進場觸發價時不喚醒
+        if not closed and not tick_may_trigger(ctx):
+            return
+        ctx.market_update_event.set()
+
+    async def wait_for_next_evaluation(self, ctx):
+        """
+        由 ctx.scheduler 決定下一次評估：K線收盤後 CANDLE_CLOSE_SETTLE_SECONDS 秒執行收盤規則，
+        兩次收盤之間每 LOOP_INTERVAL_SECONDS 秒盤中檢查一次（移動止損、止損止盈更新）。
+        WebSocket 模式另外在收到推送後立即評估，但兩次評估至少間隔 STREAM_MIN_EVAL_INTERVAL 秒。
+        """
+        if ctx.market_stream is None:
+            kind, close_ms = await ctx.scheduler.wait()
+        else:
+            await asyncio.sleep(max(0.0, ctx.last_eval_time + STREAM_MIN_EVAL_INTERVAL - time.monotonic()))
+            kind, close_ms = await ctx.scheduler.wait(ctx.market_update_event)
+        LOOP_WAKES.inc(symbol=ctx.symbol, kind=kind)
+        if kind == CLOSE:
+            CANDLE_CLOSE_LAG_SECONDS.observe(max(0.0, time.time() - close_ms / 1000), symbol=ctx.symbol)
+
+    async def start_trading(self):
+        """
+        載入統計、為每個交易對載入初始K線並檢查指標，發送一則啟動訊息後為每個交易對啟動主循環。
+        """
         load_stats()
-        from config import TRADING_PAIR, SYMBOL, MARGIN_COIN, LEVERAGE, WALLET_PERCENTAGE, RSI_LEN, ATR_LEN, BREAKOUT_LOOKBACK, STOP_MULT, LIMIT_MULT, RSI_BUY, EXIT_RSI, ATR_MULT, TIMEFRAME
         api_key = BITUNIX_API_KEY
         secret_key = BITUNIX_SECRET_KEY
-        symbol = SYMBOL
-        margin_coin = MARGIN_COIN
-        leverage = LEVERAGE
-        wallet_percentage = WALLET_PERCENTAGE
-        print("交易機器人啟動，開始載入初始K線數據...")
-        ohlcv_data = fetch_ohlcv(api_key, secret_key)
-        balance = check_wallet_balance(api_key, secret_key)
-        min_data_len = max(RSI_LEN, ATR_LEN, BREAKOUT_LOOKBACK + 1) + 5
-        if ohlcv_data is None or len(ohlcv_data) < min_data_len:
-            await self.send_status(f"🔴 啟動失敗：無法獲取足夠的初始K線數據。需要至少 {min_data_len} 條數據，實際獲取 {len(ohlcv_data) if ohlcv_data is not None else 0} 條。")
-            return
-        df = pd.DataFrame(ohlcv_data, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        df_ind = compute_indicators(df, RSI_LEN, ATR_LEN, BREAKOUT_LOOKBACK, api_key, secret_key, symbol)
-        if df_ind is None or df_ind.empty or df_ind['rsi'].isnull().all() or df_ind['atr'].isnull().all():
-            await self.send_status("🔴 啟動失敗：計算指標失敗。")
+        print(f"交易機器人啟動，開始載入 {len(self.contexts)} 個交易對的初始K線數據...")
+        # 延遲指標：本地 /metrics 端點與（選用）textfile collector
+        if METRICS_PORT:
+            try:
+                self.metrics_server = await MetricsServer(port=METRICS_PORT).start()
+                print(f"指標端點: {self.metrics_server.url}")
+            except OSError as e:
+                print(f"無法啟動指標端點（連接埠 {METRICS_PORT}）: {e}")
+        if METRICS_TEXTFILE:
+            self.metrics_task = asyncio.create_task(run_textfile_writer(METRICS_TEXTFILE, METRICS_TEXTFILE_INTERVAL))
+        if PAPER_TRADING:
+            exchange = get_paper_exchange()
+            print(f"模擬交易模式：不送出真實訂單，模擬帳戶可用餘額 {exchange.available:.2f} USDT（{exchange.path}）")
+        elif PRIVATE_STREAM_ENABLED:
+            # 私有頻道推送（訂單/持倉/止盈止損），所有交易對共用同一條連線
+            self.private_stream_tasks.append(asyncio.create_task(get_private_stream(api_key, secret_key).run()))
+        followers = get_follower_dispatcher().accounts
+        if followers:
+            print(f"跟單帳戶 {len(followers)} 個: {', '.join(account.name for account in followers)}（最多同時 {FANOUT_MAX_CONCURRENCY} 個）")
+        balance = await check_wallet_balance(api_key, secret_key)
+        startup_rsi = await asyncio.gather(*(self.prepare_symbol(ctx, api_key, secret_key) for ctx in self.contexts))
+        ready = [(ctx, rsi) for ctx, rsi in zip(self.contexts, startup_rsi) if rsi is not None]
+        if not ready:
             return
-        latest_close = df_ind['close'].iloc[-1]
-        latest_rsi = df_ind['rsi'].iloc[-1]
-        latest_atr = df_ind['atr'].iloc[-1]
-        print(f"[Main Startup] 最新收盤價: {latest_close:.2f}, RSI: {latest_rsi:.2f}, ATR: {latest_atr:.4f}")
-        await self.send_status("", balance=balance, rsi=latest_rsi)
-        # 冷啟動時立即同步持倉訊息
-        # === 新增：手動補 entry_type ===
-        pos_info = get_current_position_details(api_key, secret_key, symbol, margin_coin)
-        for pos in [pos_info["long"], pos_info["short"]]:
+        await self.send_status("", balance=balance, rsi={ctx.symbol: rsi for ctx, rsi in ready})
+        for ctx, _ in ready:
+            # 冷啟動時立即同步持倉訊息
+            await self.update_discord_position_message(ctx, api_key, secret_key, ctx.indicators.rsi, ctx.indicators.atr)
+            self.symbol_tasks[ctx.symbol] = asyncio.create_task(self.trading_loop(ctx))
+
+    async def prepare_symbol(self, ctx, api_key, secret_key):
+        """單一交易對的啟動檢查，成功回傳最新 RSI，失敗發送狀態訊息並回傳 None。"""
+        ohlcv_data = await fetch_ohlcv(ctx)
+        params = ctx.params
+        min_data_len = max(params.rsi_len, params.atr_len, params.breakout_lookback + 1) + 5
+        if ohlcv_data is None or len(ohlcv_data) < min_data_len:
+            await self.send_status(f"🔴 {ctx.symbol} 啟動失敗：無法獲取足夠的初始K線數據。需要至少 {min_data_len} 條數據，實際獲取 {len(ohlcv_data) if ohlcv_data is not None else 0} 條。")
+            return None
+        indicators = ctx.indicators.sync(ohlcv_data)
+        if indicators.rsi is None or indicators.atr is None:
+            await self.send_status(f"🔴 {ctx.symbol} 啟動失敗：計算指標失敗。")
+            return None
+        latest_close = ohlcv_data[-1, 4]
+        print(f"[Main Startup] {ctx.symbol} 最新收盤價: {latest_close:.2f}, RSI: {indicators.rsi:.2f}, ATR: {indicators.atr:.4f}")
+        # 還原本交易對最近的K棒旗標（本K棒已有 RSI 多單平倉時重啟後仍禁止 RSI 多單再進場）
+        store = get_state_store()
+        flags = store.candle_flags(ctx.symbol, LONG_ACTION_FLAG, since=int(ohlcv_data[0, 0]))
+        ctx.long_action_taken_on_kline_time.update(flags)
+        # === 還原持倉狀態；查無進場方式時手動補 entry_type ===
+        pos_info = await get_current_position_details(api_key, secret_key, ctx.symbol, ctx.margin_coin)
+        for side, pos in (("long", pos_info["long"]), ("short", pos_info["short"])):
             if pos is not None:
                 pid = str(pos.get("positionId"))
-                if pid not in position_entry_type_map:
-                    print(f"偵測到未知進場方式的持倉：positionId={pid} 進場價={pos.get('avgOpenPrice')} 數量={pos.get('qty')}")
-                    entry_type = input(f"請輸入 positionId={pid} 的進場方式（RSI/Breakout）：").strip().upper()
+                record = store.get_position(pid)
+                if record is None or record["entry_type"] is None:
+                    entry_type = await self.prompt_entry_type(ctx, pid, pos)
                     if entry_type in ["RSI", "BREAKOUT"]:
-                        position_entry_type_map[pid] = "RSI" if entry_type == "RSI" else "Breakout"
-                        save_position_entry_type_map()
-                        print(f"已補 entry_type: {pid} → {position_entry_type_map[pid]}")
+                        store.save_position(pid, ctx.symbol, "RSI" if entry_type == "RSI" else "Breakout")
+                        record = store.get_position(pid)
+                        print(f"已補 entry_type: {pid} → {record['entry_type']}")
                     else:
                         print("輸入無效，請下次重啟時再補。")
-        await self.update_discord_position_message(api_key, secret_key, symbol, margin_coin, latest_rsi, latest_atr)
+                        continue
+                # 只允許同時一張單：還原該持倉的策略進場類型、止損價與開倉價
+                strategy = record["strategy"] or {("RSI", "long"): "rsi", ("Breakout", "long"): "breakout",
+                                                  ("RSI", "short"): "rsi_short", ("Breakout", "short"): "breakout_short"}.get((record["entry_type"], side))
+                ctx.position_id = pid
+                ctx.pos_entry_type = strategy
+                ctx.stop_loss_price = record["stop_loss"]
+                if side == "long":
+                    ctx.entry_price_long = pos.get("avgOpenPrice")
+                else:
+                    ctx.entry_price_short = pos.get("avgOpenPrice")
+                print(f"[Main Startup] {ctx.symbol} 還原持倉 positionId={pid} 進場類型={strategy} 止損={ctx.stop_loss_price}")
+        return indicators.rsi
+
+    async def prompt_entry_type(self, ctx, pid, pos):
+        """
+        在終端詢問未知持倉的進場方式。input() 在背景執行緒等待，不阻塞事件迴圈（其他交易對、WebSocket 心跳與 Discord）；
+        沒有可用的終端（例如以服務方式執行）時回傳空字串，該持倉留待下次重啟再補。
+        """
+        async with self.prompt_lock:
+            print(f"偵測到未知進場方式的持倉：{ctx.symbol} positionId={pid} 進場價={pos.get('avgOpenPrice')} 數量={pos.get('qty')}")
+            try:
+                answer = await asyncio.to_thread(input, f"請輸入 {ctx.symbol} positionId={pid} 的進場方式（RSI/Breakout）：")
+            except EOFError:
+                log_event("啟動警告", f"positionId={pid} 進場方式未知且無法在終端輸入，止損止盈暫不還原", symbol=ctx.symbol, position_id=pid)
+                return ""
+        return answer.strip().upper()
+
+    async def trading_loop(self, ctx):
+        api_key = BITUNIX_API_KEY
+        secret_key = BITUNIX_SECRET_KEY
+        if MARKET_DATA_MODE == "websocket":
+            async def on_update(kind, closed):
+                await self.on_market_update(ctx, kind, closed)
+            ctx.market_stream = MarketStream(get_candle_feed(), ctx.trading_pair, ctx.timeframe, on_update=on_update, session=get_shared_session())
+            ctx.stream_task = asyncio.create_task(ctx.market_stream.run())
+        ctx.scheduler = CandleScheduler(ctx.timeframe, CANDLE_CLOSE_SETTLE_SECONDS, LOOP_INTERVAL_SECONDS)
         while True:
-            ohlcv_data = fetch_ohlcv(api_key, secret_key)
-            df = pd.DataFrame(ohlcv_data, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-            df_ind = compute_indicators(df, RSI_LEN, ATR_LEN, BREAKOUT_LOOKBACK, api_key, secret_key, symbol)
-            latest_rsi = df_ind['rsi'].iloc[-1]
-            latest_atr = df_ind['atr'].iloc[-1]
-            execute_trading_strategy(api_key, secret_key, symbol, margin_coin, wallet_percentage, leverage, RSI_BUY, BREAKOUT_LOOKBACK, ATR_MULT)
-            await self.update_discord_position_message(api_key, secret_key, symbol, margin_coin, latest_rsi, latest_atr)
-            await asyncio.sleep(LOOP_INTERVAL_SECONDS)
+            ctx.last_eval_time = time.monotonic()
+            try:
+                # 每輪開始時清除本交易對的交易所快照，本輪內持倉/餘額各只查詢一次
+                get_client(api_key, secret_key).snapshot.invalidate(ctx.symbol)
+                for account in get_follower_dispatcher().accounts:
+                    get_client(account.api_key, account.secret_key).snapshot.invalidate(ctx.symbol)
+                # 各階段耗時記錄於 loop_phase_seconds（持倉查詢、下單等個別請求另見 bitunix_request_seconds）
+                with LOOP_ITERATION_SECONDS.time(symbol=ctx.symbol):
+                    with LOOP_PHASE_SECONDS.time(symbol=ctx.symbol, phase="fetch_ohlcv"):
+                        ohlcv_data = await fetch_ohlcv(ctx)
+                    if ohlcv_data is not None and len(ohlcv_data) > 0:
+                        with LOOP_PHASE_SECONDS.time(symbol=ctx.symbol, phase="compute_indicators"):
+                            indicators = ctx.indicators.sync(ohlcv_data)
+                        with LOOP_PHASE_SECONDS.time(symbol=ctx.symbol, phase="strategy"):
+                            await execute_trading_strategy(ctx, api_key, secret_key, ohlcv_data=ohlcv_data, indicators=indicators)
+                        with LOOP_PHASE_SECONDS.time(symbol=ctx.symbol, phase="discord"):
+                            await self.update_discord_position_message(ctx, api_key, secret_key, indicators.rsi, indicators.atr)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 單一交易對發生錯誤不影響其他交易對，下一輪繼續
+                ERRORS.inc(component="trading_loop")
+                print(f"{ctx.symbol} 主循環發生錯誤: {e}")
+                logger.error(f"{ctx.symbol} 主循環發生錯誤: {e}\n{traceback.format_exc()}")
+            await self.wait_for_next_evaluation(ctx)
 
     async def send_status(self, msg, balance=None, rsi=None):
+        """
+        msg 非空時直接發送該狀態訊息（例如啟動失敗）；否則發送啟動訊息，rsi 為 {交易符號: 最新 RSI}。
+        """
         try:
             from config import STOP_MULT, LIMIT_MULT, RSI_BUY, RSI_LEN, EXIT_RSI, rsiSell, exitRSI_short, BREAKOUT_LOOKBACK, ATR_LEN, ATR_MULT, TIMEFRAME, WALLET_PERCENTAGE, LOOP_INTERVAL_SECONDS
             channel = self.get_channel(DISCORD_CHANNEL_ID)
-            if channel:
+            if channel and msg:
+                await channel.send(msg)
+            elif channel:
                 now_str = time.strftime('%Y-%m-%d %H:%M:%S')
+                balance_str = f"{balance:.2f}" if balance is not None else "N/A"
+                rsi_text = "\n".join(f"{symbol} RSI: `{value:.2f}`" for symbol, value in (rsi or {}).items())
                 param_text = (
+                    f"SYMBOLS: {', '.join(ctx.symbol for ctx in self.contexts)}\n"
                     f"STOP_MULT: {STOP_MULT}\n"
                     f"LIMIT_MULT: {LIMIT_MULT}\n"
                     f"RSI_BUY: {RSI_BUY}\n"
@@ -1453,8 +1413,8 @@ class BitunixBot(discord.Client):
                     title="🚀 交易機器人啟動 🚀",
                     description=(
                         f"```{param_text}```"
-                        f"目前錢包餘額: `{balance:.2f} USDT`\n"
-                        f"最新 RSI: `{rsi:.2f}`\n"
+                        f"目前錢包餘額: `{balance_str} USDT`\n"
+                        f"{rsi_text}\n"
                         f"🕒 啟動時間: {now_str}"
                     ),
                     color=0x3498db
@@ -1464,21 +1424,28 @@ class BitunixBot(discord.Client):
             print(f"send_status 發生錯誤: {e}")
             logger.error(f"send_status 發生錯誤: {e}\n{traceback.format_exc()}")
 
-    async def update_discord_position_message(self, api_key, secret_key, symbol, margin_coin, latest_rsi, latest_atr):
+    async def update_discord_position_message(self, ctx, api_key, secret_key, latest_rsi, latest_atr):
+        """
+        每個交易對各自維護一則持倉訊息（ctx.position_message）。
+        內容（不含時間欄位）與上次相同時不編輯；內容改變但持倉狀態沒變時，
+        兩次編輯至少間隔 POSITION_MESSAGE_MIN_INTERVAL 秒；開倉、平倉則立即更新。
+        """
         try:
-            from config import WALLET_PERCENTAGE  # 確保變數可用
+            symbol = ctx.symbol
+            margin_coin = ctx.margin_coin
+            params = ctx.params
             channel = self.get_channel(DISCORD_CHANNEL_ID)
             if not channel:
                 print("找不到指定的 Discord 頻道")
                 logger.error("找不到指定的 Discord 頻道")
                 return
-            pos_info = get_current_position_details(api_key, secret_key, symbol, margin_coin)
+            pos_info = await get_current_position_details(api_key, secret_key, symbol, margin_coin)
             long_pos = pos_info["long"]
             short_pos = pos_info["short"]
             now_str = time.strftime('%Y-%m-%d %H:%M:%S')
             rsi_str = f"{latest_rsi:.2f}" if latest_rsi is not None else "N/A"
             # Embed 標題與顏色
-            embed_title = f"{SYMBOL} 交易通知"
+            embed_title = f"{symbol} 交易通知"
             embed_color = 0x3498db  # 預設藍色
             show_param = False
             if long_pos or short_pos:
@@ -1489,21 +1456,24 @@ class BitunixBot(discord.Client):
                 show_param = True
             # Embed 內容
             if show_param:
+                # 使用最近一次查詢到的餘額，不為了顯示另外查詢交易所
+                wallet_balance_str = f"{last_balance:.2f}" if last_balance is not None else "N/A"
                 param_text = (
-                    f"STOP_MULT: {STOP_MULT}\n"
-                    f"LIMIT_MULT: {LIMIT_MULT}\n"
-                    f"RSI_BUY: {RSI_BUY}\n"
-                    f"RSI_LEN: {RSI_LEN}\n"
-                    f"EXIT_RSI: {EXIT_RSI}\n"
-                    f"rsiSell: {rsiSell}\n"
-                    f"exitRSI_short: {exitRSI_short}\n"
-                    f"BREAKOUT_LOOKBACK: {BREAKOUT_LOOKBACK}\n"
-                    f"ATR_LEN: {ATR_LEN}\n"
-                    f"ATR_MULT: {ATR_MULT}\n"
-                    f"TIMEFRAME: {TIMEFRAME}\n"
-                    f"WALLET_PERCENTAGE: {WALLET_PERCENTAGE}\n"
+                    f"STOP_MULT: {params.stop_mult}\n"
+                    f"LIMIT_MULT: {params.limit_mult}\n"
+                    f"RSI_BUY: {params.rsi_buy}\n"
+                    f"RSI_LEN: {params.rsi_len}\n"
+                    f"EXIT_RSI: {params.exit_rsi}\n"
+                    f"rsiSell: {params.rsi_sell}\n"
+                    f"exitRSI_short: {params.exit_rsi_short}\n"
+                    f"BREAKOUT_LOOKBACK: {params.breakout_lookback}\n"
+                    f"ATR_LEN: {params.atr_len}\n"
+                    f"ATR_MULT: {params.atr_mult}\n"
+                    f"TIMEFRAME: {ctx.timeframe}\n"
+                    f"WALLET_PERCENTAGE: {ctx.wallet_percentage}\n"
+                    f"LEVERAGE: {ctx.leverage}\n"
                     f"LOOP_INTERVAL_SECONDS: {LOOP_INTERVAL_SECONDS}\n"
-                    f"目前錢包餘額: {check_wallet_balance(api_key, secret_key):.2f} USDT\n"
+                    f"目前錢包餘額: {wallet_balance_str} USDT\n"
                 )
                 embed = discord.Embed(
                     title=embed_title,
@@ -1522,15 +1492,14 @@ class BitunixBot(discord.Client):
             embed.add_field(name="🏆 勝率統計", value=win_rate_str, inline=True)
             # 持倉與盈虧
             if long_pos is not None:
-                entry_type = position_entry_type_map.get(str(long_pos.get("positionId")), "未知")
+                entry_type = get_state_store().position_entry_type(long_pos.get("positionId"), "未知")
                 entry_price = long_pos.get("avgOpenPrice")
                 stop_loss = None
                 take_profit = None
                 if entry_type == "RSI" and entry_price is not None:
-                    stop_loss = entry_price - latest_atr * STOP_MULT
-                    take_profit = entry_price + latest_atr * LIMIT_MULT
+                    stop_loss, take_profit = rsi_stop_take_profit(params, "long", entry_price, latest_atr)
                 elif entry_type == "Breakout" and entry_price is not None:
-                    stop_loss = long_pos.get("stop_loss") or (entry_price - latest_atr * ATR_MULT)
+                    stop_loss = ctx.stop_loss_price or breakout_stop(params, "long", entry_price, latest_atr)
                 pnl = long_pos.get("unrealized_pnl")
                 entry_price_str = f"{entry_price:.2f}" if entry_price is not None else "N/A"
                 stop_loss_str = f"{stop_loss:.2f}" if stop_loss is not None else "N/A"
@@ -1543,15 +1512,14 @@ class BitunixBot(discord.Client):
                 embed.add_field(name="🛡️ 止損", value=f"`{stop_loss_str}`", inline=True)
                 embed.add_field(name="🎯 止盈", value=f"`{take_profit_str}`", inline=True)
             elif short_pos is not None:
-                entry_type = position_entry_type_map.get(str(short_pos.get("positionId")), "未知")
+                entry_type = get_state_store().position_entry_type(short_pos.get("positionId"), "未知")
                 entry_price = short_pos.get("avgOpenPrice")
                 stop_loss = None
                 take_profit = None
                 if entry_type == "RSI" and entry_price is not None:
-                    stop_loss = entry_price + latest_atr * STOP_MULT
-                    take_profit = entry_price - latest_atr * LIMIT_MULT
+                    stop_loss, take_profit = rsi_stop_take_profit(params, "short", entry_price, latest_atr)
                 elif entry_type == "Breakout" and entry_price is not None:
-                    stop_loss = short_pos.get("stop_loss") or (entry_price + latest_atr * ATR_MULT)
+                    stop_loss = ctx.stop_loss_price or breakout_stop(params, "short", entry_price, latest_atr)
                 pnl = short_pos.get("unrealized_pnl")
                 entry_price_str = f"{entry_price:.2f}" if entry_price is not None else "N/A"
                 stop_loss_str = f"{stop_loss:.2f}" if stop_loss is not None else "N/A"
@@ -1564,23 +1532,38 @@ class BitunixBot(discord.Client):
                 embed.add_field(name="🛡️ 止損", value=f"`{stop_loss_str}`", inline=True)
                 embed.add_field(name="🎯 止盈", value=f"`{take_profit_str}`", inline=True)
             else:
+                entry_type = None
                 embed.add_field(name="📊 目前持倉", value="無持倉", inline=True)
                 embed.add_field(name="💰 未實現盈虧", value="N/A", inline=True)
+            # 與上次送出的內容比較（時間欄位每輪都不同，不列入比較）
+            content_hash = hash(json.dumps(embed.to_dict(), sort_keys=True, ensure_ascii=False))
+            position_state = (
+                long_pos["qty"] if long_pos else None,
+                short_pos["qty"] if short_pos else None,
+                entry_type,
+            )
+            now = time.time()
+            if ctx.position_message is not None:
+                if content_hash == ctx.position_message_hash:
+                    return
+                if (position_state == ctx.position_message_state
+                        and now - ctx.position_message_edit_time < POSITION_MESSAGE_MIN_INTERVAL):
+                    return
             # 時間
             embed.add_field(name="🕒 時間", value=now_str, inline=False)
-            # 發送或編輯訊息
-            if not self.position_message_id:
-                msg_obj = await channel.send(embed=embed)
-                self.position_message_id = msg_obj.id
+            # 發送或編輯訊息（保留 Message 物件，編輯時不需再 fetch_message）
+            if ctx.position_message is None:
+                ctx.position_message = await channel.send(embed=embed)
             else:
                 try:
-                    msg_obj = await channel.fetch_message(self.position_message_id)
-                    await msg_obj.edit(embed=embed)
+                    await ctx.position_message.edit(embed=embed)
                 except Exception as e:
                     print(f"編輯訊息失敗: {e}，改為發送新訊息")
                     logger.error(f"編輯訊息失敗: {e}\n{traceback.format_exc()}")
-                    msg_obj = await channel.send(embed=embed)
-                    self.position_message_id = msg_obj.id
+                    ctx.position_message = await channel.send(embed=embed)
+            ctx.position_message_hash = content_hash
+            ctx.position_message_state = position_state
+            ctx.position_message_edit_time = now
         except Exception as e:
             print(f"update_discord_position_message 發生錯誤: {e}")
             logger.error(f"update_discord_position_message 發生錯誤: {e}\n{traceback.format_exc()}")
@@ -1599,5 +1582,3 @@ if __name__ == "__main__":
             print("3 秒後自動重試...")
             import time
             time.sleep(3)
-        finally:
-            flush_discord_messages()
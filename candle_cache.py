@@ -0,0 +1,244 @@
+"""
+本地 K 線快取：每個 symbol/timeframe 一個 .npy 檔（N×6，欄位為 timestamp, open, high, low, close, volume），以記憶體映射讀取。
+
+- 只儲存已收盤的 K 線，依時間遞增排列
+- 讀取時以 np.load(mmap_mode='r') 映射檔案，load() 回傳的是不複製的唯讀切片，
+  多年份的歷史 K 線只會載入實際讀到的頁面
+- 追加新 K 線時直接寫在檔尾並原地更新 .npy 標頭（NumPy 預留了標頭長度讓 shape 可以增長），不重寫整個檔案
+- sync_history / CandleFeed 只向交易所下載快取沒有的區間（起點之前、最後一根之後）
+
+使用方式：
+    python candle_cache.py --since 2020-01-01                # 下載 / 補齊 TRADING_PAIR / TIMEFRAME 到快取
+    python candle_cache.py --symbol BTC/USDT --timeframe 1h --since 2022-01-01
+    python candle_cache.py --info                            # 列出快取內容
+"""
+import argparse
+import io
+import os
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import ccxt
+
+from config import TRADING_PAIR, TIMEFRAME, CANDLE_CACHE_DIR
+
+ROW_WIDTH = 6  # [ts, o, h, l, c, v]
+HISTORY_PAGE_LIMIT = 1000  # 每次向交易所下載的 K 線數量上限
+# .npy 版本 -> (讀取標頭, 寫入標頭)
+_HEADER_IO = {
+    (1, 0): (np.lib.format.read_array_header_1_0, np.lib.format.write_array_header_1_0),
+    (2, 0): (np.lib.format.read_array_header_2_0, np.lib.format.write_array_header_2_0),
+}
+
+
+def timeframe_ms(timeframe):
+    """時間框架字串（例如 '4h'）轉為毫秒。"""
+    return ccxt.Exchange.parse_timeframe(timeframe) * 1000
+
+
+def closed_rows(rows, timeframe, now_ms=None):
+    """只保留已收盤的 K 線（開盤時間 + 週期 <= 現在）。"""
+    now_ms = time.time() * 1000 if now_ms is None else now_ms
+    period = timeframe_ms(timeframe)
+    return [row for row in rows if row[0] + period <= now_ms]
+
+
+def _format_ts(ts):
+    return f"{datetime.fromtimestamp(ts / 1000, tz=timezone.utc):%Y-%m-%d %H:%M}"
+
+
+class CandleCache:
+    """
+    以 .npy 檔儲存的已收盤 K 線，檔名為 {symbol 去掉 '/'}_{timeframe}.npy。
+    """
+
+    def __init__(self, root=CANDLE_CACHE_DIR):
+        self.root = root
+
+    def path(self, symbol, timeframe):
+        return os.path.join(self.root, f"{symbol.replace('/', '')}_{timeframe}.npy")
+
+    def open(self, symbol, timeframe):
+        """整個快取檔的 (N, 6) 唯讀記憶體映射；沒有快取時回傳空陣列。"""
+        path = self.path(symbol, timeframe)
+        if not os.path.exists(path):
+            return np.empty((0, ROW_WIDTH), dtype=np.float64)
+        return np.load(path, mmap_mode='r')
+
+    def bounds(self, symbol, timeframe):
+        """(第一根, 最後一根) K 線的開盤時間（毫秒），沒有快取時回傳 (None, None)。"""
+        data = self.open(symbol, timeframe)
+        if len(data) == 0:
+            return None, None
+        return int(data[0, 0]), int(data[-1, 0])
+
+    def load(self, symbol, timeframe, since_ms=None, until_ms=None):
+        """
+        開盤時間介於 [since_ms, until_ms) 的 K 線，回傳記憶體映射上的唯讀切片（不複製）。
+        以二分搜尋定位起訖位置，只讀取所需的頁面。
+        """
+        data = self.open(symbol, timeframe)
+        start = 0 if since_ms is None else _search(data, since_ms)
+        end = len(data) if until_ms is None else _search(data, until_ms)
+        return data[start:end]
+
+    def tail(self, symbol, timeframe, count):
+        """最近 count 根已收盤 K 線（唯讀切片）。"""
+        data = self.open(symbol, timeframe)
+        return data[max(len(data) - count, 0):]
+
+    def append(self, symbol, timeframe, rows):
+        """
+        追加比快取最後一根更新的 K 線（依時間排序的 [ts, o, h, l, c, v] 列表），回傳實際寫入的數量。
+        呼叫端需自行確保只傳入已收盤的 K 線（見 closed_rows）。
+        """
+        _, last_ts = self.bounds(symbol, timeframe)
+        new = np.asarray([row for row in rows if last_ts is None or row[0] > last_ts], dtype=np.float64)
+        if len(new) == 0:
+            return 0
+        new = new.reshape(-1, ROW_WIDTH)
+        path = self.path(symbol, timeframe)
+        if last_ts is None:
+            self._write(path, new)
+            return len(new)
+        with open(path, 'r+b') as f:
+            version = np.lib.format.read_magic(f)
+            read_header, write_header = _HEADER_IO[version]
+            shape, fortran_order, dtype = read_header(f)
+            header_len = f.tell()
+            header = io.BytesIO()
+            write_header(header, {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': fortran_order,
+                                  'shape': (shape[0] + len(new), shape[1])})
+            if header.tell() == header_len:
+                f.seek(0)
+                f.write(header.getvalue())
+                f.seek(0, os.SEEK_END)
+                f.write(new.tobytes())
+                return len(new)
+        # 標頭長度改變（舊版 NumPy 未預留 shape 增長空間），改為重寫整個檔案
+        self._write(path, np.concatenate([self.open(symbol, timeframe), new]))
+        return len(new)
+
+    def prepend(self, symbol, timeframe, rows):
+        """
+        寫入比快取第一根更早的 K 線（回補起點之前的歷史），需重寫整個檔案，回傳實際寫入的數量。
+        """
+        first_ts, _ = self.bounds(symbol, timeframe)
+        if first_ts is None:
+            return self.append(symbol, timeframe, rows)
+        new = np.asarray([row for row in rows if row[0] < first_ts], dtype=np.float64)
+        if len(new) == 0:
+            return 0
+        path = self.path(symbol, timeframe)
+        self._write(path, np.concatenate([new.reshape(-1, ROW_WIDTH), self.open(symbol, timeframe)]))
+        return len(new)
+
+    def _write(self, path, array):
+        """先寫入暫存檔再取代，寫到一半中斷也不會留下損毀的快取檔。"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.ascontiguousarray(array, dtype=np.float64))
+        os.replace(tmp_path, path)
+
+    def entries(self):
+        """列出快取中的 (檔名, K 線數量, 第一根時間, 最後一根時間)。"""
+        if not os.path.isdir(self.root):
+            return []
+        result = []
+        for name in sorted(os.listdir(self.root)):
+            if not name.endswith(".npy"):
+                continue
+            data = np.load(os.path.join(self.root, name), mmap_mode='r')
+            if len(data):
+                result.append((name, len(data), int(data[0, 0]), int(data[-1, 0])))
+        return result
+
+
+def _search(data, ts):
+    """第一根開盤時間 >= ts 的索引（只讀取 log N 個元素，避免 searchsorted 複製整個欄位）。"""
+    lo, hi = 0, len(data)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if data[mid, 0] < ts:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _download(exchange, symbol, timeframe, since_ms, until_ms=None, limit=HISTORY_PAGE_LIMIT):
+    """以 ccxt（同步）分頁下載 [since_ms, until_ms) 的已收盤 K 線。"""
+    rows = []
+    since = since_ms
+    while True:
+        batch = exchange.fetch_ohlcv(symbol, timeframe=timeframe, since=since, limit=limit)
+        batch = [r for r in batch if (not rows or r[0] > rows[-1][0]) and (until_ms is None or r[0] < until_ms)]
+        batch = closed_rows(batch, timeframe)
+        if not batch:
+            break
+        rows.extend(batch)
+        print(f"已下載 {len(rows)} 根K線，最新 {_format_ts(rows[-1][0])}")
+        since = rows[-1][0] + 1
+    return rows
+
+
+def sync_history(symbol, timeframe, since_ms, cache=None, exchange=None, limit=HISTORY_PAGE_LIMIT):
+    """
+    確保快取涵蓋 since_ms 至今的已收盤 K 線，只下載缺少的區間，回傳 since_ms 之後的記憶體映射切片。
+    """
+    cache = cache or CandleCache()
+    exchange = exchange or ccxt.binance({'enableRateLimit': True})
+    first_ts, last_ts = cache.bounds(symbol, timeframe)
+    if first_ts is None:
+        cache.append(symbol, timeframe, _download(exchange, symbol, timeframe, since_ms, limit=limit))
+    else:
+        if since_ms < first_ts:
+            print(f"補下載 {_format_ts(since_ms)} ~ {_format_ts(first_ts)}")
+            cache.prepend(symbol, timeframe, _download(exchange, symbol, timeframe, since_ms, first_ts, limit))
+        cache.append(symbol, timeframe, _download(exchange, symbol, timeframe, last_ts + 1, limit=limit))
+    return cache.load(symbol, timeframe, since_ms)
+
+
+async def sync_latest(cache, exchange, symbol, timeframe, seed_count, limit=HISTORY_PAGE_LIMIT):
+    """
+    以 ccxt 非同步交易所補齊快取最後一根之後的已收盤 K 線（實盤啟動時呼叫），回傳新寫入的數量。
+    沒有快取時只下載最近 seed_count 根。
+    """
+    _, last_ts = cache.bounds(symbol, timeframe)
+    if last_ts is None:
+        rows = await exchange.fetch_ohlcv(symbol, timeframe=timeframe, limit=seed_count)
+        return cache.append(symbol, timeframe, closed_rows(rows, timeframe))
+    written = 0
+    since = last_ts + 1
+    while True:
+        batch = closed_rows(await exchange.fetch_ohlcv(symbol, timeframe=timeframe, since=since, limit=limit), timeframe)
+        count = cache.append(symbol, timeframe, batch)
+        if count == 0:
+            break
+        written += count
+        since = int(batch[-1][0]) + 1
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="下載 / 補齊本地K線快取")
+    parser.add_argument("--symbol", default=TRADING_PAIR, help="ccxt 交易對，例如 ETH/USDT")
+    parser.add_argument("--timeframe", default=TIMEFRAME, help="時間框架")
+    parser.add_argument("--since", default="2020-01-01", help="起始日期（UTC）")
+    parser.add_argument("--dir", default=CANDLE_CACHE_DIR, help="快取目錄")
+    parser.add_argument("--info", action="store_true", help="只列出快取內容，不下載")
+    args = parser.parse_args()
+
+    cache = CandleCache(args.dir)
+    if not args.info:
+        since_ms = int(datetime.strptime(args.since, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp() * 1000)
+        data = sync_history(args.symbol, args.timeframe, since_ms, cache)
+        print(f"{args.symbol} {args.timeframe}: {args.since} 之後共 {len(data)} 根K線")
+    for name, count, first_ts, last_ts in cache.entries():
+        print(f"{name}: {count} 根，{_format_ts(first_ts)} ~ {_format_ts(last_ts)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+K 線收盤對齊的排程器。
+
+主循環不再固定每 LOOP_INTERVAL_SECONDS 輪詢一次，而是由 CandleScheduler 決定下一次喚醒：
+- close：K 線收盤後 settle 秒（等交易所完成收盤K線），執行以收盤為準的規則（RSI 平倉、收盤進場判斷等）
+- intrabar：兩次收盤之間每 intrabar 秒一次，處理移動止損、止損止盈更新等盤中檢查
+收盤點與盤中檢查時間重疊時只喚醒一次；收盤後 settle 期間不安排盤中檢查，避免以尚未定案的K線判斷。
+K 線邊界以 UTC 對齊（與 Binance 相同：日以下週期從 epoch 起算，週K線從週一 00:00，月K線從每月 1 日）。
+"""
+import asyncio
+import time
+from datetime import datetime, timezone
+
+from candle_cache import timeframe_ms
+
+CLOSE = "close"
+INTRABAR = "intrabar"
+WEEK_OFFSET_MS = 4 * 86400 * 1000  # 1970-01-01 為週四，週K線從週一 00:00 UTC 開始
+
+
+def _month_start(year, month):
+    return int(datetime(year, month, 1, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def candle_open_ms(ts_ms, timeframe):
+    """ts_ms 所在K線的開盤時間（毫秒）。"""
+    if timeframe.endswith("M"):
+        months = int(timeframe[:-1] or 1)
+        dt = datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc)
+        index = (dt.year * 12 + dt.month - 1) // months * months
+        return _month_start(index // 12, index % 12 + 1)
+    period = timeframe_ms(timeframe)
+    offset = WEEK_OFFSET_MS if timeframe.endswith("w") else 0
+    return (int(ts_ms) - offset) // period * period + offset
+
+
+def next_candle_close_ms(ts_ms, timeframe):
+    """ts_ms 所在K線的收盤時間（= 下一根K線的開盤時間，毫秒）。"""
+    open_ms = candle_open_ms(ts_ms, timeframe)
+    if timeframe.endswith("M"):
+        months = int(timeframe[:-1] or 1)
+        dt = datetime.fromtimestamp(open_ms / 1000, tz=timezone.utc)
+        index = dt.year * 12 + dt.month - 1 + months
+        return _month_start(index // 12, index % 12 + 1)
+    return open_ms + timeframe_ms(timeframe)
+
+
+class CandleScheduler:
+    """
+    單一交易對的喚醒排程。next_wake() 只做計算不等待，wait() 等到下一次喚醒並回傳 (種類, 對應的收盤時間毫秒)。
+    啟動時視目前K線之前的收盤為已處理；clock 可替換（測試用），需回傳 epoch 秒。
+    """
+
+    def __init__(self, timeframe, settle_seconds, intrabar_seconds, clock=time.time):
+        self.timeframe = timeframe
+        self.settle_ms = int(settle_seconds * 1000)
+        self.intrabar_ms = int(intrabar_seconds * 1000) if intrabar_seconds else None
+        self.clock = clock
+        self.last_close_ms = candle_open_ms(self._now_ms(), timeframe)  # 已處理過的最後一個收盤時間
+
+    def _now_ms(self):
+        return int(self.clock() * 1000)
+
+    def next_wake(self, now_ms=None):
+        """
+        回傳 (喚醒時間毫秒, 種類, 收盤時間毫秒)。
+        尚未處理的收盤（含仍在 settle 期間的收盤）優先；盤中檢查只安排在下一個收盤之前。
+        """
+        now_ms = self._now_ms() if now_ms is None else now_ms
+        pending_ms = candle_open_ms(now_ms, self.timeframe)
+        if pending_ms > self.last_close_ms:
+            return max(now_ms, pending_ms + self.settle_ms), CLOSE, pending_ms
+        close_ms = next_candle_close_ms(now_ms, self.timeframe)
+        if self.intrabar_ms is not None and now_ms + self.intrabar_ms < close_ms:
+            return now_ms + self.intrabar_ms, INTRABAR, close_ms
+        return close_ms + self.settle_ms, CLOSE, close_ms
+
+    async def wait(self, wakeup=None):
+        """
+        等到下一次喚醒，回傳 (種類, 收盤時間毫秒)。
+        wakeup（asyncio.Event）被設定時提前返回（例如 WebSocket 推送），此時已過收盤檢查點則回傳 CLOSE，否則 INTRABAR。
+        """
+        wake_ms, kind, close_ms = self.next_wake()
+        delay = max(0.0, (wake_ms - self._now_ms()) / 1000)
+        woken = False
+        if wakeup is None:
+            await asyncio.sleep(delay)
+        else:
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=delay)
+                wakeup.clear()
+                woken = True
+            except asyncio.TimeoutError:
+                pass
+        if woken:
+            wake_ms, kind, close_ms = self.next_wake()
+            if kind != CLOSE or wake_ms > self._now_ms():
+                return INTRABAR, close_ms
+        if kind == CLOSE:
+            self.last_close_ms = max(self.last_close_ms, close_ms)
+        return kind, close_ms
@@ -0,0 +1,157 @@
+"""
+K 線環形緩衝區（每個 symbol/timeframe 一份），避免每輪重新抓取 100 根 K 線。
+
+- CandleStore：NumPy 固定容量環形緩衝區，只追加新 K 線或覆寫最後一根（未收盤）K 線
+- CandleFeed：共用同一個 ccxt 非同步交易所實例，首次以 limit 播種，之後以 since 只補最新 K 線；
+  指定 CandleCache 時改由本地快取播種（只下載快取最後一根之後的 K 線），並把新收盤的 K 線寫回快取
+"""
+import numpy as np
+import ccxt.async_support as ccxt_async
+
+from candle_cache import closed_rows, sync_latest
+
+OHLCV_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+DEFAULT_CAPACITY = 100  # 緩衝區保留的 K 線數量（與原本 fetch_ohlcv 的 limit=100 一致）
+
+
+class CandleStore:
+    """
+    固定容量的 OHLCV 環形緩衝區。
+
+    內部使用雙倍長度陣列：每根 K 線同時寫入 i 與 i + capacity，
+    因此任何時刻最近 N 根 K 線都是一段連續記憶體，view() 不需要重新排列。
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self._buf = np.zeros((capacity * 2, len(OHLCV_COLUMNS)), dtype=np.float64)
+        self._head = 0  # 下一根 K 線寫入位置（0 ~ capacity-1）
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def last_timestamp(self):
+        """最後一根 K 線的開盤時間（毫秒），緩衝區為空時回傳 None。"""
+        if self._size == 0:
+            return None
+        return int(self._buf[self._head - 1 + self.capacity, 0])
+
+    def _write(self, pos, row):
+        self._buf[pos] = row
+        self._buf[pos + self.capacity] = row
+
+    def clear(self):
+        self._head = 0
+        self._size = 0
+
+    def update(self, rows):
+        """
+        合併交易所回傳的 K 線（依時間排序的 [ts, o, h, l, c, v] 列表）：
+        與最後一根同時間者覆寫（K 線尚未收盤時價格會變動），較新者追加，較舊者忽略。
+        回傳新追加的 K 線數量。
+        """
+        appended = 0
+        for row in rows:
+            ts = row[0]
+            last_ts = self.last_timestamp
+            if last_ts is not None and ts == last_ts:
+                self._write((self._head - 1) % self.capacity, row)
+            elif last_ts is None or ts > last_ts:
+                self._write(self._head, row)
+                self._head = (self._head + 1) % self.capacity
+                self._size = min(self._size + 1, self.capacity)
+                appended += 1
+        return appended
+
+    def apply_price(self, price):
+        """
+        以最新成交價更新最後一根（未收盤）K 線的收盤價與高低點（WebSocket ticker 推送時使用）。
+        """
+        if self._size == 0:
+            return
+        pos = (self._head - 1) % self.capacity
+        row = self._buf[pos].copy()
+        row[4] = price
+        row[2] = max(row[2], price)
+        row[3] = min(row[3], price)
+        self._write(pos, row)
+
+    def view(self):
+        """依時間排序的 (N, 6) 唯讀視圖（不複製）。"""
+        end = self._head + self.capacity
+        view = self._buf[end - self._size:end]
+        view.flags.writeable = False
+        return view
+
+    def to_array(self):
+        """依時間排序的 (N, 6) 陣列副本，呼叫端可自由修改。"""
+        return np.array(self.view())
+
+
+class CandleFeed:
+    """
+    多個 CandleStore 的集合，所有 symbol/timeframe 共用同一個 ccxt 交易所實例。
+    cache 為 candle_cache.CandleCache（可為 None，表示不使用本地快取）。
+    """
+
+    def __init__(self, exchange=None, capacity=DEFAULT_CAPACITY, cache=None):
+        self.exchange = exchange if exchange is not None else ccxt_async.binance({'enableRateLimit': True})
+        self.capacity = capacity
+        self.cache = cache
+        self.stores = {}
+        self._persisted = {}  # (symbol, timeframe) -> 最後寫入快取的 K 線時間
+
+    def store(self, symbol, timeframe):
+        key = (symbol, timeframe)
+        if key not in self.stores:
+            self.stores[key] = CandleStore(self.capacity)
+        return self.stores[key]
+
+    async def refresh(self, symbol, timeframe):
+        """
+        更新指定交易對的 K 線並回傳對應的 CandleStore。
+        首次（或落後超過緩衝區容量時）抓取最近 capacity 根播種，之後只從最後一根開始補。
+        """
+        store = self.store(symbol, timeframe)
+        if len(store) > 0:
+            rows = await self.exchange.fetch_ohlcv(symbol, timeframe=timeframe, since=store.last_timestamp)
+            if len(rows) < self.capacity:
+                store.update(rows)
+                self.persist(symbol, timeframe)
+                return store
+            # 落後太多（例如長時間斷線），直接重新播種
+            store.clear()
+        if self.cache is not None:
+            # 由本地快取播種：只下載快取最後一根之後的已收盤 K 線，再補上最新（未收盤）K 線
+            await sync_latest(self.cache, self.exchange, symbol, timeframe, self.capacity)
+            store.update(self.cache.tail(symbol, timeframe, self.capacity).tolist())
+            if len(store) > 0:
+                rows = await self.exchange.fetch_ohlcv(symbol, timeframe=timeframe, since=store.last_timestamp)
+                store.update(rows)
+                return store
+        rows = await self.exchange.fetch_ohlcv(symbol, timeframe=timeframe, limit=self.capacity)
+        store.update(rows)
+        return store
+
+    def persist(self, symbol, timeframe):
+        """把緩衝區中新收盤的 K 線寫入本地快取（沒有設定快取時不做任何事）。"""
+        if self.cache is None:
+            return 0
+        key = (symbol, timeframe)
+        rows = closed_rows(self.store(symbol, timeframe).view().tolist(), timeframe)
+        # 最後一根已收盤 K 線沒變時不必開啟快取檔
+        if not rows or self._persisted.get(key) == rows[-1][0]:
+            return 0
+        written = self.cache.append(symbol, timeframe, rows)
+        self._persisted[key] = rows[-1][0]
+        return written
+
+    async def fetch(self, symbol, timeframe):
+        """更新後回傳 (N, 6) 陣列副本，格式與 np.array(exchange.fetch_ohlcv(...)) 相同。"""
+        store = await self.refresh(symbol, timeframe)
+        return store.to_array()
+
+    async def close(self):
+        await self.exchange.close()
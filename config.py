@@ -1,27 +1,67 @@
-MARGIN_COIN = "USDT"  # 保證金幣種
-BITUNIX_API_KEY =""  # Bitunix API 金鑰
-BITUNIX_SECRET_KEY =""  # Bitunix Secret 金鑰
-DISCORD_WEBHOOK_URL =""  # DC通知(PC版:編輯頻道->整合->webhook->新webhook->複製網址)
-TRADING_PAIR = "ETH/USDT"  # 交易對
-SYMBOL = "ETHUSDT"  # 交易符號
-LEVERAGE = 20# 槓桿
-WALLET_PERCENTAGE = 0.8 # 每次下單使用錢包的%數->1.00=錢包的100%
-LOOP_INTERVAL_SECONDS =20# 主循環執行間隔（秒）
-# 技術指標參數
-STOP_MULT = 1.0  # 停損倍數
-LIMIT_MULT = 4 # 限制倍數
-RSI_BUY = 47  # RSI 買入指標
-RSI_LEN = 12 # RSI 長度
-EXIT_RSI = 44 # 退出 RSI
-BREAKOUT_LOOKBACK = 3# 突破回看
-ATR_LEN = 12  # ATR 長度
-ATR_MULT = 3.25  # ATR 倍數
-TIMEFRAME = "4h"  # 時間框架
-QUANTITY_PRECISION = 4 # 交易數量四捨五入小數位數
-# === 空單參數 ===
-rsiSell = 53  # RSI 空單進場閾值
-exitRSI_short = 51  # RSI 空單平倉閾值
-CONDITIONAL_ORDER_MAX_RETRIES = 3  # 條件單自動重試最大次數
-CONDITIONAL_ORDER_RETRY_INTERVAL = 2  # 條件單重試間隔（秒）
-DISCORD_BOT_TOKEN = ""
-DISCORD_CHANNEL_ID =  # 請填入你的 Discord 頻道ID（整數）
+MARGIN_COIN = "USDT"  # 保證金幣種
+BITUNIX_API_KEY =""  # Bitunix API 金鑰
+BITUNIX_SECRET_KEY =""  # Bitunix Secret 金鑰
+DISCORD_WEBHOOK_URL =""  # DC通知(PC版:編輯頻道->整合->webhook->新webhook->複製網址)
+DISCORD_NOTIFY_BATCH_DELAY = 1.0  # Webhook 通知合併等待秒數（同時發生的通知最多 10 則合併成一次請求）
+TRADING_PAIR = "ETH/USDT"  # 交易對
+SYMBOL = "ETHUSDT"  # 交易符號
+SYMBOLS = [SYMBOL]  # 同時交易的交易符號列表，例如 ["ETHUSDT", "BTCUSDT"]；可用 dict 覆寫個別參數：{"symbol": "BTCUSDT", "leverage": 10, "wallet_percentage": 0.2, "quantity_precision": 3}
+LEVERAGE = 20# 槓桿
+WALLET_PERCENTAGE = 0.8 # 每次下單使用錢包的%數->1.00=錢包的100%
+LOOP_INTERVAL_SECONDS = 60  # 盤中檢查間隔（秒）：移動止損、止損止盈更新與盤中進場判斷；K線收盤時另有對齊收盤時間的喚醒
+CANDLE_CLOSE_SETTLE_SECONDS = 2  # K線收盤後等待幾秒再執行收盤規則（RSI 平倉等），讓交易所完成收盤K線
+# 技術指標參數
+STOP_MULT = 1.0  # 停損倍數
+LIMIT_MULT = 4 # 限制倍數
+RSI_BUY = 47  # RSI 買入指標
+RSI_LEN = 12 # RSI 長度
+EXIT_RSI = 44 # 退出 RSI
+BREAKOUT_LOOKBACK = 3# 突破回看
+ATR_LEN = 12  # ATR 長度
+ATR_MULT = 3.25  # ATR 倍數
+TIMEFRAME = "4h"  # 時間框架
+QUANTITY_PRECISION = 4 # 交易數量四捨五入小數位數
+# === 空單參數 ===
+rsiSell = 53  # RSI 空單進場閾值
+exitRSI_short = 51  # RSI 空單平倉閾值
+# === 策略規則 ===
+STRATEGIES = None  # None=內建 RSI 多單 / 突破多單 / RSI 空單 / 突破空單；自訂時為策略列表（規則格式見 rule_engine.load_strategies），列表順序即進場優先權
+CONDITIONAL_ORDER_MAX_RETRIES = 3  # 條件單自動重試最大次數
+CONDITIONAL_ORDER_RETRY_INTERVAL = 2  # 條件單重試間隔（秒）
+DISCORD_BOT_TOKEN = ""
+DISCORD_CHANNEL_ID =  # 請填入你的 Discord 頻道ID（整數）
+POSITION_MESSAGE_MIN_INTERVAL = 60  # 持倉訊息兩次編輯的最短間隔（秒）；持倉開平倉時不受限制
+# === 行情來源 ===
+MARKET_DATA_MODE = "rest"  # "rest"=K線收盤與每 LOOP_INTERVAL_SECONDS 盤中檢查時輪詢；"websocket"=Binance WebSocket 即時推送（斷線自動重連並以 REST 補資料）
+STREAM_MIN_EVAL_INTERVAL = 2  # WebSocket 模式下兩次策略評估的最短間隔（秒），避免每則推送都觸發 REST 查詢
+# === 回測 ===
+BACKTEST_INITIAL_CAPITAL = 1000  # 回測初始資金（USDT）
+BACKTEST_FEE_RATE = 0.0006  # 回測手續費率（每邊，taker）
+# === 本地K線快取 ===
+CANDLE_CACHE_DIR = "candle_cache"  # 本地K線快取目錄（回測、參數最佳化與實盤共用）
+CANDLE_CACHE_ENABLED = True  # 實盤啟動時是否由本地快取播種K線並寫回新收盤的K線
+# === 狀態儲存 ===
+STATE_DB_FILE = "state.db"  # 勝負統計、持倉進場方式、已通知平倉單等狀態（SQLite，首次啟動自動匯入舊 JSON 檔）
+# === 事件日誌 ===
+EVENT_LOG_FILE = "events.jsonl"  # 交易事件日誌（每行一筆 JSON，只追加）
+EVENT_LOG_MAX_BYTES = 10 * 1024 * 1024  # 超過此大小即輪替並以 gzip 壓縮
+EVENT_LOG_BACKUP_COUNT = 5  # 保留的壓縮舊檔數量
+# === 請求速率 ===
+BITUNIX_RATE_LIMIT = 10  # 每秒最多送出的 Bitunix 請求數（所有交易對共用）
+BITUNIX_RATE_BURST = 20  # 瞬間最多可連續送出的 Bitunix 請求數
+BITUNIX_ENDPOINT_LIMITS = None  # 每個帳戶各端點群組的額度 {群組: (每秒請求數, 瞬間上限)}，群組為 trade/tpsl/position/account/history；None 使用 bitunix_client 內建的保守預設值
+# === 私有頻道推送 ===
+PRIVATE_STREAM_ENABLED = True  # 訂閱 Bitunix 私有 WebSocket（訂單/持倉/止盈止損），以推送取代下單後的輪詢；斷線時自動退回 REST 輪詢
+PRIVATE_STREAM_WAIT_SECONDS = 3  # 下單後等待推送的最長時間（秒），逾時改以 REST 輪詢查詢
+# === 延遲指標 ===
+METRICS_PORT = 9108  # 本地 Prometheus /metrics 連接埠（只綁定 127.0.0.1），0 表示不啟動
+METRICS_TEXTFILE = ""  # node_exporter textfile collector 的 .prom 檔路徑，空字串表示不寫入
+METRICS_TEXTFILE_INTERVAL = 15  # 寫入 textfile 的間隔（秒）
+# === 模擬交易 ===
+PAPER_TRADING = False  # True 時下單、止盈止損與持倉/餘額查詢改由程式內的模擬撮合引擎處理（paper_trading.py），以K線觸發盤中止盈止損，不送出真實訂單
+PAPER_INITIAL_BALANCE = 1000  # 模擬帳戶初始可用餘額（USDT）
+PAPER_FEE_RATE = 0.0006  # 模擬成交手續費率（每邊，taker）
+PAPER_STATE_DIR = "paper"  # 模擬交易的帳戶、狀態資料庫與事件日誌目錄，與實盤檔案分開
+# === 多帳戶跟單 ===
+FOLLOWER_ACCOUNTS = []  # 跟單子帳戶：主帳戶的進場、RSI 平倉與止損調整同時送往這些帳戶，例如 [{"name": "sub1", "api_key": "...", "secret_key": "...", "wallet_percentage": 0.5, "leverage": 10}]（後兩項可省略，沿用交易對設定）
+FANOUT_MAX_CONCURRENCY = 4  # 同時送出請求的跟單帳戶數上限
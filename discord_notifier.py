@@ -0,0 +1,170 @@
+"""
+Discord Webhook 背景通知佇列。
+
+交易流程只需呼叫 notify() 把已組好的 Embed 放進佇列（不做任何網路 I/O），
+背景 task 負責送出：
+- 每次 Webhook 請求最多合併 10 個 Embed，且所有 Embed 的總字數不超過 6000（皆為 Discord 上限）
+- 帶 coalesce_key 的通知（例如同一交易對的狀態更新）尚未送出前若有新的一筆，直接以新內容取代
+- 收到 429 時依回應的 retry_after 等待後重送同一批，其他錯誤以退避重試，超過次數才放棄
+- 佇列已滿時捨棄最舊的一筆，避免 Discord 長時間無法連線時佔用記憶體
+"""
+import asyncio
+from collections import OrderedDict
+from itertools import count
+
+import aiohttp
+
+from bitunix_client import get_shared_session
+from metrics import DISCORD_WEBHOOK_SECONDS
+
+MAX_EMBEDS_PER_MESSAGE = 10  # Discord 每則訊息最多 10 個 Embed
+MAX_EMBED_CHARS_PER_MESSAGE = 6000  # Discord 每則訊息所有 Embed 的標題、內文、欄位、頁尾、作者總字數上限
+DEFAULT_BATCH_DELAY = 1.0  # 收到第一筆通知後等待多久再送出，讓同時發生的通知合併成一次請求（秒）
+DEFAULT_MAX_PENDING = 200  # 佇列上限
+MAX_SEND_ATTEMPTS = 5  # 非 429 錯誤的最多嘗試次數
+REQUEST_TIMEOUT_SECONDS = 10
+
+
+class DiscordNotifier:
+    """
+    Webhook 通知佇列。webhook_url 為空字串時 notify() 不做任何事。
+    """
+
+    def __init__(self, webhook_url, batch_delay=DEFAULT_BATCH_DELAY, max_pending=DEFAULT_MAX_PENDING, session=None):
+        self.webhook_url = webhook_url
+        self.batch_delay = batch_delay
+        self.max_pending = max_pending
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self._session = session
+        self._pending = OrderedDict()  # key -> embed dict（依放入順序）
+        self._keys = count()
+        self._wakeup = None
+        self._idle = None
+        self._task = None
+
+    def notify(self, embed, coalesce_key=None):
+        """
+        放入一個 Embed（discord.Embed 或 dict），立即返回。
+        coalesce_key 相同且尚未送出的舊通知會被取代，位置維持在原本的順序。
+        """
+        if not self.webhook_url:
+            return
+        if hasattr(embed, "to_dict"):
+            embed = embed.to_dict()
+        embed = _fit_embed(embed)
+        if coalesce_key is not None and coalesce_key in self._pending:
+            self._pending[coalesce_key] = embed
+            self.coalesced += 1
+            return
+        key = coalesce_key if coalesce_key is not None else next(self._keys)
+        self._pending[key] = embed
+        if len(self._pending) > self.max_pending:
+            self._pending.popitem(last=False)
+            self.dropped += 1
+        self._ensure_worker()
+        self._idle.clear()
+        self._wakeup.set()
+
+    def _ensure_worker(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._idle = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            if not self._pending:
+                self._idle.set()
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            await asyncio.sleep(self.batch_delay)
+            batch = []
+            batch_chars = 0
+            while self._pending and len(batch) < MAX_EMBEDS_PER_MESSAGE:
+                chars = embed_length(next(iter(self._pending.values())))
+                if batch and batch_chars + chars > MAX_EMBED_CHARS_PER_MESSAGE:
+                    break
+                batch.append(self._pending.popitem(last=False)[1])
+                batch_chars += chars
+            with DISCORD_WEBHOOK_SECONDS.time():
+                await self._send(batch)
+
+    async def _send(self, embeds):
+        """送出一批 Embed；429 依 retry_after 等待後重送，不計入嘗試次數。"""
+        session = self._session or get_shared_session()
+        attempt = 0
+        while True:
+            try:
+                async with session.post(self.webhook_url, json={"embeds": embeds},
+                                        timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT_SECONDS)) as response:
+                    if response.status == 429:
+                        await asyncio.sleep(await _retry_after(response))
+                        continue
+                    response.raise_for_status()
+                    self.sent += len(embeds)
+                    return True
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                attempt += 1
+                if attempt >= MAX_SEND_ATTEMPTS:
+                    print(f"Discord 發送失敗，已放棄 {len(embeds)} 則通知: {e}")
+                    self.dropped += len(embeds)
+                    return False
+                print(f"Discord 發送失敗（第 {attempt} 次），稍後重試: {e}")
+                await asyncio.sleep(min(2 ** attempt, 30))
+
+    async def flush(self, timeout=REQUEST_TIMEOUT_SECONDS):
+        """等待佇列送完（關閉程式前呼叫），逾時則放棄剩餘通知。"""
+        if self._task is None or self._task.done() or not self._pending and self._idle.is_set():
+            return
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Discord 通知佇列在 {timeout} 秒內未送完，剩餘 {len(self._pending)} 則")
+
+    async def close(self, timeout=REQUEST_TIMEOUT_SECONDS):
+        await self.flush(timeout)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def embed_length(embed):
+    """Embed 計入 Discord 6000 字上限的字數：標題、內文、各欄位名稱與值、頁尾、作者名稱。"""
+    total = len(embed.get("title") or "") + len(embed.get("description") or "")
+    for field in embed.get("fields") or ():
+        total += len(field.get("name") or "") + len(field.get("value") or "")
+    total += len((embed.get("footer") or {}).get("text") or "")
+    total += len((embed.get("author") or {}).get("name") or "")
+    return total
+
+
+def _fit_embed(embed):
+    """單一 Embed 超過 6000 字時截短內文，避免整批被 Discord 以 400 拒絕。"""
+    excess = embed_length(embed) - MAX_EMBED_CHARS_PER_MESSAGE
+    if excess <= 0:
+        return embed
+    embed = dict(embed)
+    description = embed.get("description") or ""
+    embed["description"] = description[:max(len(description) - excess - 1, 0)] + "…"
+    return embed
+
+
+async def _retry_after(response):
+    """429 回應的等待秒數：優先使用 JSON 的 retry_after，其次 Retry-After 標頭。"""
+    try:
+        data = await response.json(content_type=None)
+        return max(float(data.get("retry_after", 1.0)), 0.0)
+    except Exception:
+        pass
+    try:
+        return max(float(response.headers.get("Retry-After", 1.0)), 0.0)
+    except ValueError:
+        return 1.0
@@ -0,0 +1,166 @@
+"""
+交易事件日誌：只追加的 JSON Lines 檔案，並以 (事件類型, positionId) 建立記憶體索引。
+
+- 每筆事件寫成一行 JSON（ts / time / type / symbol / position_id / message），檔案保持開啟，不會每次重開
+- latest(event_type, position_id) 為 O(1) 查詢，取代原本重寫 log.txt 只保留最新一筆止損/止盈調整的做法
+- 檔案超過 max_bytes 時輪替並以 gzip 壓縮（events.jsonl.1.gz、.2.gz ...），最多保留 backup_count 份
+- 索引在輪替與關閉時寫入 {path}.index.json，重啟時載入後只需掃描目前這一份檔案
+
+使用方式：
+    python event_journal.py --last 20                         # 最近 20 筆事件
+    python event_journal.py --type 開倉成功 --symbol ETHUSDT   # 篩選事件類型 / 交易對
+    python event_journal.py --position 123456 --archives      # 指定 positionId，包含已壓縮的舊檔
+"""
+import argparse
+import gzip
+import json
+import os
+import shutil
+import time
+from collections import deque
+
+from config import EVENT_LOG_FILE, EVENT_LOG_MAX_BYTES, EVENT_LOG_BACKUP_COUNT
+
+
+class EventJournal:
+    """
+    只追加的事件日誌。index 只保存每個 (事件類型, positionId) 的最新一筆事件。
+    """
+
+    def __init__(self, path=EVENT_LOG_FILE, max_bytes=EVENT_LOG_MAX_BYTES, backup_count=EVENT_LOG_BACKUP_COUNT):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.index = {}
+        self._file = None
+        self._size = 0
+        self._load_index()
+
+    @property
+    def index_path(self):
+        return self.path + ".index.json"
+
+    def _load_index(self):
+        """載入輪替時保存的索引，再掃描目前的檔案補上之後的事件。"""
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for record in json.load(f):
+                    self._index(record)
+        except (FileNotFoundError, ValueError):
+            pass
+        for record in read_records(self.path):
+            self._index(record)
+
+    def _index(self, record):
+        if record.get("position_id") is not None:
+            self.index[(record["type"], str(record["position_id"]))] = record
+
+    def _save_index(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(list(self.index.values()), f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+
+    def _open(self):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "ab")
+            self._size = self._file.tell()
+        return self._file
+
+    def append(self, event_type, message, symbol=None, position_id=None):
+        """寫入一筆事件並更新索引，回傳事件 dict。"""
+        now = time.time()
+        record = {
+            "ts": round(now, 3),
+            "time": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now)),
+            "type": event_type,
+            "symbol": symbol,
+            "position_id": None if position_id is None else str(position_id),
+            "message": message,
+        }
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        f = self._open()
+        if self._size > 0 and self._size + len(line) > self.max_bytes:
+            self.rotate()
+            f = self._open()
+        f.write(line)
+        f.flush()
+        self._size += len(line)
+        self._index(record)
+        return record
+
+    def latest(self, event_type, position_id):
+        """指定事件類型與 positionId 的最新一筆事件（沒有則回傳 None）。"""
+        return self.index.get((event_type, str(position_id)))
+
+    def rotate(self):
+        """目前的檔案改名為 .1.gz（舊檔依序往後移），並保存索引。"""
+        self.close()
+        if not os.path.exists(self.path):
+            return
+        self._save_index()
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{i}.gz"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}.gz")
+        if self.backup_count > 0:
+            with open(self.path, "rb") as src, gzip.open(f"{self.path}.1.gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+        os.remove(self.path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._save_index()
+
+
+def read_records(path):
+    """逐行讀取事件檔（.gz 自動解壓），忽略寫到一半的最後一行。"""
+    opener = gzip.open if path.endswith(".gz") else open
+    try:
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        return
+
+
+def archive_paths(path, backup_count=EVENT_LOG_BACKUP_COUNT):
+    """由舊到新的壓縮檔路徑（不含目前的檔案）。"""
+    paths = [f"{path}.{i}.gz" for i in range(backup_count, 0, -1)]
+    return [p for p in paths if os.path.exists(p)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查詢交易事件日誌")
+    parser.add_argument("--path", default=EVENT_LOG_FILE, help="事件日誌檔案")
+    parser.add_argument("--type", help="事件類型，例如 開倉成功")
+    parser.add_argument("--symbol", help="交易符號，例如 ETHUSDT")
+    parser.add_argument("--position", help="positionId")
+    parser.add_argument("--last", type=int, default=50, help="只顯示最後 N 筆")
+    parser.add_argument("--archives", action="store_true", help="包含已輪替壓縮的舊檔")
+    args = parser.parse_args()
+
+    paths = (archive_paths(args.path) if args.archives else []) + [args.path]
+    matched = deque(maxlen=args.last)
+    for path in paths:
+        for record in read_records(path):
+            if args.type and record.get("type") != args.type:
+                continue
+            if args.symbol and record.get("symbol") != args.symbol:
+                continue
+            if args.position and record.get("position_id") != args.position:
+                continue
+            matched.append(record)
+    for record in matched:
+        symbol = f"{record['symbol']} " if record.get("symbol") else ""
+        print(f"[{record['time']}] [{record['type']}] {symbol}{record['message']}")
+
+
+if __name__ == "__main__":
+    main()
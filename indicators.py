@@ -0,0 +1,420 @@
+"""
+增量式技術指標引擎（RSI / ATR / 突破高低點）。
+
+compute_indicators 每輪都用 TA-Lib 與 pandas rolling 重算整段 K 線，但實際上只有最後一根 K 線在變動。
+IncrementalIndicators 保存 Wilder 平滑狀態與突破視窗的單調佇列：
+- update()：更新最後一根（未收盤）K 線，O(1)
+- commit()：K 線收盤後併入狀態，均攤 O(1)
+另提供 indicator_series() / indicator_arrays() 一次計算整段歷史 K 線的指標序列（回測 / 參數最佳化使用）。
+RSI 觸發價：前一根收盤後 Wilder 平均已固定，目前 K 線的 RSI 只隨收盤價單調變動，
+因此每根 K 線收盤時反解一次 RSI 公式，得到 RSI 剛好等於各門檻的收盤價（rsi_prices），
+盤中每筆報價只需與觸發價比較，不必重算指標。
+計算步驟與 TA-Lib（ta_RSI.c / ta_ATR.c）逐步相同，結果與對同一段 K 線執行 talib.RSI / talib.ATR 一致
+（TA-Lib 0.6.x 逐位元相同；0.8 起改用倒數乘法 / FMA 計算，最後一位小數可能不同，因此以 VERIFY_RTOL 相對誤差比對）。
+
+驗證：python indicators.py --verify（同時檢查 RSI 觸發價），或 python -m pytest -q tests/test_indicators.py
+每筆報價的前處理耗時與記憶體配置（與舊版 pandas 流程比較）：python indicators.py --bench
+"""
+import argparse
+import time
+import tracemalloc
+from collections import deque
+
+import numpy as np
+
+# TA-Lib 的 TA_IS_ZERO 判斷門檻
+_TA_EPSILON = 0.00000001
+# --verify 與 TA-Lib 比對的相對誤差上限（約數十個 ulp，足以涵蓋不同 TA-Lib 版本的浮點運算順序差異）
+VERIFY_RTOL = 1e-12
+
+
+def _rsi_from(avg_gain, avg_loss):
+    total = avg_gain + avg_loss
+    if -_TA_EPSILON < total < _TA_EPSILON:
+        return 0.0
+    return 100.0 * (avg_gain / total)
+
+
+class IncrementalIndicators:
+    """
+    單一交易對的增量指標狀態。
+
+    rsi / atr / highest_break / lowest_break 為「目前這根（最後一根）K 線」的指標值，
+    暖機期間（K 線數不足）為 None，對應 TA-Lib / pandas 輸出的 NaN。
+    highest_break / lowest_break 只取前 breakout_len 根已收盤 K 線（等同 shift(1).rolling(breakout_len)）。
+    closed_rsi 為最近一根已收盤 K 線的最終 RSI（K 棒收盤時的 RSI 平倉判斷使用）。
+    rsi_levels 為 {名稱: RSI 門檻}，rsi_prices 為目前 K 線對應的 {名稱: 觸發價}（見 rsi_price），暖機期間為空 dict。
+    """
+
+    def __init__(self, rsi_len, atr_len, breakout_len, rsi_levels=None):
+        self.rsi_len = rsi_len
+        self.atr_len = atr_len
+        self.breakout_len = breakout_len
+        self.rsi_levels = dict(rsi_levels or {})
+        self.reset()
+
+    def reset(self):
+        # 已收盤（committed）K 線的狀態
+        self.committed = 0  # 已收盤 K 線數
+        self._prev_close = None
+        self._gain = 0.0  # 暖機期間為累計和，暖機完成後為 Wilder 平均
+        self._loss = 0.0
+        self._tr_sum = 0.0  # ATR 暖機期間的 TR 累計和
+        self._atr = None  # 暖機完成後的 Wilder ATR
+        self._highs = deque()  # (索引, high) 單調遞減佇列
+        self._lows = deque()  # (索引, low) 單調遞增佇列
+        self.closed_rsi = None
+        # 目前（未收盤）K 線
+        self.timestamp = None
+        self._bar = None
+        self._next_gain = self._next_loss = None
+        self._next_tr_sum = self._next_atr = None
+        self.rsi = None
+        self.atr = None
+        self.highest_break = None
+        self.lowest_break = None
+        self.rsi_prices = {}
+
+    def update(self, timestamp, high, low, close):
+        """
+        更新目前 K 線。timestamp 與目前 K 線相同時覆寫（盤中價格變動），
+        較新時先將目前 K 線收盤（commit）再開始新 K 線。
+        """
+        if self.timestamp is not None and timestamp > self.timestamp:
+            self.commit()
+        self.timestamp = timestamp
+        self._bar = (high, low, close)
+        n = self.committed  # 目前 K 線的索引
+        self._next_gain = self._next_loss = None
+        self._next_tr_sum = self._next_atr = None
+        self.rsi = None
+        self.atr = None
+
+        if n > 0:
+            prev_close = self._prev_close
+            # --- RSI（ta_RSI.c）---
+            diff = close - prev_close
+            if n <= self.rsi_len:
+                gain, loss = self._gain, self._loss
+                if diff < 0:
+                    loss -= diff
+                else:
+                    gain += diff
+                if n == self.rsi_len:
+                    gain /= self.rsi_len
+                    loss /= self.rsi_len
+                    self.rsi = _rsi_from(gain, loss)
+            else:
+                loss = self._loss * (self.rsi_len - 1)
+                gain = self._gain * (self.rsi_len - 1)
+                if diff < 0:
+                    loss -= diff
+                else:
+                    gain += diff
+                loss /= self.rsi_len
+                gain /= self.rsi_len
+                self.rsi = _rsi_from(gain, loss)
+            self._next_gain, self._next_loss = gain, loss
+
+            # --- ATR（ta_TRANGE.c + ta_ATR.c）---
+            greatest = high - low
+            val2 = abs(prev_close - high)
+            if val2 > greatest:
+                greatest = val2
+            val3 = abs(low - prev_close)
+            if val3 > greatest:
+                greatest = val3
+            if n < self.atr_len:
+                self._next_tr_sum = self._tr_sum + greatest
+            elif n == self.atr_len:
+                self._next_atr = (self._tr_sum + greatest) / self.atr_len
+                self.atr = self._next_atr
+            else:
+                atr = self._atr * (self.atr_len - 1)
+                atr += greatest
+                atr /= self.atr_len
+                self._next_atr = atr
+                self.atr = atr
+
+        # --- 突破高低點：只看前 breakout_len 根已收盤 K 線 ---
+        if n >= self.breakout_len:
+            self.highest_break = self._highs[0][1]
+            self.lowest_break = self._lows[0][1]
+        else:
+            self.highest_break = None
+            self.lowest_break = None
+        return self
+
+    def commit(self):
+        """將目前 K 線視為已收盤，併入 Wilder 狀態與突破視窗。"""
+        if self._bar is None:
+            return
+        high, low, close = self._bar
+        n = self.committed
+        self.closed_rsi = self.rsi
+        if n > 0:
+            self._gain, self._loss = self._next_gain, self._next_loss
+            if n < self.atr_len:
+                self._tr_sum = self._next_tr_sum
+            else:
+                self._atr = self._next_atr
+        while self._highs and self._highs[-1][1] <= high:
+            self._highs.pop()
+        self._highs.append((n, high))
+        while self._lows and self._lows[-1][1] >= low:
+            self._lows.pop()
+        self._lows.append((n, low))
+        expire = n - self.breakout_len
+        if self._highs[0][0] <= expire:
+            self._highs.popleft()
+        if self._lows[0][0] <= expire:
+            self._lows.popleft()
+        self._prev_close = close
+        self.committed = n + 1
+        self._bar = None
+        self.rsi_prices = {name: self.rsi_price(level) for name, level in self.rsi_levels.items()}
+        if None in self.rsi_prices.values():
+            self.rsi_prices = {}
+
+    def rsi_price(self, level):
+        """
+        目前 K 線 RSI 剛好等於 level 時的收盤價：收盤價低於此價時 RSI < level，高於此價時 RSI > level。
+        只依已收盤 K 線的 Wilder 狀態計算；暖機期間（目前 K 線還算不出 RSI）或 level 不在 (0, 100) 時回傳 None。
+        回傳值可能 <= 0，代表任何正價格都在門檻之上。
+        """
+        n = self.committed
+        if n < self.rsi_len or not 0 < level < 100:
+            return None
+        # 與 update() 相同：gain' = (gain_base + 上漲幅度) / rsi_len，loss' = (loss_base + 下跌幅度) / rsi_len
+        if n == self.rsi_len:
+            gain_base, loss_base = self._gain, self._loss
+        else:
+            gain_base = self._gain * (self.rsi_len - 1)
+            loss_base = self._loss * (self.rsi_len - 1)
+        ratio = level / (100.0 - level)  # RSI = level 時 gain' / loss'
+        diff = ratio * loss_base - gain_base
+        if diff < 0:
+            # 門檻低於收平時的 RSI：觸發價在前收盤價之下
+            diff = loss_base - gain_base / ratio
+        return float(self._prev_close + diff)
+
+    def seed(self, ohlcv):
+        """以 (N, 6) K 線陣列重建狀態：前 N-1 根視為已收盤，最後一根為目前 K 線。"""
+        self.reset()
+        for row in ohlcv:
+            self.update(row[0], row[2], row[3], row[4])
+        return self
+
+    def sync(self, ohlcv):
+        """
+        與 K 線緩衝區同步：只處理目前 K 線及其後的新 K 線。
+        若緩衝區中找不到目前 K 線（例如重新播種或缺口），則整段重建。
+        """
+        if len(ohlcv) == 0:
+            return self
+        timestamps = ohlcv[:, 0]
+        if self.timestamp is None:
+            return self.seed(ohlcv)
+        idx = int(np.searchsorted(timestamps, self.timestamp))
+        if idx >= len(ohlcv) or timestamps[idx] != self.timestamp:
+            return self.seed(ohlcv)
+        for row in ohlcv[idx:]:
+            self.update(row[0], row[2], row[3], row[4])
+        return self
+
+
+INDICATOR_KINDS = ('rsi', 'atr', 'highest_break', 'lowest_break')
+
+
+def indicator_series(ohlcv, kind, length):
+    """
+    以 TA-Lib / pandas 計算整段 K 線的單一指標序列（與 compute_indicators 相同算法），暖機期間為 NaN。
+    kind 為 INDICATOR_KINDS 之一，length 為對應的 RSI_LEN / ATR_LEN / BREAKOUT_LOOKBACK。
+    """
+    import talib
+    import pandas as pd
+
+    high = np.ascontiguousarray(ohlcv[:, 2], dtype=np.float64)
+    low = np.ascontiguousarray(ohlcv[:, 3], dtype=np.float64)
+    close = np.ascontiguousarray(ohlcv[:, 4], dtype=np.float64)
+    if kind == 'rsi':
+        return talib.RSI(close, timeperiod=length)
+    if kind == 'atr':
+        return talib.ATR(high, low, close, timeperiod=length)
+    if kind == 'highest_break':
+        return pd.Series(high).shift(1).rolling(window=length).max().to_numpy()
+    if kind == 'lowest_break':
+        return pd.Series(low).shift(1).rolling(window=length).min().to_numpy()
+    raise ValueError(f"未知的指標類型: {kind}")
+
+
+def indicator_arrays(ohlcv, rsi_len, atr_len, breakout_len):
+    """
+    一次計算整段 K 線的 (rsi, atr, highest_break, lowest_break) 四個 float64 序列（回測使用）。
+    """
+    lengths = (rsi_len, atr_len, breakout_len, breakout_len)
+    return tuple(indicator_series(ohlcv, kind, length) for kind, length in zip(INDICATOR_KINDS, lengths))
+
+
+def verify_against_talib(ohlcv, rsi_len, atr_len, breakout_len, rtol=VERIFY_RTOL):
+    """
+    逐根 K 線比對 IncrementalIndicators 與 TA-Lib / pandas 的輸出（含盤中多次 update），
+    回傳相對誤差超過 rtol 的 K 線數量（0 代表一致；rtol=0 時要求逐位元相同）。
+    """
+    import talib
+    import pandas as pd
+
+    high, low, close = ohlcv[:, 2], ohlcv[:, 3], ohlcv[:, 4]
+    expected_rsi = talib.RSI(close, timeperiod=rsi_len)
+    expected_atr = talib.ATR(high, low, close, timeperiod=atr_len)
+    expected_high = pd.Series(high).shift(1).rolling(window=breakout_len).max().to_numpy()
+    expected_low = pd.Series(low).shift(1).rolling(window=breakout_len).min().to_numpy()
+
+    def same(value, expected):
+        if np.isnan(expected):
+            return value is None
+        return value is not None and bool(np.isclose(value, expected, rtol=rtol, atol=0.0))
+
+    engine = IncrementalIndicators(rsi_len, atr_len, breakout_len)
+    mismatches = 0
+    for i, row in enumerate(ohlcv):
+        # 模擬盤中：先以開盤價更新一次，再以最終值覆寫
+        engine.update(row[0], row[1], row[1], row[1])
+        engine.update(row[0], row[2], row[3], row[4])
+        if not (same(engine.rsi, expected_rsi[i]) and same(engine.atr, expected_atr[i])
+                and same(engine.highest_break, expected_high[i]) and same(engine.lowest_break, expected_low[i])):
+            mismatches += 1
+    return mismatches
+
+
+def verify_rsi_prices(ohlcv, rsi_len, levels, tolerance=1e-6):
+    """
+    逐根 K 線檢查 rsi_price：以觸發價更新目前 K 線時 RSI 應等於門檻（誤差 tolerance 內），
+    且以實際收盤價判斷的 RSI 與門檻大小關係和收盤價與觸發價的大小關係一致。回傳不一致的次數。
+    """
+    engine = IncrementalIndicators(rsi_len, 1, 1, {level: level for level in levels})
+    mismatches = 0
+    for row in ohlcv:
+        if engine.timestamp is not None and row[0] > engine.timestamp:
+            engine.commit()
+        for level, price in engine.rsi_prices.items():
+            if price > 0:
+                engine.update(row[0], row[2], row[3], price)
+                if abs(engine.rsi - level) > tolerance:
+                    mismatches += 1
+            engine.update(row[0], row[2], row[3], row[4])
+            if (engine.rsi < level) != (row[4] < price) and abs(engine.rsi - level) > tolerance:
+                mismatches += 1
+        engine.update(row[0], row[2], row[3], row[4])
+    return mismatches
+
+
+OHLCV_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+
+
+def _pandas_tick(buf, rsi_len, atr_len, breakout_len):
+    """舊版實盤流程：每筆報價建立 DataFrame、轉換時間欄位、以 TA-Lib / rolling 重算整段指標，再以 iloc 取出最後一根。"""
+    import talib
+    import pandas as pd
+
+    df = pd.DataFrame(buf, columns=OHLCV_COLUMNS)
+    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+    df["rsi"] = talib.RSI(df["close"], timeperiod=rsi_len)
+    df["atr"] = talib.ATR(df["high"], df["low"], df["close"], timeperiod=atr_len)
+    df["highest_break"] = df["high"].shift(1).rolling(window=breakout_len).max()
+    df["lowest_break"] = df["low"].shift(1).rolling(window=breakout_len).min()
+    return (df['timestamp'].iloc[-1], df['close'].iloc[-1], df['rsi'].iloc[-1], df['atr'].iloc[-1],
+            df['highest_break'].iloc[-1], df['lowest_break'].iloc[-1])
+
+
+def benchmark_tick_pipeline(ohlcv, rsi_len, atr_len, breakout_len, ticks=2000, window=100, seed=0):
+    """
+    比較每筆報價的訊號前處理：舊版 pandas 流程（_pandas_tick）與實盤目前的 NumPy 流程
+    （K 線緩衝區原地更新最後一根 + IncrementalIndicators.sync + 直接讀取純量）。
+    兩者處理相同的報價序列，回傳 {名稱: (每筆微秒, 每筆尖峰配置位元組)}；配置以 tracemalloc 另跑一次量測，不計入耗時。
+    """
+    rng = np.random.default_rng(seed)
+    base = np.array(ohlcv[-window:], dtype=np.float64)
+    prices = base[-1, 4] * np.exp(np.cumsum(rng.normal(0, 0.0005, ticks)))
+
+    def run(step, measure_memory=False):
+        buf = base.copy()  # 預先配置的 K 線緩衝區，報價只原地更新最後一根
+        state = {"engine": IncrementalIndicators(rsi_len, atr_len, breakout_len).seed(buf)}
+        peak = 0
+        start = time.perf_counter()
+        for price in prices:
+            last = buf[-1]
+            last[4] = price
+            if price > last[2]:
+                last[2] = price
+            if price < last[3]:
+                last[3] = price
+            if measure_memory:
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+                step(buf, state)
+                peak = max(peak, tracemalloc.get_traced_memory()[1] - baseline)
+            else:
+                step(buf, state)
+        return (time.perf_counter() - start) / ticks * 1e6, peak
+
+    def pandas_step(buf, state):
+        return _pandas_tick(buf, rsi_len, atr_len, breakout_len)
+
+    def numpy_step(buf, state):
+        engine = state["engine"].sync(buf)
+        return int(buf[-1, 0]), float(buf[-1, 4]), engine.rsi, engine.atr, engine.highest_break, engine.lowest_break
+
+    results = {}
+    for name, step in (("pandas", pandas_step), ("numpy", numpy_step)):
+        step(base, {"engine": IncrementalIndicators(rsi_len, atr_len, breakout_len).seed(base)})  # 暖機（載入模組）
+        micros, _ = run(step)
+        tracemalloc.start()
+        try:
+            _, peak = run(step, measure_memory=True)
+        finally:
+            tracemalloc.stop()
+        results[name] = (micros, peak)
+    return results
+
+
+def random_ohlcv(n, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 2000 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.005, n))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.005, n))
+    ts = np.arange(n, dtype=np.float64) * 4 * 3600 * 1000
+    return np.column_stack([ts, open_, high, low, close, rng.uniform(1, 100, n)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="增量指標引擎與 TA-Lib 比對")
+    parser.add_argument("--verify", action="store_true", help="以隨機 K 線比對 TA-Lib 輸出")
+    parser.add_argument("--bench", action="store_true", help="量測每筆報價的訊號前處理耗時與記憶體配置（pandas 與 NumPy 流程）")
+    parser.add_argument("--candles", type=int, default=5000)
+    parser.add_argument("--ticks", type=int, default=2000, help="--bench 的報價筆數")
+    args = parser.parse_args()
+    import talib
+    from config import RSI_LEN, ATR_LEN, BREAKOUT_LOOKBACK, RSI_BUY, rsiSell, EXIT_RSI, exitRSI_short
+    print(f"TA-Lib 版本: {talib.__version__}")
+    ohlcv = random_ohlcv(args.candles)
+    if args.bench:
+        results = benchmark_tick_pipeline(ohlcv, RSI_LEN, ATR_LEN, BREAKOUT_LOOKBACK, ticks=args.ticks)
+        for name, (micros, peak) in results.items():
+            print(f"{name}: 每筆 {micros:.1f} µs，尖峰配置 {peak / 1024:.1f} KiB")
+        (pandas_us, pandas_peak), (numpy_us, numpy_peak) = results["pandas"], results["numpy"]
+        print(f"耗時減少 {pandas_us / numpy_us:.0f} 倍，配置減少 {pandas_peak / max(numpy_peak, 1):.0f} 倍")
+        return
+    for rsi_len, atr_len, breakout_len in [(RSI_LEN, ATR_LEN, BREAKOUT_LOOKBACK), (14, 14, 20), (2, 1, 1)]:
+        mismatches = verify_against_talib(ohlcv, rsi_len, atr_len, breakout_len)
+        status = "一致" if mismatches == 0 else f"不一致 {mismatches} 根"
+        print(f"RSI_LEN={rsi_len}, ATR_LEN={atr_len}, BREAKOUT_LOOKBACK={breakout_len}: {len(ohlcv)} 根K線 {status}")
+    for rsi_len in (RSI_LEN, 14, 2):
+        mismatches = verify_rsi_prices(ohlcv, rsi_len, (RSI_BUY, rsiSell, EXIT_RSI, exitRSI_short, 1, 99))
+        status = "一致" if mismatches == 0 else f"不一致 {mismatches} 次"
+        print(f"RSI 觸發價 RSI_LEN={rsi_len}: {len(ohlcv)} 根K線 {status}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+WebSocket 即時行情（Binance kline + ticker 推送）。
+
+- MarketStream：訂閱 K 線與 ticker，直接更新 CandleFeed 內的 CandleStore，並在每次更新時呼叫回調觸發策略評估；
+  斷線自動重連（指數退避），重連後及發現 K 線缺口時以 REST 補齊
+- ReplayServer：本地 WebSocket 替身伺服器，重播錄製的訊息框，用於離線測試重連與補資料流程
+
+命令列：
+    python market_stream.py record frames.jsonl --seconds 60   # 錄製真實行情訊息
+    python market_stream.py replay frames.jsonl --port 8900    # 以本地替身伺服器重播
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import aiohttp
+from aiohttp import web
+import ccxt
+
+BINANCE_WS_URL = "wss://stream.binance.com:9443/stream"
+RECONNECT_DELAY_SECONDS = 1  # 首次重連等待（秒）
+MAX_RECONNECT_DELAY_SECONDS = 30  # 重連等待上限（秒）
+HEARTBEAT_SECONDS = 20  # WebSocket ping 間隔（秒）
+
+
+def stream_names(symbol, timeframe):
+    """'ETH/USDT', '4h' -> ['ethusdt@kline_4h', 'ethusdt@miniTicker']"""
+    market = symbol.replace("/", "").lower()
+    return [f"{market}@kline_{timeframe}", f"{market}@miniTicker"]
+
+
+def stream_url(base_url, symbol, timeframe):
+    return f"{base_url}?streams={'/'.join(stream_names(symbol, timeframe))}"
+
+
+def parse_message(message):
+    """
+    解析 Binance combined stream 訊息。
+    回傳 ("kline", [ts, o, h, l, c, v], is_closed)、("ticker", price, None) 或 None（忽略的訊息）。
+    """
+    data = message.get("data", message)
+    event = data.get("e")
+    if event == "kline":
+        k = data["k"]
+        row = [float(k["t"]), float(k["o"]), float(k["h"]), float(k["l"]), float(k["c"]), float(k["v"])]
+        return "kline", row, bool(k.get("x"))
+    if event in ("24hrMiniTicker", "24hrTicker"):
+        return "ticker", float(data["c"]), None
+    return None
+
+
+class MarketStream:
+    """
+    訂閱單一交易對的 K 線與 ticker 推送，維護 CandleFeed 中對應的 CandleStore。
+
+    on_update(kind, closed) 為協程回調：kind 為 "kline" 或 "ticker"，closed 表示該 K 線是否已收盤。
+    live 為 True 代表連線正常且資料已補齊，此時讀取 CandleStore 不需再走 REST。
+    """
+
+    def __init__(self, feed, symbol, timeframe, on_update=None, url=BINANCE_WS_URL, session=None):
+        self.feed = feed
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.on_update = on_update
+        self.url = url
+        self.timeframe_ms = ccxt.Exchange.parse_timeframe(timeframe) * 1000
+        self.live = False
+        self.reconnects = 0
+        self.last_message_time = None
+        self._session = session
+        self._stopped = False
+
+    @property
+    def store(self):
+        return self.feed.store(self.symbol, self.timeframe)
+
+    async def backfill(self):
+        """以 REST 補齊最後一根 K 線之後的數據（首次連線、重連或發現缺口時呼叫）。"""
+        await self.feed.refresh(self.symbol, self.timeframe)
+
+    async def _handle(self, message):
+        parsed = parse_message(message)
+        if parsed is None:
+            return
+        kind, value, closed = parsed
+        store = self.store
+        if kind == "kline":
+            last_ts = store.last_timestamp
+            if last_ts is not None and value[0] > last_ts + self.timeframe_ms:
+                # 推送的新 K 線與緩衝區之間有缺口（例如漏收訊息），先以 REST 補齊
+                print(f"[MarketStream] 偵測到 K 線缺口 {last_ts} -> {int(value[0])}，以 REST 補齊")
+                await self.backfill()
+            store.update([value])
+            if closed:
+                self.feed.persist(self.symbol, self.timeframe)
+        else:
+            store.apply_price(value)
+        self.last_message_time = time.time()
+        if self.on_update is not None:
+            await self.on_update(kind, closed)
+
+    async def _run_once(self, session):
+        async with session.ws_connect(stream_url(self.url, self.symbol, self.timeframe), heartbeat=HEARTBEAT_SECONDS) as ws:
+            print(f"[MarketStream] 已連線 {self.symbol} {self.timeframe}")
+            await self.backfill()
+            self.live = True
+            async for msg in ws:
+                if msg.type == aiohttp.WSMsgType.TEXT:
+                    await self._handle(json.loads(msg.data))
+                elif msg.type in (aiohttp.WSMsgType.ERROR, aiohttp.WSMsgType.CLOSED):
+                    break
+
+    async def run(self):
+        """持續接收推送，斷線後以指數退避自動重連，直到 stop()。"""
+        own_session = self._session is None
+        session = self._session or aiohttp.ClientSession()
+        delay = RECONNECT_DELAY_SECONDS
+        try:
+            while not self._stopped:
+                connected_at = time.time()
+                try:
+                    await self._run_once(session)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"[MarketStream] 連線錯誤: {e!r}")
+                self.live = False
+                if self._stopped:
+                    break
+                # 連線維持一段時間後才重置退避時間，避免伺服器反覆斷線時狂連
+                if time.time() - connected_at > MAX_RECONNECT_DELAY_SECONDS:
+                    delay = RECONNECT_DELAY_SECONDS
+                self.reconnects += 1
+                print(f"[MarketStream] {delay} 秒後重連...")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY_SECONDS)
+        finally:
+            self.live = False
+            if own_session:
+                await session.close()
+
+    def stop(self):
+        self._stopped = True
+
+
+class ReplayServer:
+    """
+    本地 WebSocket 替身伺服器：每個連線依序送出錄製的訊息框。
+
+    frames: 訊息（dict）列表；interval: 每則訊息間隔秒數；
+    drop_after: 送出 N 則後主動斷線（測試重連），None 表示送完為止。
+    每次新連線都從上次斷線處接續重播。
+    """
+
+    def __init__(self, frames, host="127.0.0.1", port=0, interval=0.0, drop_after=None):
+        self.frames = list(frames)
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self.drop_after = drop_after
+        self.connections = 0
+        self.sent = 0
+        self._runner = None
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        with open(path, "r", encoding="utf-8") as f:
+            frames = [json.loads(line) for line in f if line.strip()]
+        return cls(frames, **kwargs)
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}/stream"
+
+    async def _ws_handler(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.connections += 1
+        sent_this_conn = 0
+        while self.sent < len(self.frames):
+            if self.drop_after is not None and sent_this_conn >= self.drop_after:
+                break
+            await ws.send_str(json.dumps(self.frames[self.sent]))
+            self.sent += 1
+            sent_this_conn += 1
+            if self.interval:
+                await asyncio.sleep(self.interval)
+        await ws.close()
+        return ws
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/stream", self._ws_handler)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # port=0 時取得實際分配的埠號
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+async def record_frames(path, symbol, timeframe, seconds, url=BINANCE_WS_URL):
+    """錄製真實推送訊息為 JSONL，供 ReplayServer 重播。"""
+    deadline = time.time() + seconds
+    count = 0
+    async with aiohttp.ClientSession() as session:
+        async with session.ws_connect(stream_url(url, symbol, timeframe), heartbeat=HEARTBEAT_SECONDS) as ws:
+            with open(path, "w", encoding="utf-8") as f:
+                while time.time() < deadline:
+                    try:
+                        msg = await ws.receive(timeout=max(deadline - time.time(), 0.1))
+                    except asyncio.TimeoutError:
+                        break
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        break
+                    f.write(msg.data + "\n")
+                    count += 1
+    print(f"已錄製 {count} 則訊息至 {path}")
+
+
+async def _serve_replay(path, port, interval, drop_after):
+    server = await ReplayServer.from_file(path, port=port, interval=interval, drop_after=drop_after).start()
+    print(f"替身伺服器已啟動: {server.url}（共 {len(server.frames)} 則訊息）")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WebSocket 行情錄製 / 重播工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rec = sub.add_parser("record", help="錄製 Binance 推送訊息")
+    rec.add_argument("path")
+    rec.add_argument("--symbol", default=None)
+    rec.add_argument("--timeframe", default=None)
+    rec.add_argument("--seconds", type=float, default=60)
+    rep = sub.add_parser("replay", help="以本地替身伺服器重播錄製訊息")
+    rep.add_argument("path")
+    rep.add_argument("--port", type=int, default=8900)
+    rep.add_argument("--interval", type=float, default=0.5)
+    rep.add_argument("--drop-after", type=int, default=None)
+    args = parser.parse_args()
+    if args.command == "record":
+        from config import TRADING_PAIR, TIMEFRAME
+        asyncio.run(record_frames(args.path, args.symbol or TRADING_PAIR, args.timeframe or TIMEFRAME, args.seconds))
+    else:
+        asyncio.run(_serve_replay(args.path, args.port, args.interval, args.drop_after))
+
+
+if __name__ == "__main__":
+    main()
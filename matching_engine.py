@@ -0,0 +1,374 @@
+"""
+程式內的模擬撮合引擎：以 Bitunix 合約 API 的請求 / 回應格式處理機器人用到的端點，不做任何網路 I/O。
+
+- PaperExchange：下單、持倉、餘額、槓桿、持倉止盈止損（設置 / 修改 / 查詢 / 取消）與歷史訂單。
+  雙向持倉，每個交易對每個方向一個 positionId；市價單以最新價成交，追蹤逐倉保證金、槓桿與手續費，
+  set_price() 以單筆成交價、on_candles() 以即時或重播的K線檢查盤中止損、止盈與爆倉並平倉
+  （與 backtest.py 相同：跳空時以開盤價成交，同一段價格同時觸及止損與止盈時保守視為先止損），
+  平倉單寫入歷史訂單（avgPrice、profit、triggerType）；指定 path 時每次狀態變動後寫入 JSON，重啟後還原模擬帳戶
+- request(method, path, payload) 回傳與 Bitunix 相同格式的 {"code", "msg", "data"}；
+  HTTP 替身伺服器（mock_exchange.py）與模擬交易的 PaperClient（paper_trading.py）都把撮合交給這裡
+"""
+import itertools
+import json
+import os
+import time
+from collections import Counter, deque
+
+DEFAULT_BALANCE = 1000.0  # 初始可用餘額（USDT）
+DEFAULT_LEVERAGE = 20
+DEFAULT_FEE_RATE = 0.0006  # 市價單手續費率（每邊）
+HISTORY_SIZE = 500  # 歷史訂單最多保留筆數
+# 錯誤碼
+CODE_PARAM_ERROR = 10001
+CODE_NOT_FOUND = 10404  # 不支援的端點
+CODE_INSUFFICIENT_BALANCE = 20003
+CODE_POSITION_NOT_FOUND = 20007
+CODE_TPSL_NOT_FOUND = 20008
+# 觸發種類（歷史訂單的 triggerType）
+TRIGGER_TP = "TP"
+TRIGGER_SL = "SL"
+TRIGGER_LIQUIDATION = "LIQUIDATION"
+
+
+class PaperApiError(Exception):
+    def __init__(self, code, msg):
+        super().__init__(msg)
+        self.code = code
+        self.msg = msg
+
+
+def response(data=None, code=0, msg="Success"):
+    return {"code": code, "msg": msg, "data": data}
+
+
+def _num(value):
+    """數值欄位以字串回傳（與 Bitunix 回應相同）。"""
+    return str(round(float(value), 8))
+
+
+def _price(value):
+    if value in (None, ""):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise PaperApiError(CODE_PARAM_ERROR, f"Invalid price: {value}")
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+class PaperExchange:
+    """
+    模擬撮合引擎（雙向持倉，每個交易對每個方向一個 positionId；逐倉，保證金虧損殆盡時爆倉）。
+    所有方法皆為同步呼叫，不做任何 I/O（path 指定時除外）。
+    """
+
+    def __init__(self, balance=DEFAULT_BALANCE, fee_rate=DEFAULT_FEE_RATE, path=None):
+        self.fee_rate = fee_rate
+        self.path = path
+        self.available = float(balance)
+        self.prices = {}  # symbol -> 最新價
+        self.leverage = {}  # symbol -> 槓桿
+        self.positions = {}  # positionId -> 持倉
+        self.tpsl_orders = {}  # orderId -> 持倉止盈止損單（每個持倉最多一筆）
+        self.history = deque(maxlen=HISTORY_SIZE)  # 成交訂單，最新在前
+        self.triggered = Counter()  # TP / SL / LIQUIDATION -> 觸發次數
+        self._bars = {}  # symbol -> [最後處理的K線開盤時間, 最高, 最低]
+        self._ids = itertools.count(100000001)
+        self._routes = {
+            ("POST", "/api/v1/futures/trade/place_order"): self._place_order,
+            ("POST", "/api/v1/futures/tpsl/position/place_order"): self._place_tpsl,
+            ("POST", "/api/v1/futures/tpsl/modify_position_tp_sl_order"): self._modify_tpsl,
+            ("GET", "/api/v1/futures/tpsl/get_pending_tp_sl_order"): self._pending_tpsl,
+            ("POST", "/api/v1/futures/tpsl/cancel_order"): self._cancel_tpsl,
+            ("GET", "/api/v1/futures/position/get_pending_positions"): self._pending_positions,
+            ("GET", "/api/v1/futures/account"): self._account,
+            ("POST", "/api/v1/futures/account/change_leverage"): self._change_leverage,
+            ("GET", "/api/v1/futures/order/history"): self._order_history,
+        }
+        if path and os.path.exists(path):
+            self.load(path)
+
+    @property
+    def routes(self):
+        """支援的 (method, path) 列表。"""
+        return list(self._routes)
+
+    def _next_id(self):
+        return str(next(self._ids))
+
+    # === 請求處理 === #
+    def request(self, method, path, payload=None):
+        """處理一個 API 請求（GET 為查詢參數 dict，POST 為 JSON body dict），回傳與 Bitunix 相同格式的回應。"""
+        handler = self._routes.get((method, path))
+        if handler is None:
+            return response(None, CODE_NOT_FOUND, f"Unsupported endpoint: {method} {path}")
+        try:
+            data = handler(payload or {})
+        except PaperApiError as e:
+            return response(None, e.code, e.msg)
+        if method == "POST":
+            self._save()
+        return response(data)
+
+    # === 行情與盤中觸發 === #
+    def set_price(self, symbol, price):
+        """以一筆成交價更新最新價並檢查止盈止損（跳過的價位以該價成交），回傳本次觸發平倉的歷史訂單列表。"""
+        price = float(price)
+        closed = self._check_triggers(symbol, price, price, price)
+        self.prices[symbol] = price
+        if closed:
+            self._save()
+        return closed
+
+    def on_candles(self, symbol, ohlcv):
+        """
+        以K線（N×6：timestamp, open, high, low, close, volume）更新行情，回傳觸發平倉的歷史訂單列表。
+        上次處理過的K線只以新出現的最高 / 最低價與最新收盤價檢查（盤中更新），
+        之後的新K線以整根的開高低檢查（跳空時以開盤價成交）。
+        """
+        closed = []
+        bar = self._bars.get(symbol)
+        for row in ohlcv if bar is None else ohlcv[ohlcv[:, 0] >= bar[0]]:
+            ts, open_, high, low, close = float(row[0]), float(row[1]), float(row[2]), float(row[3]), float(row[4])
+            if bar is not None and ts == bar[0]:
+                last = self.prices.get(symbol, close)
+                segment_low = min(close, low) if low < bar[2] else close
+                segment_high = max(close, high) if high > bar[1] else close
+                closed += self._check_triggers(symbol, last, min(segment_low, last), max(segment_high, last))
+                bar[1], bar[2] = max(bar[1], high), min(bar[2], low)
+            else:
+                closed += self._check_triggers(symbol, open_, low, high)
+                bar = self._bars[symbol] = [ts, high, low]
+            self.prices[symbol] = close
+        if closed:
+            self._save()
+        return closed
+
+    def _check_triggers(self, symbol, reference, low, high):
+        """
+        價格在 [low, high] 區間內移動時檢查各持倉的止損（含爆倉價）與止盈；reference 為區間起點價格，
+        觸發價位已被跳過時以 reference 成交。
+        """
+        closed = []
+        for position in [p for p in self.positions.values() if p["symbol"] == symbol]:
+            order = next((o for o in self.tpsl_orders.values() if o["positionId"] == position["positionId"]), None)
+            tp = _price(order["tpPrice"]) if order else None
+            sl = _price(order["slPrice"]) if order else None
+            liquidation = position["liquidationPrice"]
+            if position["side"] == "BUY":
+                stop, trigger_type = (sl, TRIGGER_SL) if sl is not None and sl >= liquidation else (liquidation, TRIGGER_LIQUIDATION)
+                if low <= stop:
+                    fill = min(reference, stop)
+                elif tp is not None and high >= tp:
+                    fill, trigger_type = max(reference, tp), TRIGGER_TP
+                else:
+                    continue
+            else:
+                stop, trigger_type = (sl, TRIGGER_SL) if sl is not None and sl <= liquidation else (liquidation, TRIGGER_LIQUIDATION)
+                if high >= stop:
+                    fill = max(reference, stop)
+                elif tp is not None and low <= tp:
+                    fill, trigger_type = min(reference, tp), TRIGGER_TP
+                else:
+                    continue
+            self.triggered[trigger_type] += 1
+            closed.append(self._close(position, position["qty"], fill, trigger_type))
+        return closed
+
+    # === 持倉 === #
+    def _open(self, symbol, side, qty, price, leverage):
+        position = next((p for p in self.positions.values() if p["symbol"] == symbol and p["side"] == side), None)
+        margin = qty * price / leverage
+        fee = qty * price * self.fee_rate
+        if margin + fee > self.available:
+            raise PaperApiError(CODE_INSUFFICIENT_BALANCE, "Insufficient balance")
+        self.available -= margin + fee
+        if position is None:
+            position = {"positionId": self._next_id(), "symbol": symbol, "side": side, "qty": 0.0, "avgOpenPrice": 0.0,
+                        "margin": 0.0, "fee": 0.0, "leverage": leverage, "liquidationPrice": 0.0, "ctime": _now_ms()}
+            self.positions[position["positionId"]] = position
+        total = position["qty"] + qty
+        position["avgOpenPrice"] = (position["avgOpenPrice"] * position["qty"] + price * qty) / total
+        position["qty"] = total
+        position["margin"] += margin
+        position["fee"] += fee
+        # 逐倉保證金虧損殆盡時爆倉（未計維持保證金，與 backtest.py 相同）
+        direction = 1 if side == "BUY" else -1
+        position["liquidationPrice"] = position["avgOpenPrice"] - direction * position["margin"] / total
+        return position
+
+    def _close(self, position, qty, price, trigger_type="", order_id=None):
+        """平倉 qty（不超過持倉數量），已實現盈虧扣除開平倉手續費，回傳寫入歷史的訂單。"""
+        qty = min(qty, position["qty"])
+        ratio = qty / position["qty"]
+        long_side = position["side"] == "BUY"
+        pnl = (price - position["avgOpenPrice"]) * qty * (1 if long_side else -1)
+        close_fee = qty * price * self.fee_rate
+        released_margin = position["margin"] * ratio
+        open_fee = position["fee"] * ratio
+        self.available += max(released_margin + pnl - close_fee, 0.0)
+        position["qty"] -= qty
+        position["margin"] -= released_margin
+        position["fee"] -= open_fee
+        if position["qty"] <= 1e-12:
+            del self.positions[position["positionId"]]
+            for tpsl_id in [oid for oid, o in self.tpsl_orders.items() if o["positionId"] == position["positionId"]]:
+                del self.tpsl_orders[tpsl_id]
+        order = {"orderId": order_id or self._next_id(), "symbol": position["symbol"], "positionId": position["positionId"],
+                 "side": "SELL" if long_side else "BUY", "tradeSide": "CLOSE", "orderType": "MARKET", "qty": _num(qty),
+                 "price": _num(price), "avgPrice": _num(price), "status": "FILLED", "triggerType": trigger_type,
+                 "fee": _num(close_fee), "profit": _num(max(pnl, -released_margin) - close_fee - open_fee), "ctime": _now_ms()}
+        self.history.appendleft(order)
+        return order
+
+    def _position_view(self, position):
+        price = self.prices.get(position["symbol"], position["avgOpenPrice"])
+        pnl = (price - position["avgOpenPrice"]) * position["qty"] * (1 if position["side"] == "BUY" else -1)
+        return {"positionId": position["positionId"], "symbol": position["symbol"], "side": position["side"],
+                "qty": _num(position["qty"]), "avgOpenPrice": _num(position["avgOpenPrice"]), "margin": _num(position["margin"]),
+                "unrealizedPNL": _num(pnl), "leverage": position["leverage"], "liqPrice": _num(position["liquidationPrice"]),
+                "marginMode": "ISOLATION", "ctime": position["ctime"]}
+
+    def _find_position(self, symbol, position_id):
+        position = self.positions.get(str(position_id)) if position_id else None
+        if position is None or position["symbol"] != symbol:
+            raise PaperApiError(CODE_POSITION_NOT_FOUND, "Position not found")
+        return position
+
+    # === 端點 === #
+    def _place_order(self, body):
+        symbol = body.get("symbol")
+        side = str(body.get("side", "")).upper()
+        trade_side = str(body.get("tradeSide", "OPEN")).upper()
+        try:
+            qty = float(body.get("qty", 0))
+        except (TypeError, ValueError):
+            qty = 0.0
+        if not symbol or side not in ("BUY", "SELL") or trade_side not in ("OPEN", "CLOSE") or qty <= 0:
+            raise PaperApiError(CODE_PARAM_ERROR, "Parameter error")
+        price = self.prices.get(symbol)
+        if price is None:
+            raise PaperApiError(CODE_PARAM_ERROR, f"No market price for {symbol}")
+        order_id = self._next_id()
+        if trade_side == "OPEN":
+            leverage = int(body.get("leverage") or self.leverage.get(symbol, DEFAULT_LEVERAGE))
+            position = self._open(symbol, side, qty, price, leverage)
+            self.history.appendleft({"orderId": order_id, "symbol": symbol, "positionId": position["positionId"], "side": side,
+                                     "tradeSide": "OPEN", "orderType": "MARKET", "qty": _num(qty), "price": _num(price),
+                                     "avgPrice": _num(price), "status": "FILLED", "triggerType": "",
+                                     "fee": _num(qty * price * self.fee_rate), "profit": _num(0), "ctime": _now_ms()})
+        else:
+            position_side = "SELL" if side == "BUY" else "BUY"
+            position_id = body.get("positionId") or next(
+                (p["positionId"] for p in self.positions.values() if p["symbol"] == symbol and p["side"] == position_side), None)
+            position = self._find_position(symbol, position_id)
+            if position["side"] != position_side:
+                raise PaperApiError(CODE_POSITION_NOT_FOUND, "Position side mismatch")
+            self._close(position, qty, price, order_id=order_id)
+        return {"orderId": order_id, "clientId": body.get("clientId")}
+
+    def _place_tpsl(self, body):
+        symbol = body.get("symbol")
+        position = self._find_position(symbol, body.get("positionId"))
+        if _price(body.get("tpPrice")) is None and _price(body.get("slPrice")) is None:
+            raise PaperApiError(CODE_PARAM_ERROR, "tpPrice or slPrice is required")
+        # 持倉止盈止損每個持倉只有一筆，重新設置取代舊單
+        for order_id in [oid for oid, o in self.tpsl_orders.items() if o["positionId"] == position["positionId"]]:
+            del self.tpsl_orders[order_id]
+        order_id = self._next_id()
+        self.tpsl_orders[order_id] = {
+            "orderId": order_id, "positionId": position["positionId"], "symbol": symbol, "side": position["side"],
+            "tpPrice": body.get("tpPrice"), "tpStopType": body.get("tpStopType"),
+            "slPrice": body.get("slPrice"), "slStopType": body.get("slStopType"), "ctime": _now_ms(),
+        }
+        return {"orderId": order_id}
+
+    def _modify_tpsl(self, body):
+        symbol = body.get("symbol")
+        position = self._find_position(symbol, body.get("positionId"))
+        order = next((o for o in self.tpsl_orders.values() if o["positionId"] == position["positionId"]), None)
+        if order is None:
+            raise PaperApiError(CODE_TPSL_NOT_FOUND, "TP/SL order not found")
+        if _price(body.get("tpPrice")) is None and _price(body.get("slPrice")) is None:
+            raise PaperApiError(CODE_PARAM_ERROR, "tpPrice or slPrice is required")
+        for field in ("tpPrice", "tpStopType", "slPrice", "slStopType"):
+            if body.get(field) is not None:
+                order[field] = body[field]
+        return {"orderId": order["orderId"]}
+
+    def _pending_tpsl(self, params):
+        symbol = params.get("symbol")
+        position_id = params.get("positionId")
+        return [dict(o) for o in self.tpsl_orders.values()
+                if (not symbol or o["symbol"] == symbol) and (not position_id or o["positionId"] == position_id)]
+
+    def _cancel_tpsl(self, body):
+        order = self.tpsl_orders.get(str(body.get("orderId")))
+        if order is None or order["symbol"] != body.get("symbol"):
+            raise PaperApiError(CODE_TPSL_NOT_FOUND, "TP/SL order not found")
+        del self.tpsl_orders[order["orderId"]]
+        return {"orderId": order["orderId"]}
+
+    def _pending_positions(self, params):
+        symbol = params.get("symbol")
+        return [self._position_view(p) for p in self.positions.values() if not symbol or p["symbol"] == symbol]
+
+    def _account(self, params):
+        margin = sum(p["margin"] for p in self.positions.values())
+        unrealized = sum(float(self._position_view(p)["unrealizedPNL"]) for p in self.positions.values())
+        return {"marginCoin": params.get("marginCoin", "USDT"), "available": _num(self.available), "margin": _num(margin),
+                "crossUnrealizedPNL": "0", "isolationUnrealizedPNL": _num(unrealized)}
+
+    def _change_leverage(self, body):
+        try:
+            leverage = int(body.get("leverage"))
+        except (TypeError, ValueError):
+            raise PaperApiError(CODE_PARAM_ERROR, "Invalid leverage")
+        self.leverage[body.get("symbol")] = leverage
+        return {"symbol": body.get("symbol"), "leverage": leverage, "marginCoin": body.get("marginCoin")}
+
+    def _order_history(self, params):
+        symbol = params.get("symbol")
+        try:
+            page_size = min(int(params.get("pageSize", 10)), 100)
+        except ValueError:
+            raise PaperApiError(CODE_PARAM_ERROR, "Invalid pageSize")
+        return [dict(o) for o in self.history if not symbol or o["symbol"] == symbol][:page_size]
+
+    # === 模擬帳戶保存 === #
+    def equity(self):
+        """可用餘額 + 持倉保證金 + 未實現盈虧。"""
+        return self.available + sum(p["margin"] + float(self._position_view(p)["unrealizedPNL"]) for p in self.positions.values())
+
+    def to_dict(self):
+        return {"available": self.available, "prices": self.prices, "leverage": self.leverage, "positions": self.positions,
+                "tpsl_orders": self.tpsl_orders, "history": list(self.history), "triggered": dict(self.triggered),
+                "bars": self._bars, "next_id": int(self._next_id())}
+
+    def load(self, path):
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        self.available = state["available"]
+        self.prices = state["prices"]
+        self.leverage = state["leverage"]
+        self.positions = state["positions"]
+        self.tpsl_orders = state["tpsl_orders"]
+        self.history = deque(state["history"], maxlen=HISTORY_SIZE)
+        self.triggered = Counter(state["triggered"])
+        self._bars = state["bars"]
+        self._ids = itertools.count(state["next_id"])
+        print(f"[Paper] 已還原模擬帳戶 {path}：可用 {self.available:.2f}，持倉 {len(self.positions)} 筆")
+
+    def _save(self):
+        """先寫暫存檔再取代，程式中斷不會留下寫到一半的檔案。"""
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,306 @@
+"""
+內建延遲 / 錯誤指標與 Prometheus 文字格式輸出（不依賴 prometheus_client）。
+
+- Counter / Gauge / Histogram：以標籤值 tuple 為 key 的輕量實作，observe / inc 只是幾次 dict 與 list 操作，可放在熱路徑
+- MetricsServer：本地 aiohttp HTTP 伺服器，GET /metrics 回傳 Prometheus exposition 文字
+- write_textfile：寫入 node_exporter textfile collector 使用的 .prom 檔（先寫暫存檔再取代）
+
+熱路徑上的預設指標：
+- bitunix_request_seconds{method, endpoint}：每個 Bitunix 端點的請求延遲（不含排程器排隊時間）
+- bitunix_request_queue_seconds{lane}：請求在排程器中排隊的時間
+- bitunix_request_errors_total{endpoint, kind}：HTTP 錯誤、逾時、code != 0 的回應
+- loop_phase_seconds{symbol, phase}：主循環各階段耗時（fetch_ohlcv / compute_indicators / strategy / discord）
+- loop_iteration_seconds{symbol}：一輪主循環總耗時
+- signal_to_order_seconds{side}：指標算完（訊號判斷開始）到下單回應的延遲
+- candle_close_lag_seconds{symbol}、loop_wakes_total{symbol, kind}：K線收盤到收盤評估的延遲、主循環喚醒次數
+- discord_webhook_seconds：Webhook 每批送出的耗時
+- errors_total{component}：各元件的例外次數
+
+使用方式：
+    python metrics.py --url http://127.0.0.1:9108/metrics    # 以分位數摘要列出正在運行的機器人指標
+"""
+import argparse
+import asyncio
+import math
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from aiohttp import web
+
+# 延遲直方圖的 bucket 上界（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labelnames=(), registry=None):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} 需要標籤 {self.labelnames}，收到 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+    def _samples(self):
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labelnames=(), registry=None, collect=None):
+        """collect：輸出前呼叫的函數，回傳 {標籤值 tuple: 數值}（例如讀取排程器目前的佇列長度）。"""
+        super().__init__(name, help_text, labelnames, registry)
+        self.collect = collect
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def _samples(self):
+        if self.collect is not None:
+            self._values = dict(self.collect())
+        return super()._samples()
+
+
+class _HistogramChild:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), registry=None, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames, registry)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        child = self._values.get(key)
+        if child is None:
+            child = self._values[key] = _HistogramChild(len(self.buckets))
+        # 只記錄落入的 bucket，輸出時再累加，observe 保持 O(log n)
+        child.counts[bisect_left(self.buckets, value)] += 1
+        child.sum += value
+        child.count += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """以 with 區塊計時（區塊內可以 await）。"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def quantile(self, q, **labels):
+        """由 bucket 線性插值估計分位數（與 Prometheus histogram_quantile 相同算法）。"""
+        child = self._values.get(self._key(labels))
+        if child is None or child.count == 0:
+            return None
+        return bucket_quantile(q, self.buckets, child.counts)
+
+    def _samples(self):
+        for key, child in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, child.counts):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', _format_value(bound))])} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(child.sum)}"
+            yield f"{self.name}_count{labels} {child.count}"
+
+
+def bucket_quantile(q, bounds, counts):
+    """由各 bucket 的（非累積）次數估計分位數。"""
+    total = sum(counts)
+    if total == 0:
+        return None
+    rank = q * total
+    cumulative = 0
+    lower = 0.0
+    for bound, count in zip(bounds, counts):
+        if cumulative + count >= rank and count > 0:
+            if bound == math.inf:
+                return lower
+            return lower + (bound - lower) * (rank - cumulative) / count
+        cumulative += count
+        if bound != math.inf:
+            lower = bound
+    return lower
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def render(self):
+        """Prometheus 文字格式（text/plain; version=0.0.4）。"""
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+# === 預設指標 === #
+REQUEST_SECONDS = Histogram("bitunix_request_seconds", "Bitunix REST request latency in seconds", ("method", "endpoint"))
+REQUEST_QUEUE_SECONDS = Histogram("bitunix_request_queue_seconds", "Time spent waiting in the request scheduler", ("lane",))
+REQUEST_ERRORS = Counter("bitunix_request_errors_total", "Bitunix requests that failed or returned code != 0", ("endpoint", "kind"))
+LOOP_PHASE_SECONDS = Histogram("loop_phase_seconds", "Trading loop phase duration in seconds", ("symbol", "phase"))
+LOOP_ITERATION_SECONDS = Histogram("loop_iteration_seconds", "Whole trading loop iteration duration in seconds", ("symbol",))
+SIGNAL_TO_ORDER_SECONDS = Histogram("signal_to_order_seconds", "Delay from signal evaluation to order acknowledgement", ("side",))
+DISCORD_WEBHOOK_SECONDS = Histogram("discord_webhook_seconds", "Discord webhook batch delivery time in seconds")
+CANDLE_CLOSE_LAG_SECONDS = Histogram("candle_close_lag_seconds", "Delay from candle close to the close-based evaluation", ("symbol",))
+LOOP_WAKES = Counter("loop_wakes_total", "Trading loop wake-ups by kind (close / intrabar)", ("symbol", "kind"))
+ERRORS = Counter("errors_total", "Exceptions caught per component", ("component",))
+
+
+class MetricsServer:
+    """
+    本地 /metrics HTTP 伺服器（Prometheus scrape 目標）。
+    """
+
+    def __init__(self, registry=REGISTRY, host="127.0.0.1", port=9108):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/metrics"
+
+    async def _handle(self, request):
+        return web.Response(text=self.registry.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def write_textfile(path, registry=REGISTRY):
+    """寫入 textfile collector 的 .prom 檔，先寫暫存檔再取代，避免 collector 讀到寫到一半的檔案。"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(registry.render())
+    os.replace(tmp_path, path)
+
+
+async def run_textfile_writer(path, interval, registry=REGISTRY):
+    """每 interval 秒寫入一次 textfile，直到被取消。"""
+    while True:
+        try:
+            write_textfile(path, registry)
+        except OSError as e:
+            print(f"寫入指標檔案失敗: {e}")
+        await asyncio.sleep(interval)
+
+
+def parse_histograms(text):
+    """解析 exposition 文字中的直方圖：{(名稱, 標籤字串): (bounds, 非累積次數)}。"""
+    cumulative = {}
+    for line in text.splitlines():
+        if line.startswith("#") or "_bucket{" not in line:
+            continue
+        head, value = line.rsplit(" ", 1)
+        name, labels = head.split("_bucket{", 1)
+        labels = labels.rstrip("}")
+        le_start = labels.rfind('le="')
+        bound = labels[le_start + 4:-1]
+        series = labels[:le_start].rstrip(",")
+        cumulative.setdefault((name, series), []).append((math.inf if bound == "+Inf" else float(bound), float(value)))
+    result = {}
+    for key, points in cumulative.items():
+        bounds = [bound for bound, _ in points]
+        counts = [points[0][1]] + [points[i][1] - points[i - 1][1] for i in range(1, len(points))]
+        result[key] = (bounds, counts)
+    return result
+
+
+def main():
+    import aiohttp
+
+    parser = argparse.ArgumentParser(description="列出交易機器人的延遲指標（p50 / p99）")
+    parser.add_argument("--url", default="http://127.0.0.1:9108/metrics", help="/metrics 位址")
+    parser.add_argument("--file", help="改為讀取 textfile collector 的 .prom 檔")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, "r", encoding="utf-8") as f:
+            text = f.read()
+    else:
+        async def fetch():
+            async with aiohttp.ClientSession() as session:
+                async with session.get(args.url) as response:
+                    return await response.text()
+        text = asyncio.run(fetch())
+    for (name, series), (bounds, counts) in sorted(parse_histograms(text).items()):
+        total = int(sum(counts))
+        if total == 0:
+            continue
+        p50 = bucket_quantile(0.5, bounds, counts)
+        p99 = bucket_quantile(0.99, bounds, counts)
+        print(f"{name}{{{series}}}: n={total}, p50={p50 * 1000:.1f}ms, p99={p99 * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+"""
+Bitunix 合約 REST API 本地模擬交易所與端到端主循環基準測試。
+
+- MockExchange：aiohttp 替身伺服器，把機器人用到的 Bitunix 合約端點（下單、持倉、餘額、槓桿、
+  持倉止盈止損的設置 / 修改 / 查詢 / 取消、歷史訂單）交給 matching_engine.PaperExchange 撮合，
+  本身只負責 HTTP 層：以與 get_signed_params 相同的雙重 SHA256 驗證簽名，並拒絕過期的 timestamp 與重複的 nonce。
+  set_price() 更新最新價時檢查止盈止損是否觸發並平倉，平倉單寫入歷史訂單（avgPrice、profit、triggerType）。
+  每個請求可加上延遲（latency + 隨機 jitter），並可注入錯誤（error_rate 機率回傳 HTTP 錯誤、
+  fail_next 指定端點的下幾次請求回傳錯誤）。另提供 /webhook 接收 Discord Webhook 通知
+- run_benchmark：以合成K線逐根驅動 execute_trading_strategy（下單、條件單、平倉查詢、Discord 通知全部送往替身），
+  回報每秒迭代次數、每輪請求數與決策延遲 p50 / p99；狀態資料庫與事件日誌寫入暫存目錄，不影響實盤檔案
+
+使用方式：
+    python mock_exchange.py serve --port 8901 --price ETHUSDT=2500 --latency 0.02
+    python mock_exchange.py bench --candles 2000 --latency 0.005 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from collections import Counter, deque
+
+import numpy as np
+from aiohttp import web
+
+from bitunix_client import sha256_hex, set_base_url, set_rate_limit, get_client, close_shared_session
+from discord_notifier import DiscordNotifier
+from indicators import random_ohlcv
+from metrics import SIGNAL_TO_ORDER_SECONDS
+from matching_engine import PaperExchange, DEFAULT_BALANCE, DEFAULT_FEE_RATE, CODE_PARAM_ERROR
+
+DEFAULT_API_KEY = "mock-key"
+DEFAULT_SECRET_KEY = "mock-secret"
+RECV_WINDOW_MS = 60 * 1000  # timestamp 與伺服器時間最多相差的毫秒數
+NONCE_CACHE_SIZE = 10000  # 記住最近多少個 nonce（拒絕重送的請求）
+UNLIMITED_RATE = 1e9  # 基準測試預設不經過請求額度限制
+# 錯誤碼（模擬用，撮合相關的錯誤碼見 matching_engine）
+CODE_INJECTED = 10002  # 錯誤注入的 code != 0 回應
+CODE_SIGNATURE_ERROR = 10007
+BENCH_SIDES = ("open_long", "open_short", "close_long", "close_short")
+
+
+def _reply(data=None, code=0, msg="Success"):
+    return web.json_response({"code": code, "msg": msg, "data": data})
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+class MockExchange:
+    """
+    本地模擬交易所。只接受一組 API 金鑰；下單以 set_price() 設定的最新價立即成交（撮合狀態在 self.book）。
+    requests 記錄每個端點的請求數（含被拒絕的請求），errors 記錄各種錯誤回應次數。
+    """
+
+    def __init__(self, api_key=DEFAULT_API_KEY, secret_key=DEFAULT_SECRET_KEY, host="127.0.0.1", port=0,
+                 balance=DEFAULT_BALANCE, fee_rate=DEFAULT_FEE_RATE, latency=0.0, jitter=0.0,
+                 error_rate=0.0, error_status=503, seed=None):
+        self.api_key = api_key
+        self.secret_key = secret_key
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.book = PaperExchange(balance, fee_rate)
+        self.requests = Counter()  # 端點路徑 -> 請求數
+        self.errors = Counter()  # 錯誤種類 -> 次數
+        self.webhook_messages = 0
+        self.webhook_embeds = 0
+        self._faults = []
+        self._nonces = set()
+        self._nonce_order = deque()
+        self._rng = random.Random(seed)
+        self._runner = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def webhook_url(self):
+        return f"{self.url}/webhook"
+
+    @property
+    def request_count(self):
+        return sum(self.requests.values())
+
+    # === 錯誤注入 === #
+    def fail_next(self, path=None, times=1, status=None, code=CODE_INJECTED, msg="System error"):
+        """
+        讓接下來 times 次請求回傳錯誤：指定 status 時回傳該 HTTP 狀態碼，否則回傳 HTTP 200 與 code != 0。
+        path 為 None 時套用到任何端點（不含 /webhook）。
+        """
+        self._faults.append({"path": path, "remaining": times, "status": status, "code": code, "msg": msg})
+
+    def _next_fault(self, path):
+        for fault in self._faults:
+            if fault["path"] in (None, path):
+                fault["remaining"] -= 1
+                if fault["remaining"] <= 0:
+                    self._faults.remove(fault)
+                return fault
+        if self.error_rate and self._rng.random() < self.error_rate:
+            return {"status": self.error_status, "code": CODE_INJECTED, "msg": "System error"}
+        return None
+
+    # === 簽名驗證 === #
+    def _verify(self, request, body_text):
+        """驗證簽名標頭，失敗時回傳錯誤訊息。"""
+        headers = request.headers
+        api_key, nonce, timestamp, sign = (headers.get(name) for name in ("api-key", "nonce", "timestamp", "sign"))
+        if not (api_key and nonce and timestamp and sign):
+            return "Missing signature headers"
+        if api_key != self.api_key:
+            return "Invalid api-key"
+        try:
+            if abs(_now_ms() - int(timestamp)) > RECV_WINDOW_MS:
+                return "Timestamp expired"
+        except ValueError:
+            return "Invalid timestamp"
+        if nonce in self._nonces:
+            return "Duplicate nonce"
+        if request.method == "GET":
+            payload = "".join(f"{k}{v}" for k, v in sorted(request.query.items()))
+        else:
+            payload = body_text
+        if sign != sha256_hex(sha256_hex(f"{nonce}{timestamp}{api_key}{payload}") + self.secret_key):
+            return "Signature Error"
+        self._nonces.add(nonce)
+        self._nonce_order.append(nonce)
+        if len(self._nonce_order) > NONCE_CACHE_SIZE:
+            self._nonces.discard(self._nonce_order.popleft())
+        return None
+
+    def _endpoint(self):
+        """包裝端點：延遲、簽名驗證、錯誤注入，通過後交給 PaperExchange 處理。"""
+        async def wrapped(request):
+            self.requests[request.path] += 1
+            delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            body_text = await request.text()
+            error = self._verify(request, body_text)
+            if error is not None:
+                self.errors["signature"] += 1
+                return _reply(None, CODE_SIGNATURE_ERROR, error)
+            fault = self._next_fault(request.path)
+            if fault is not None:
+                if fault["status"]:
+                    self.errors[f"http_{fault['status']}"] += 1
+                    return web.json_response({"code": fault["code"], "msg": fault["msg"]}, status=fault["status"])
+                self.errors["api"] += 1
+                return _reply(None, fault["code"], fault["msg"])
+            if request.method == "POST":
+                try:
+                    payload = json.loads(body_text or "{}")
+                except ValueError:
+                    self.errors["rejected"] += 1
+                    return _reply(None, CODE_PARAM_ERROR, "Invalid JSON body")
+            else:
+                payload = dict(request.query)
+            result = self.book.request(request.method, request.path, payload)
+            if result["code"] != 0:
+                self.errors["rejected"] += 1
+            return web.json_response(result)
+        return wrapped
+
+    # === 行情 === #
+    def set_price(self, symbol, price):
+        """更新最新價並檢查止盈止損，回傳本次觸發平倉的歷史訂單列表。"""
+        return self.book.set_price(symbol, price)
+
+    async def _webhook(self, request):
+        payload = await request.json()
+        self.webhook_messages += 1
+        self.webhook_embeds += len(payload.get("embeds") or [])
+        return web.Response(status=204)
+
+    async def start(self):
+        app = web.Application()
+        endpoint = self._endpoint()
+        for method, path in self.book.routes:
+            app.router.add_route(method, path, endpoint)
+        app.router.add_post("/webhook", self._webhook)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+# === 端到端基準測試 === #
+async def run_benchmark(candles=1000, window=100, symbol="ETHUSDT", balance=DEFAULT_BALANCE, latency=0.0, jitter=0.0,
+                        error_rate=0.0, seed=0, rate_limited=False, verbose=False):
+    """
+    以 window + candles 根合成K線驅動策略：每根K線依 開→低→高→收（陰線為 開→高→低→收）更新模擬交易所價格
+    （觸發止盈止損），再以收盤時的最近 window 根K線執行一輪 execute_trading_strategy。
+    rate_limited=False 時不經過請求額度限制，只量測程式本身與交易所往返的延遲。
+    回傳統計 dict（決策延遲為一輪策略評估的耗時，含所有 Bitunix 請求）。
+    """
+    import bitunix_trading_bot as bot
+    from event_journal import EventJournal
+    from state_store import StateStore
+    from symbol_context import SymbolContext
+
+    api_key, secret_key = DEFAULT_API_KEY, DEFAULT_SECRET_KEY
+    exchange = await MockExchange(api_key, secret_key, balance=balance, latency=latency, jitter=jitter,
+                                  error_rate=error_rate, seed=seed).start()
+    workdir = tempfile.mkdtemp(prefix="bitunix-bench-")
+    bot.state_store = StateStore(os.path.join(workdir, "state.db"))
+    bot.event_journal = EventJournal(os.path.join(workdir, "events.jsonl"))
+    bot.discord_notifier = DiscordNotifier(exchange.webhook_url, batch_delay=0)
+    set_base_url(exchange.url)
+    if not rate_limited:
+        set_rate_limit(UNLIMITED_RATE, UNLIMITED_RATE, {})
+    ctx = SymbolContext(symbol)
+    ohlcv = random_ohlcv(window + candles, seed)
+    client = get_client(api_key, secret_key)
+    decision_seconds = []
+    devnull = None if verbose else open(os.devnull, "w", encoding="utf-8")
+    try:
+        with contextlib.redirect_stdout(devnull) if devnull is not None else contextlib.nullcontext():
+            start = time.perf_counter()
+            for i in range(window, window + candles):
+                _, open_, high, low, close, _ = ohlcv[i]
+                for price in ((open_, high, low, close) if close < open_ else (open_, low, high, close)):
+                    exchange.set_price(symbol, price)
+                client.snapshot.invalidate(symbol)
+                t0 = time.perf_counter()
+                await bot.execute_trading_strategy(ctx, api_key, secret_key, ohlcv_data=ohlcv[i - window + 1:i + 1])
+                decision_seconds.append(time.perf_counter() - t0)
+            elapsed = time.perf_counter() - start
+            await bot.discord_notifier.flush()
+    finally:
+        await bot.discord_notifier.close()
+        bot.state_store.close()
+        bot.event_journal.close()
+        await close_shared_session()
+        await exchange.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+        if devnull is not None:
+            devnull.close()
+
+    decision = np.array(decision_seconds)
+    signal_to_order = {}
+    for side in BENCH_SIDES:
+        p50 = SIGNAL_TO_ORDER_SECONDS.quantile(0.5, side=side)
+        if p50 is not None:
+            signal_to_order[side] = (p50, SIGNAL_TO_ORDER_SECONDS.quantile(0.99, side=side))
+    return {
+        "iterations": candles,
+        "seconds": elapsed,
+        "iterations_per_second": candles / elapsed if elapsed > 0 else float("inf"),
+        "requests": exchange.request_count,
+        "requests_per_iteration": exchange.request_count / candles,
+        "endpoints": dict(exchange.requests),
+        "decision_p50": float(np.percentile(decision, 50)),
+        "decision_p99": float(np.percentile(decision, 99)),
+        "signal_to_order": signal_to_order,
+        "orders": exchange.requests["/api/v1/futures/trade/place_order"],
+        "triggered": dict(exchange.book.triggered),
+        "errors": dict(exchange.errors),
+        "webhook_embeds": exchange.webhook_embeds,
+        "final_balance": exchange.book.available,
+    }
+
+
+def print_benchmark(result):
+    print(f"迭代次數: {result['iterations']}（{result['seconds']:.2f} 秒，{result['iterations_per_second']:.1f} 次/秒）")
+    print(f"請求數: {result['requests']}（每輪 {result['requests_per_iteration']:.2f}）")
+    for path, count in sorted(result["endpoints"].items(), key=lambda item: -item[1]):
+        print(f"  {path}: {count}")
+    print(f"決策延遲: p50={result['decision_p50'] * 1000:.2f}ms, p99={result['decision_p99'] * 1000:.2f}ms")
+    for side, (p50, p99) in result["signal_to_order"].items():
+        print(f"訊號到下單回應 {side}: p50={p50 * 1000:.2f}ms, p99={p99 * 1000:.2f}ms（bucket 估計）")
+    print(f"下單 {result['orders']} 次，止盈止損觸發 {result['triggered'] or 0}，Discord 通知 {result['webhook_embeds']} 則")
+    print(f"錯誤回應: {result['errors'] or '無'}，模擬帳戶可用餘額: {result['final_balance']:.2f}")
+
+
+async def _serve(args):
+    exchange = MockExchange(args.api_key, args.secret_key, port=args.port, balance=args.balance, latency=args.latency,
+                            jitter=args.jitter, error_rate=args.error_rate, seed=args.seed)
+    for item in args.price or []:
+        symbol, price = item.split("=", 1)
+        exchange.set_price(symbol, price)
+    await exchange.start()
+    print(f"模擬交易所已啟動: {exchange.url}（api-key={exchange.api_key}，Webhook: {exchange.webhook_url}）")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await exchange.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bitunix 模擬交易所 / 端到端主循環基準測試")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("serve", "只啟動模擬交易所"), ("bench", "以合成K線驅動策略主循環並量測延遲")):
+        cmd = sub.add_parser(name, help=help_text)
+        cmd.add_argument("--balance", type=float, default=DEFAULT_BALANCE, help="初始可用餘額")
+        cmd.add_argument("--latency", type=float, default=0.0, help="每個請求的固定延遲（秒）")
+        cmd.add_argument("--jitter", type=float, default=0.0, help="每個請求額外的隨機延遲上限（秒）")
+        cmd.add_argument("--error-rate", type=float, default=0.0, help="隨機回傳 HTTP 503 的機率")
+        cmd.add_argument("--seed", type=int, default=0, help="隨機種子（K線與錯誤注入）")
+    serve = sub.choices["serve"]
+    serve.add_argument("--port", type=int, default=8901)
+    serve.add_argument("--api-key", default=DEFAULT_API_KEY)
+    serve.add_argument("--secret-key", default=DEFAULT_SECRET_KEY)
+    serve.add_argument("--price", action="append", metavar="SYMBOL=PRICE", help="初始最新價（可重複）")
+    bench = sub.choices["bench"]
+    bench.add_argument("--candles", type=int, default=1000, help="驅動的K線根數（迭代次數）")
+    bench.add_argument("--window", type=int, default=100, help="每輪傳入策略的K線根數")
+    bench.add_argument("--symbol", default=None, help="交易符號（預設 config.SYMBOL）")
+    bench.add_argument("--rate-limited", action="store_true", help="套用 config 的請求額度限制")
+    bench.add_argument("--verbose", action="store_true", help="顯示機器人的終端輸出")
+    args = parser.parse_args()
+    if args.command == "serve":
+        asyncio.run(_serve(args))
+        return
+    from config import SYMBOL
+    result = asyncio.run(run_benchmark(args.candles, args.window, args.symbol or SYMBOL, args.balance, args.latency,
+                                       args.jitter, args.error_rate, args.seed, args.rate_limited, args.verbose))
+    print_benchmark(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+策略參數最佳化：以多進程平行回測 config.py 策略參數的網格 / 隨機組合，輸出排名結果表。
+
+- K 線與所有用到的指標序列（每種指標、每種長度只計算一次）放在 multiprocessing.shared_memory，
+  子進程直接映射同一塊記憶體，不需 pickle 大陣列
+- 子進程只保留共享記憶體的唯讀陣列視圖，每個任務只把需要的 K 線區間轉為 Python 列表，用完即釋放
+- 結果依指定欄位排序，印出前 N 名並可寫入 CSV
+
+使用方式：
+    python optimizer.py --csv ETHUSDT_4h.csv --param RSI_BUY=40:50 --param EXIT_RSI=40,44,48 --param ATR_MULT=2:4:0.25
+    python optimizer.py --fetch --since 2021-01-01 --param RSI_LEN=8:16 --param rsiSell=50:60 --random 2000 --out results.csv
+參數範圍格式：NAME=a,b,c（列舉）或 NAME=start:stop[:step]（含 stop，step 預設 1）。
+"""
+import argparse
+import itertools
+import multiprocessing
+import os
+import random
+import time
+from datetime import datetime, timezone
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from config import TRADING_PAIR, TIMEFRAME, BACKTEST_FEE_RATE, BACKTEST_INITIAL_CAPITAL
+from backtest import candle_columns, simulate, load_ohlcv, fetch_history
+from indicators import INDICATOR_KINDS, indicator_series, random_ohlcv
+from strategy_rules import StrategyParams, CONFIG_FIELDS, INT_FIELDS
+
+SORT_KEYS = ('total_return', 'profit_factor', 'win_rate', 'max_drawdown', 'trades', 'final_equity')
+
+
+# === 參數空間 === #
+def parse_param_spec(spec):
+    """解析 NAME=a,b,c 或 NAME=start:stop[:step]，回傳 (StrategyParams 欄位名稱, 值列表)。"""
+    if "=" not in spec:
+        raise ValueError(f"參數格式錯誤（應為 NAME=值）: {spec}")
+    name, values = spec.split("=", 1)
+    name = name.strip()
+    field = CONFIG_FIELDS.get(name, name)
+    if field not in CONFIG_FIELDS.values():
+        raise ValueError(f"未知的策略參數: {name}（可用: {', '.join(CONFIG_FIELDS)}）")
+    cast = int if field in INT_FIELDS else float
+    if ":" in values:
+        parts = [float(x) for x in values.split(":")]
+        if len(parts) not in (2, 3):
+            raise ValueError(f"範圍格式錯誤（應為 start:stop[:step]）: {spec}")
+        start, stop = parts[0], parts[1]
+        step = parts[2] if len(parts) == 3 else 1.0
+        if step <= 0:
+            raise ValueError(f"step 必須大於 0: {spec}")
+        count = int(np.floor((stop - start) / step + 1e-9)) + 1
+        items = [round(start + k * step, 10) for k in range(max(count, 0))]
+    else:
+        items = [float(x) for x in values.split(",") if x.strip()]
+    items = list(dict.fromkeys(cast(x) for x in items))
+    if not items:
+        raise ValueError(f"參數沒有任何值: {spec}")
+    return field, items
+
+
+def build_combinations(space, base_params, random_count=None, seed=0):
+    """
+    由參數空間（{欄位: 值列表}）產生 StrategyParams 列表：完整網格，或 random_count 組不重複的隨機組合。
+    未列在空間中的欄位沿用 base_params。
+    """
+    fields = list(space)
+    value_lists = [space[f] for f in fields]
+    total = 1
+    for values in value_lists:
+        total *= len(values)
+    if random_count is not None and random_count < total:
+        # 以混合進位解碼索引，不需展開整個網格
+        rng = random.Random(seed)
+        combos = []
+        for index in rng.sample(range(total), random_count):
+            values = []
+            for options in reversed(value_lists):
+                index, k = divmod(index, len(options))
+                values.append(options[k])
+            combos.append(dict(zip(fields, reversed(values))))
+    else:
+        combos = [dict(zip(fields, values)) for values in itertools.product(*value_lists)]
+    params = [base_params.with_values(**combo) for combo in combos]
+    # 依指標長度排序，結果順序與抽樣方式無關
+    params.sort(key=lambda p: (p.rsi_len, p.atr_len, p.breakout_lookback))
+    return params
+
+
+def required_series(combos):
+    """所有組合用到的 (指標種類, 長度)，每種只需計算一次。"""
+    keys = set()
+    for p in combos:
+        keys.update(zip(INDICATOR_KINDS, (p.rsi_len, p.atr_len, p.breakout_lookback, p.breakout_lookback)))
+    return sorted(keys)
+
+
+# === 共享記憶體 === #
+def _to_shared(array):
+    """將陣列複製到新的 SharedMemory，回傳 (shm, 描述子)；描述子可傳給子進程以 _attach 映射。"""
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    view = np.ndarray(array.shape, dtype=np.float64, buffer=shm.buf)
+    view[:] = array
+    return shm, (shm.name, array.shape)
+
+
+def _attach(descriptor):
+    name, shape = descriptor
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+
+
+# === 子進程 === #
+_worker = {}
+
+
+def _init_worker(ohlcv_desc, series_desc, series_index, backtest_kwargs):
+    """子進程初始化：映射共享記憶體，只保留唯讀的陣列視圖（不複製成 Python 列表）。"""
+    ohlcv_shm, ohlcv = _attach(ohlcv_desc)
+    series_shm, series = _attach(series_desc)
+    _worker.update(
+        shm=(ohlcv_shm, series_shm),  # 保留參考，避免映射被釋放
+        ohlcv=ohlcv,
+        series=series,
+        index=series_index,
+        kwargs=backtest_kwargs,
+    )
+
+
+def _window(params, start=0, end=None):
+    """K 線區間 [start, end) 的 candle_columns 與四個指標列表，只轉換這段區間。"""
+    lengths = (params.rsi_len, params.atr_len, params.breakout_lookback, params.breakout_lookback)
+    series, index = _worker["series"], _worker["index"]
+    indicators = [series[index[key], start:end].tolist() for key in zip(INDICATOR_KINDS, lengths)]
+    return candle_columns(_worker["ohlcv"][start:end]), indicators
+
+
+def _evaluate(params):
+    columns, indicators = _window(params)
+    result = simulate(columns, indicators, params, **_worker["kwargs"])
+    row = params.to_dict()
+    row.update(result.summary())
+    return row
+
+
+def _evaluate_range(task):
+    """
+    回測 K 線區間 [start, end)：task 為 (tag, params, start, end, with_trades)，回傳 (tag, row)。
+    指標取自完整歷史的序列，區間開頭不需重新暖機；with_trades 為真時 row 另含 trades 明細。
+    """
+    tag, params, start, end, with_trades = task
+    columns, indicators = _window(params, start, end)
+    result = simulate(columns, indicators, params, **_worker["kwargs"])
+    row = params.to_dict()
+    row.update(result.summary())
+    if with_trades:
+        row["trades_list"] = result.trades
+    return tag, row
+
+
+# === 主程序 === #
+class BacktestPool:
+    """
+    共享記憶體回測進程池：K 線與 combos 用到的所有指標序列只計算、複製一次，子進程以唯讀映射讀取。
+    workers=1 時在目前進程執行（方便除錯）。以 with 使用，離開時關閉進程池並釋放共享記憶體。
+    """
+
+    def __init__(self, ohlcv, combos, workers=None, backtest_kwargs=None):
+        self.workers = workers or os.cpu_count() or 1
+        keys = required_series(combos)
+        series = np.empty((len(keys), len(ohlcv)), dtype=np.float64)
+        for row, (kind, length) in enumerate(keys):
+            series[row] = indicator_series(ohlcv, kind, length)
+        self.series_count = len(keys)
+        series_index = {key: row for row, key in enumerate(keys)}
+        self._shm = []
+        self.pool = None
+        try:
+            ohlcv_shm, ohlcv_desc = _to_shared(np.ascontiguousarray(ohlcv, dtype=np.float64))
+            self._shm.append(ohlcv_shm)
+            series_shm, series_desc = _to_shared(series)
+            self._shm.append(series_shm)
+            del series
+            initargs = (ohlcv_desc, series_desc, series_index, backtest_kwargs or {})
+            if self.workers == 1:
+                _init_worker(*initargs)
+            else:
+                self.pool = multiprocessing.Pool(self.workers, initializer=_init_worker, initargs=initargs)
+        except BaseException:
+            self.close(terminate=True)
+            raise
+
+    def imap(self, func, tasks, count=None):
+        """以子進程執行 func(task)，依完成順序逐一產出結果；count 為 tasks 數量（用於決定 chunksize）。"""
+        if self.pool is None:
+            return map(func, tasks)
+        count = count if count is not None else len(tasks)
+        chunksize = max(1, count // (self.workers * 8))
+        return self.pool.imap_unordered(func, tasks, chunksize=chunksize)
+
+    def evaluate(self, combos):
+        """回測完整歷史，產出每組參數的 summary 列。"""
+        return self.imap(_evaluate, combos)
+
+    def evaluate_ranges(self, tasks):
+        """回測 (tag, params, start, end, with_trades) 區間任務，產出 (tag, row)。"""
+        return self.imap(_evaluate_range, tasks)
+
+    def close(self, terminate=False):
+        if self.pool is not None:
+            if terminate:
+                self.pool.terminate()
+            else:
+                self.pool.close()
+            self.pool.join()
+            self.pool = None
+        elif self.workers == 1:
+            _worker.clear()
+        for shm in self._shm:
+            shm.close()
+            shm.unlink()
+        self._shm = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(terminate=exc_type is not None)
+
+
+def optimize(ohlcv, combos, workers=None, backtest_kwargs=None, progress=True):
+    """
+    平行回測所有參數組合，回傳結果 DataFrame（每列為一組參數與其 summary）。
+    workers=1 時在目前進程執行（方便除錯）。
+    """
+    rows = []
+    report_every = max(1, len(combos) // 10)
+    with BacktestPool(ohlcv, combos, workers, backtest_kwargs) as pool:
+        print(f"參數組合 {len(combos)} 組，指標序列 {pool.series_count} 條，K線 {len(ohlcv)} 根，進程數 {pool.workers}")
+        start = time.perf_counter()
+        for row in pool.evaluate(combos):
+            rows.append(row)
+            if progress and len(rows) % report_every == 0:
+                elapsed = time.perf_counter() - start
+                print(f"進度 {len(rows)}/{len(combos)}，已耗時 {elapsed:.1f} 秒")
+    return pd.DataFrame(rows)
+
+
+def rank_results(df, sort_by='total_return', min_trades=0):
+    """依 sort_by 排序（max_drawdown 越小越好，其餘越大越好），過濾交易數不足的組合。"""
+    if df.empty:
+        return df
+    df = df[df['trades'] >= min_trades]
+    ascending = sort_by == 'max_drawdown'
+    return df.sort_values(sort_by, ascending=ascending).reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="策略參數平行最佳化（網格 / 隨機搜尋）")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--csv", help="K線檔案（.csv 或 .npy）")
+    source.add_argument("--fetch", action="store_true", help="從 Binance 下載 TRADING_PAIR / TIMEFRAME 歷史K線")
+    source.add_argument("--synthetic", type=int, metavar="N", help="以 N 根隨機K線測試")
+    parser.add_argument("--since", default="2020-01-01", help="--fetch 起始日期（UTC）")
+    parser.add_argument("--param", action="append", required=True, metavar="NAME=VALUES",
+                        help="參數範圍，可重複指定，例如 RSI_BUY=40:50 或 EXIT_RSI=40,44,48")
+    parser.add_argument("--random", type=int, metavar="N", help="隨機抽樣 N 組（省略則跑完整網格）")
+    parser.add_argument("--seed", type=int, default=0, help="隨機搜尋種子")
+    parser.add_argument("--workers", type=int, default=None, help="進程數（預設為 CPU 核心數）")
+    parser.add_argument("--sort", choices=SORT_KEYS, default="total_return", help="排序欄位")
+    parser.add_argument("--min-trades", type=int, default=0, help="交易次數少於此值的組合不列入排名")
+    parser.add_argument("--top", type=int, default=20, help="顯示前 N 名")
+    parser.add_argument("--capital", type=float, default=BACKTEST_INITIAL_CAPITAL, help="初始資金")
+    parser.add_argument("--fee-rate", type=float, default=BACKTEST_FEE_RATE, help="手續費率（每邊）")
+    parser.add_argument("--out", help="完整排名結果輸出 CSV")
+    args = parser.parse_args()
+
+    try:
+        space = dict(parse_param_spec(spec) for spec in args.param)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.csv:
+        ohlcv = load_ohlcv(args.csv)
+    elif args.fetch:
+        since_ms = int(datetime.strptime(args.since, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp() * 1000)
+        ohlcv = fetch_history(TRADING_PAIR, TIMEFRAME, since_ms)
+    else:
+        ohlcv = random_ohlcv(args.synthetic)
+
+    combos = build_combinations(space, StrategyParams.from_config(), args.random, args.seed)
+    start = time.perf_counter()
+    results = optimize(ohlcv, combos, args.workers, {"initial_capital": args.capital, "fee_rate": args.fee_rate})
+    elapsed = time.perf_counter() - start
+    ranked = rank_results(results, args.sort, args.min_trades)
+    print(f"完成 {len(combos)} 組回測，耗時 {elapsed:.1f} 秒（依 {args.sort} 排序）")
+    with pd.option_context('display.width', 200, 'display.max_columns', None, 'display.float_format', '{:.4f}'.format):
+        print(ranked.head(args.top).to_string())
+    if args.out:
+        ranked.to_csv(args.out, index=False)
+        print(f"完整結果已寫入 {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+模擬交易（paper trading）：以程式內的模擬撮合引擎（matching_engine.PaperExchange）取代真實的 Bitunix 下單與查詢。
+
+- PaperClient：與 BitunixClient 相同介面（get / post / snapshot），請求直接交給 PaperExchange，
+  不經過網路與請求排程器；PAPER_TRADING = True 時機器人以 register_client 換上此客戶端，
+  send_order、place_conditional_orders、modify_position_tpsl、cancel_tpsl_order 等函數不需修改
+- replay：以歷史K線加速重播，逐根執行實盤的 execute_trading_strategy
+
+使用方式：
+    python paper_trading.py --csv ETHUSDT_4h.csv                 # 以實盤策略程式碼重播歷史K線（不限速）
+    python paper_trading.py --synthetic 5000 --speed 500          # 以 500 倍實際時間重播
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import shutil
+import tempfile
+import time
+
+from bitunix_client import ExchangeSnapshot
+from candle_cache import timeframe_ms
+from matching_engine import PaperExchange, DEFAULT_BALANCE, DEFAULT_FEE_RATE
+
+
+class PaperClient:
+    """
+    與 BitunixClient 相同介面的模擬客戶端：請求直接交給 PaperExchange 處理，不經過網路與請求排程器。
+    """
+
+    def __init__(self, exchange, api_key="", secret_key=""):
+        self.exchange = exchange
+        self.api_key = api_key
+        self.secret_key = secret_key
+        self.snapshot = ExchangeSnapshot(self)
+
+    async def get(self, path, params=None, timeout=None, priority=None):
+        return self.exchange.request("GET", path, {k: str(v) for k, v in (params or {}).items()})
+
+    async def post(self, path, body, timeout=None, priority=None):
+        return self.exchange.request("POST", path, dict(body))
+
+    async def close(self):
+        pass
+
+
+# === 加速重播 === #
+async def replay(ohlcv, symbol, timeframe, window=100, speed=0.0, balance=DEFAULT_BALANCE, fee_rate=DEFAULT_FEE_RATE, verbose=False):
+    """
+    以實盤的 execute_trading_strategy 逐根重播K線（下單、止盈止損與查詢全部由 PaperExchange 處理）。
+    speed > 0 時以「K線週期 / speed」的間隔送出每根K線（例如 4h K線、speed=500 約每 28.8 秒一根），0 表示不限速。
+    回傳統計 dict；狀態資料庫與事件日誌寫入暫存目錄，不影響實盤與模擬交易的檔案。
+    """
+    import bitunix_trading_bot as bot
+    from bitunix_client import register_client
+    from event_journal import EventJournal
+    from state_store import StateStore
+    from symbol_context import SymbolContext
+
+    # 與 PAPER_TRADING 模式相同：execute_trading_strategy 每輪以傳入的K線呼叫 paper_exchange.on_candles
+    exchange = bot.paper_exchange = PaperExchange(balance, fee_rate)
+    client = register_client(PaperClient(exchange, bot.BITUNIX_API_KEY, bot.BITUNIX_SECRET_KEY))
+    workdir = tempfile.mkdtemp(prefix="paper-replay-")
+    bot.state_store = StateStore(os.path.join(workdir, "state.db"))
+    bot.event_journal = EventJournal(os.path.join(workdir, "events.jsonl"))
+    ctx = SymbolContext(symbol, timeframe=timeframe)
+    interval = timeframe_ms(timeframe) / 1000 / speed if speed > 0 else 0.0
+    devnull = None if verbose else open(os.devnull, "w", encoding="utf-8")
+    try:
+        with contextlib.redirect_stdout(devnull) if devnull is not None else contextlib.nullcontext():
+            start = time.perf_counter()
+            for n, i in enumerate(range(window, len(ohlcv)), start=1):
+                client.snapshot.invalidate(symbol)
+                await bot.execute_trading_strategy(ctx, client.api_key, client.secret_key, ohlcv_data=ohlcv[i - window + 1:i + 1])
+                if interval:
+                    await asyncio.sleep(max(0.0, start + n * interval - time.perf_counter()))
+            elapsed = time.perf_counter() - start
+    finally:
+        bot.paper_exchange = None
+        bot.state_store.close()
+        bot.event_journal.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+        if devnull is not None:
+            devnull.close()
+    candles = max(len(ohlcv) - window, 0)
+    closed = [o for o in exchange.history if o["tradeSide"] == "CLOSE"]
+    return {
+        "candles": candles,
+        "seconds": elapsed,
+        "candles_per_second": candles / elapsed if elapsed > 0 else float("inf"),
+        "speedup": candles * timeframe_ms(timeframe) / 1000 / elapsed if elapsed > 0 else float("inf"),
+        "trades": len(closed),
+        "wins": sum(1 for o in closed if float(o["profit"]) > 0),
+        "triggered": dict(exchange.triggered),
+        "equity": exchange.equity(),
+        "open_positions": len(exchange.positions),
+    }
+
+
+def main():
+    from backtest import load_ohlcv, fetch_history
+    from config import SYMBOL, TRADING_PAIR, TIMEFRAME, PAPER_INITIAL_BALANCE, PAPER_FEE_RATE
+    from datetime import datetime, timezone
+    from indicators import random_ohlcv
+
+    parser = argparse.ArgumentParser(description="以模擬撮合引擎加速重播實盤策略")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--csv", help="K線檔案（.csv 或 .npy）")
+    source.add_argument("--fetch", action="store_true", help="從 Binance 下載 TRADING_PAIR / TIMEFRAME 歷史K線")
+    source.add_argument("--synthetic", type=int, metavar="N", help="以 N 根隨機K線重播")
+    parser.add_argument("--since", default="2020-01-01", help="--fetch 起始日期（UTC）")
+    parser.add_argument("--window", type=int, default=100, help="每輪傳入策略的K線根數")
+    parser.add_argument("--speed", type=float, default=0.0, help="重播倍速（相對K線實際時間），0 表示不限速")
+    parser.add_argument("--balance", type=float, default=PAPER_INITIAL_BALANCE, help="模擬帳戶初始可用餘額")
+    parser.add_argument("--fee-rate", type=float, default=PAPER_FEE_RATE, help="手續費率（每邊）")
+    parser.add_argument("--verbose", action="store_true", help="顯示機器人的終端輸出")
+    args = parser.parse_args()
+
+    if args.csv:
+        ohlcv = load_ohlcv(args.csv)
+    elif args.fetch:
+        since = datetime.strptime(args.since, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        ohlcv = fetch_history(TRADING_PAIR, TIMEFRAME, int(since.timestamp() * 1000))
+    else:
+        ohlcv = random_ohlcv(args.synthetic)
+    result = asyncio.run(replay(ohlcv, SYMBOL, TIMEFRAME, args.window, args.speed, args.balance, args.fee_rate, args.verbose))
+    print(f"重播 {result['candles']} 根K線，耗時 {result['seconds']:.2f} 秒（{result['candles_per_second']:.0f} 根/秒，約 {result['speedup']:.0f} 倍實際時間）")
+    print(f"平倉 {result['trades']} 筆（獲利 {result['wins']} 筆），止盈止損觸發 {result['triggered'] or 0}，未平倉 {result['open_positions']} 筆")
+    print(f"模擬帳戶權益: {result['equity']:.2f}（初始 {args.balance:.2f}）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""
+Bitunix 私有頻道 WebSocket（訂單、持倉、止盈止損推送）。
+
+- PrivateStream：登入後訂閱 order / position / tpsl 頻道，交易所推送時立即解析
+  orderId -> positionId 與平倉的已實現盈虧；下單流程以 wait_position_id / wait_position_closed
+  等待推送結果，連線中斷或逾時才退回 REST 輪詢。斷線自動重連（指數退避）
+- PrivateStandInServer：本地替身伺服器，驗證登入簽名並可由測試程式推送事件，用於離線驗證整個流程
+
+推送格式（data 欄位）：
+- order：orderId, symbol, side(BUY/SELL), orderStatus, reductionOnly, price/avgPrice ...（部分情況含 positionId）
+- position：event(OPEN/UPDATE/CLOSE), positionId, symbol, side(LONG/SHORT), qty, realizedPNL ...
+- tpsl：event, positionId, orderId, symbol, type/status ...
+"""
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict, deque
+
+import aiohttp
+from aiohttp import web
+
+from bitunix_client import sha256_hex
+
+BITUNIX_PRIVATE_WS_URL = "wss://fapi.bitunix.com/private/"
+PRIVATE_CHANNELS = ("order", "position", "tpsl")
+PING_SECONDS = 15  # 應用層 ping 間隔（秒）
+RECONNECT_DELAY_SECONDS = 1
+MAX_RECONNECT_DELAY_SECONDS = 30
+CACHE_SIZE = 500  # orderId / positionId 對應結果最多保留筆數
+OPEN_SIDE_TO_POSITION = {"BUY": "LONG", "SELL": "SHORT"}
+
+
+def login_sign(api_key, secret_key, nonce, timestamp):
+    """私有頻道登入簽名：sha256(sha256(nonce + timestamp + apiKey) + secretKey)。"""
+    return sha256_hex(sha256_hex(f"{nonce}{timestamp}{api_key}") + secret_key)
+
+
+def login_message(api_key, secret_key):
+    nonce = uuid.uuid4().hex
+    timestamp = int(time.time())
+    return {"op": "login", "args": [{"apiKey": api_key, "timestamp": timestamp, "nonce": nonce,
+                                     "sign": login_sign(api_key, secret_key, nonce, timestamp)}]}
+
+
+def subscribe_message(channels=PRIVATE_CHANNELS):
+    return {"op": "subscribe", "args": [{"ch": ch} for ch in channels]}
+
+
+def _position_side(side):
+    """持倉推送的方向統一為 LONG / SHORT（部分推送使用 BUY / SELL）。"""
+    side = str(side or "").upper()
+    return OPEN_SIDE_TO_POSITION.get(side, side)
+
+
+def parse_pnl(value):
+    """交易所以字串回傳的盈虧轉為 float，缺少或無法解析時回傳 None。"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class _BoundedDict(OrderedDict):
+    """超過容量時丟棄最舊項目的 dict。"""
+
+    def __init__(self, maxlen=CACHE_SIZE):
+        super().__init__()
+        self.maxlen = maxlen
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.maxlen:
+            self.popitem(last=False)
+
+
+class PrivateStream:
+    """
+    單一 API 金鑰的私有頻道連線。live 為 True 代表已登入並訂閱，推送結果可信。
+    """
+
+    def __init__(self, api_key, secret_key, url=BITUNIX_PRIVATE_WS_URL, session=None):
+        self.api_key = api_key
+        self.secret_key = secret_key
+        self.url = url
+        self.live = False
+        self.reconnects = 0
+        self.last_message_time = None
+        self.order_positions = _BoundedDict()  # orderId -> positionId
+        self.closed_positions = _BoundedDict()  # positionId -> {"profit", "close_price", "trigger_type"}
+        self.tpsl_events = _BoundedDict()  # positionId -> 最新一筆 tpsl 推送
+        self._last_order_price = _BoundedDict()  # positionId -> 最近成交價
+        self._pending_fills = {}  # (symbol, LONG/SHORT) -> 等待持倉推送對應的開倉 orderId
+        self._order_waiters = {}  # orderId -> [Future]
+        self._close_waiters = {}  # positionId -> [Future]
+        self._session = session
+        self._stopped = False
+
+    # === 推送處理 === #
+    def handle(self, message):
+        """處理一則推送訊息（dict）。"""
+        channel = message.get("ch")
+        data = message.get("data")
+        if channel is None or data is None:
+            return
+        for item in data if isinstance(data, list) else [data]:
+            if channel == "order":
+                self._on_order(item)
+            elif channel == "position":
+                self._on_position(item)
+            elif channel == "tpsl":
+                position_id = item.get("positionId")
+                if position_id:
+                    self.tpsl_events[str(position_id)] = item
+
+    def _on_order(self, data):
+        order_id = str(data.get("orderId", ""))
+        if not order_id:
+            return
+        position_id = data.get("positionId")
+        price = data.get("avgPrice") or data.get("price")
+        if position_id:
+            self._resolve_order(order_id, str(position_id))
+            if price:
+                self._last_order_price[str(position_id)] = price
+            return
+        status = str(data.get("orderStatus", "")).upper()
+        closing = data.get("reductionOnly") in (True, "true") or str(data.get("tradeSide", "")).upper() == "CLOSE"
+        if status in ("FILLED", "PART_FILLED") and not closing and order_id not in self.order_positions:
+            # 訂單推送沒有 positionId：等同交易對、同方向的下一則持倉推送再對應
+            side = OPEN_SIDE_TO_POSITION.get(str(data.get("side", "")).upper())
+            queue = self._pending_fills.setdefault((data.get("symbol"), side), deque(maxlen=20))
+            if order_id not in queue:
+                queue.append(order_id)
+
+    def _on_position(self, data):
+        position_id = data.get("positionId")
+        if not position_id:
+            return
+        position_id = str(position_id)
+        event = str(data.get("event", "")).upper()
+        key = (data.get("symbol"), _position_side(data.get("side")))
+        if event in ("OPEN", "UPDATE"):
+            queue = self._pending_fills.get(key)
+            if queue:
+                self._resolve_order(queue.popleft(), position_id)
+        elif event == "CLOSE":
+            tpsl = self.tpsl_events.get(position_id) or {}
+            result = {
+                "profit": parse_pnl(data.get("realizedPNL")),
+                "close_price": self._last_order_price.get(position_id),
+                "trigger_type": tpsl.get("type", tpsl.get("status", "")),
+            }
+            self.closed_positions[position_id] = result
+            for future in self._close_waiters.pop(position_id, []):
+                if not future.done():
+                    future.set_result(result)
+
+    def _resolve_order(self, order_id, position_id):
+        self.order_positions[order_id] = position_id
+        for future in self._order_waiters.pop(order_id, []):
+            if not future.done():
+                future.set_result(position_id)
+
+    # === 等待推送結果 === #
+    async def _wait(self, waiters, key, cache, timeout):
+        if key in cache:
+            return cache[key]
+        future = asyncio.get_running_loop().create_future()
+        waiters.setdefault(key, []).append(future)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            pending = waiters.get(key)
+            if pending is not None and future in pending:
+                pending.remove(future)
+                if not pending:
+                    waiters.pop(key, None)
+
+    async def wait_position_id(self, order_id, timeout):
+        """等待 orderId 對應的 positionId 推送，逾時回傳 None。"""
+        return await self._wait(self._order_waiters, str(order_id), self.order_positions, timeout)
+
+    async def wait_position_closed(self, position_id, timeout):
+        """等待持倉平倉推送，回傳 {"profit", "close_price", "trigger_type"}，逾時回傳 None。"""
+        return await self._wait(self._close_waiters, str(position_id), self.closed_positions, timeout)
+
+    # === 連線 === #
+    async def _ping(self, ws):
+        while True:
+            await asyncio.sleep(PING_SECONDS)
+            await ws.send_json({"op": "ping", "ping": int(time.time())})
+
+    async def _run_once(self, session):
+        async with session.ws_connect(self.url) as ws:
+            await ws.send_json(login_message(self.api_key, self.secret_key))
+            ping_task = asyncio.create_task(self._ping(ws))
+            try:
+                async for msg in ws:
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        break
+                    message = json.loads(msg.data)
+                    self.last_message_time = time.time()
+                    if message.get("op") == "login":
+                        data = message.get("data") or {}
+                        if message.get("code", 0) != 0 or data.get("result") is False:
+                            raise ConnectionError(f"私有頻道登入失敗: {message}")
+                        await ws.send_json(subscribe_message())
+                        self.live = True
+                        print("[PrivateStream] 已登入並訂閱 order / position / tpsl")
+                    elif "ch" in message:
+                        self.handle(message)
+            finally:
+                ping_task.cancel()
+
+    async def run(self):
+        """持續接收推送，斷線後以指數退避自動重連，直到 stop()。"""
+        own_session = self._session is None
+        session = self._session or aiohttp.ClientSession()
+        delay = RECONNECT_DELAY_SECONDS
+        try:
+            while not self._stopped:
+                connected_at = time.time()
+                try:
+                    await self._run_once(session)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"[PrivateStream] 連線錯誤: {e!r}")
+                self.live = False
+                if self._stopped:
+                    break
+                if time.time() - connected_at > MAX_RECONNECT_DELAY_SECONDS:
+                    delay = RECONNECT_DELAY_SECONDS
+                self.reconnects += 1
+                print(f"[PrivateStream] {delay} 秒後重連...")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY_SECONDS)
+        finally:
+            self.live = False
+            if own_session:
+                await session.close()
+
+    def stop(self):
+        self._stopped = True
+
+
+class PrivateStandInServer:
+    """
+    本地私有頻道替身伺服器：驗證登入簽名、記錄訂閱頻道，push() 推送事件給所有已登入的連線。
+    """
+
+    def __init__(self, api_key, secret_key, host="127.0.0.1", port=0):
+        self.api_key = api_key
+        self.secret_key = secret_key
+        self.host = host
+        self.port = port
+        self.subscriptions = set()
+        self.logins = 0
+        self._clients = set()
+        self._runner = None
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}/private/"
+
+    async def _ws_handler(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        try:
+            async for msg in ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    break
+                message = json.loads(msg.data)
+                op = message.get("op")
+                if op == "login":
+                    args = message["args"][0]
+                    ok = (args.get("apiKey") == self.api_key and
+                          args.get("sign") == login_sign(self.api_key, self.secret_key, args.get("nonce"), args.get("timestamp")))
+                    await ws.send_json({"op": "login", "code": 0 if ok else 10003, "data": {"result": ok}})
+                    if not ok:
+                        break
+                    self.logins += 1
+                elif op == "subscribe":
+                    self.subscriptions.update(arg["ch"] for arg in message.get("args", []))
+                    self._clients.add(ws)
+                elif op == "ping":
+                    await ws.send_json({"op": "ping", "pong": message.get("ping"), "ping": int(time.time())})
+        finally:
+            self._clients.discard(ws)
+        return ws
+
+    async def push(self, channel, data):
+        """推送一則事件給所有已訂閱的連線，回傳送達的連線數。"""
+        message = {"ch": channel, "ts": int(time.time() * 1000), "data": data}
+        for ws in list(self._clients):
+            await ws.send_json(message)
+        return len(self._clients)
+
+    async def disconnect_all(self):
+        """中斷所有連線（測試重連）。"""
+        for ws in list(self._clients):
+            await ws.close()
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/private/", self._ws_handler)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
@@ -0,0 +1,287 @@
+"""
+策略穩健性測試：walk-forward 滾動樣本內 / 樣本外驗證，加上交易順序的 bootstrap / Monte-Carlo 重抽樣。
+
+- Walk-forward：歷史切成滾動（或 --anchored 錨定起點）的樣本內 / 樣本外窗口，每個窗口在樣本內重新最佳化
+  （--param 參數空間，省略則只測 config.py 參數），以排名第一的參數回測緊接的樣本外區間，並與 config.py 參數比較
+- Monte-Carlo：把樣本外（或 config.py 參數完整歷史）的逐筆交易報酬重抽樣，得到最終報酬與最大回撤的分佈
+- 回測沿用 optimizer.BacktestPool：K 線與所有指標序列只計算一次，放在共享記憶體供子進程唯讀映射；
+  重抽樣分批送到同一個進程池，每批矩陣大小有上限，上萬次重抽樣也不會佔滿記憶體
+- 每個窗口、每批重抽樣完成就追加寫入 --out-dir 下的 CSV，中途中斷也保留已完成的結果
+
+使用方式：
+    python robustness.py --csv ETHUSDT_4h.csv --train 3000 --test 500 --param RSI_BUY=40:50 --param ATR_MULT=2:4:0.5
+    python robustness.py --fetch --since 2020-01-01 --train 2000 --test 500 --anchored --resamples 10000 --mc-method shuffle
+"""
+import argparse
+import csv
+import math
+import os
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from config import TRADING_PAIR, TIMEFRAME, BACKTEST_FEE_RATE, BACKTEST_INITIAL_CAPITAL
+from backtest import load_ohlcv, fetch_history
+from indicators import random_ohlcv
+from optimizer import SORT_KEYS, BacktestPool, parse_param_spec, build_combinations, rank_results
+from strategy_rules import StrategyParams
+
+MC_METHODS = ('bootstrap', 'shuffle')
+MC_CHUNK_SIZE = 250  # 每批重抽樣次數（與進程數無關，同一個種子的結果固定）
+MC_CHUNK_ELEMENTS = 2_000_000  # 每批報酬矩陣元素上限（約 16 MB），交易筆數多時自動縮小批次
+PERCENTILES = (5, 25, 50, 75, 95)
+SUMMARY_FIELDS = ('trades', 'win_rate', 'total_return', 'max_drawdown', 'profit_factor')
+TRADE_FIELDS = ('window', 'entry_time', 'exit_time', 'side', 'entry_type', 'entry_price', 'exit_price', 'qty', 'fee', 'pnl', 'exit_reason', 'return')
+
+
+# === Walk-forward === #
+def walk_forward_windows(n, train, test, step=None, anchored=False):
+    """
+    切出 (樣本內起點, 樣本內終點, 樣本外起點, 樣本外終點) 列表（K 線索引，終點不含）。
+    每次向後移動 step 根（預設為 test，樣本外區間首尾相接）；anchored 時樣本內固定從第 0 根開始。
+    """
+    if train <= 0 or test <= 0:
+        raise ValueError("train / test 必須大於 0")
+    step = step or test
+    windows = []
+    start = 0
+    while start + train + test <= n:
+        split = start + train
+        windows.append((0 if anchored else start, split, split, split + test))
+        start += step
+    if not windows:
+        raise ValueError(f"K線數量 {n} 不足一個窗口（train={train}, test={test}）")
+    return windows
+
+
+def trade_returns(trades, initial_capital):
+    """逐筆交易報酬：每筆 pnl 除以該筆進場前的資金（回測以全部可用資金計算下單數量，報酬可直接連乘）。"""
+    pnls = np.array([t[8] for t in trades], dtype=np.float64)
+    if not len(pnls):
+        return pnls
+    cash_before = initial_capital + np.concatenate(([0.0], np.cumsum(pnls)[:-1]))
+    return np.maximum(pnls / cash_before, -1.0)  # 爆倉加手續費可能略超過全部資金，視為歸零
+
+
+def _format_time(ms):
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).strftime("%Y-%m-%d %H:%M")
+
+
+def _open_csv(path, fieldnames):
+    handle = open(path, "w", newline="", encoding="utf-8")
+    writer = csv.DictWriter(handle, fieldnames=fieldnames, extrasaction="ignore")
+    writer.writeheader()
+    return handle, writer
+
+
+def walk_forward(pool, ohlcv, windows, combos, base_params, fields, out_dir, sort_by='total_return', min_trades=0,
+                 initial_capital=BACKTEST_INITIAL_CAPITAL):
+    """
+    逐窗口樣本內最佳化與樣本外驗證，回傳 (窗口結果 DataFrame, 樣本外逐筆報酬)。
+    樣本內全部結果、窗口結果、樣本外交易明細分別追加寫入 out_dir 的 walk_forward_is.csv、walk_forward.csv、oos_trades.csv。
+    樣本內沒有任何參數達到 min_trades 時，該窗口沿用 base_params。
+    """
+    timestamps = ohlcv[:, 0]
+    param_fields = list(base_params.to_dict())
+    window_fields = (['window', 'is_start', 'is_end', 'oos_start', 'oos_end'] + list(fields)
+                     + [f'{prefix}{key}' for prefix in ('is_', 'oos_', 'config_oos_') for key in SUMMARY_FIELDS])
+    is_file, is_writer = _open_csv(os.path.join(out_dir, "walk_forward_is.csv"), ['window'] + param_fields + list(SUMMARY_FIELDS))
+    window_file, window_writer = _open_csv(os.path.join(out_dir, "walk_forward.csv"), window_fields)
+    trade_file, trade_writer = _open_csv(os.path.join(out_dir, "oos_trades.csv"), TRADE_FIELDS)
+    records = []
+    returns = []
+    try:
+        for w, (is_start, is_end, oos_start, oos_end) in enumerate(windows):
+            started = time.perf_counter()
+            rows = []
+            tasks = [(k, params, is_start, is_end, False) for k, params in enumerate(combos)]
+            for k, row in pool.evaluate_ranges(tasks):
+                row['combo'] = k
+                row['window'] = w
+                rows.append(row)
+                is_writer.writerow(row)
+            is_file.flush()
+
+            ranked = rank_results(pd.DataFrame(rows), sort_by, min_trades)
+            if ranked.empty:
+                best, best_row = base_params, dict.fromkeys(SUMMARY_FIELDS + (sort_by,), math.nan)
+            else:
+                k = int(ranked.at[0, 'combo'])
+                best, best_row = combos[k], next(row for row in rows if row['combo'] == k)
+            oos = dict(pool.evaluate_ranges([("best", best, oos_start, oos_end, True),
+                                             ("config", base_params, oos_start, oos_end, True)]))
+
+            record = {'window': w, 'is_start': _format_time(timestamps[is_start]), 'is_end': _format_time(timestamps[is_end - 1]),
+                      'oos_start': _format_time(timestamps[oos_start]), 'oos_end': _format_time(timestamps[oos_end - 1])}
+            record.update({field: getattr(best, field) for field in fields})
+            record.update({f'is_{key}': best_row[key] for key in SUMMARY_FIELDS})
+            record.update({f'oos_{key}': oos["best"][key] for key in SUMMARY_FIELDS})
+            record.update({f'config_oos_{key}': oos["config"][key] for key in SUMMARY_FIELDS})
+            records.append(record)
+            window_writer.writerow(record)
+            window_file.flush()
+
+            trades = oos["best"]["trades_list"]
+            window_returns = trade_returns(trades, initial_capital)
+            for trade, ret in zip(trades, window_returns):
+                trade_writer.writerow(dict(zip(TRADE_FIELDS, (w,) + tuple(trade) + (ret,))))
+            trade_file.flush()
+            returns.append(window_returns)
+
+            print(f"窗口 {w + 1}/{len(windows)}（{record['oos_start']} ~ {record['oos_end']}）："
+                  f"樣本內 {sort_by}={best_row[sort_by]:.4f}，樣本外報酬 {record['oos_total_return'] * 100:.2f}%"
+                  f"（config {record['config_oos_total_return'] * 100:.2f}%），交易 {record['oos_trades']} 筆，"
+                  f"耗時 {time.perf_counter() - started:.1f} 秒")
+    finally:
+        for handle in (is_file, window_file, trade_file):
+            handle.close()
+    return pd.DataFrame(records), np.concatenate(returns) if returns else np.empty(0)
+
+
+def print_walk_forward_summary(windows_df, windows):
+    """樣本外串接報酬、勝出窗口數與 walk-forward 效率（樣本外每根K線報酬 / 樣本內每根K線報酬）。"""
+    oos = (1 + windows_df['oos_total_return']).prod() - 1
+    config_oos = (1 + windows_df['config_oos_total_return']).prod() - 1
+    beaten = int((windows_df['oos_total_return'] > windows_df['config_oos_total_return']).sum())
+    print(f"樣本外串接報酬: {oos * 100:.2f}%（config.py 參數 {config_oos * 100:.2f}%）")
+    print(f"重新最佳化參數勝過 config.py 的窗口: {beaten}/{len(windows_df)}")
+    print(f"樣本外獲利窗口: {int((windows_df['oos_total_return'] > 0).sum())}/{len(windows_df)}")
+    is_per_bar = (windows_df['is_total_return'] / [end - start for start, end, _, _ in windows]).mean()
+    oos_per_bar = (windows_df['oos_total_return'] / [end - start for _, _, start, end in windows]).mean()
+    if is_per_bar > 0:
+        print(f"walk-forward 效率: {oos_per_bar / is_per_bar:.3f}")
+
+
+# === Monte-Carlo === #
+def _resample_chunk(task):
+    """
+    一批重抽樣：task 為 (起始序號, 次數, 逐筆報酬, 方法, SeedSequence)，回傳 (起始序號, 最終報酬, 最大回撤)。
+    bootstrap 為放回抽樣（最終報酬與回撤都會變動）；shuffle 只打亂順序（最終報酬不變，只看回撤分佈）。
+    """
+    offset, count, returns, method, seed = task
+    rng = np.random.default_rng(seed)
+    n = len(returns)
+    if method == 'bootstrap':
+        samples = returns[rng.integers(0, n, size=(count, n))]
+    else:
+        samples = rng.permuted(np.broadcast_to(returns, (count, n)), axis=1)
+    equity = np.cumprod(1 + samples, axis=1)
+    peak = np.maximum(np.maximum.accumulate(equity, axis=1), 1.0)
+    max_drawdown = np.max((peak - equity) / peak, axis=1)
+    return offset, equity[:, -1] - 1, max_drawdown
+
+
+def monte_carlo(pool, returns, resamples, method='bootstrap', seed=0, path=None):
+    """
+    重抽樣 resamples 次，回傳 DataFrame（final_return, max_drawdown，依序號排列）。
+    每批次數為 MC_CHUNK_SIZE（交易筆數多時依 MC_CHUNK_ELEMENTS 縮小），path 指定時每批完成即追加寫入。
+    """
+    returns = np.ascontiguousarray(returns, dtype=np.float64)
+    chunk = max(1, min(MC_CHUNK_SIZE, MC_CHUNK_ELEMENTS // max(len(returns), 1)))
+    offsets = range(0, resamples, chunk)
+    seeds = np.random.SeedSequence(seed).spawn(len(offsets))
+    tasks = [(offset, min(chunk, resamples - offset), returns, method, s) for offset, s in zip(offsets, seeds)]
+    final_return = np.empty(resamples, dtype=np.float64)
+    max_drawdown = np.empty(resamples, dtype=np.float64)
+    handle, writer = _open_csv(path, ('resample', 'final_return', 'max_drawdown')) if path else (None, None)
+    try:
+        for offset, finals, drawdowns in pool.imap(_resample_chunk, tasks):
+            final_return[offset:offset + len(finals)] = finals
+            max_drawdown[offset:offset + len(finals)] = drawdowns
+            if writer is not None:
+                writer.writerows({'resample': offset + j, 'final_return': f, 'max_drawdown': d}
+                                 for j, (f, d) in enumerate(zip(finals.tolist(), drawdowns.tolist())))
+                handle.flush()
+    finally:
+        if handle is not None:
+            handle.close()
+    return pd.DataFrame({'final_return': final_return, 'max_drawdown': max_drawdown})
+
+
+def print_monte_carlo_summary(mc, returns):
+    """原始交易順序的結果與重抽樣分佈的百分位數。"""
+    equity = np.cumprod(1 + returns)
+    peak = np.maximum(np.maximum.accumulate(equity), 1.0)
+    print(f"原始順序: 最終報酬 {(equity[-1] - 1) * 100:.2f}%，最大回撤 {np.max((peak - equity) / peak) * 100:.2f}%"
+          f"（{len(returns)} 筆交易，重抽樣 {len(mc)} 次）")
+    for column, label in (('final_return', '最終報酬'), ('max_drawdown', '最大回撤')):
+        values = np.percentile(mc[column], PERCENTILES) * 100
+        print(f"{label}: " + "，".join(f"P{p} {v:.2f}%" for p, v in zip(PERCENTILES, values)))
+    print(f"虧損機率: {(mc['final_return'] < 0).mean() * 100:.2f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Walk-forward 樣本外驗證與 Monte-Carlo 交易重抽樣")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--csv", help="K線檔案（.csv 或 .npy）")
+    source.add_argument("--fetch", action="store_true", help="從 Binance 下載 TRADING_PAIR / TIMEFRAME 歷史K線")
+    source.add_argument("--synthetic", type=int, metavar="N", help="以 N 根隨機K線測試")
+    parser.add_argument("--since", default="2020-01-01", help="--fetch 起始日期（UTC）")
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=VALUES",
+                        help="每個窗口樣本內最佳化的參數範圍（格式同 optimizer.py），省略則只驗證 config.py 參數")
+    parser.add_argument("--random", type=int, metavar="N", help="每個窗口隨機抽樣 N 組（省略則跑完整網格）")
+    parser.add_argument("--seed", type=int, default=0, help="隨機搜尋與重抽樣種子")
+    parser.add_argument("--train", type=int, required=True, help="樣本內K線數")
+    parser.add_argument("--test", type=int, required=True, help="樣本外K線數")
+    parser.add_argument("--step", type=int, help="窗口移動K線數（預設為 --test）")
+    parser.add_argument("--anchored", action="store_true", help="樣本內固定從第一根K線開始（擴張窗口）")
+    parser.add_argument("--sort", choices=SORT_KEYS, default="total_return", help="樣本內選擇參數的排序欄位")
+    parser.add_argument("--min-trades", type=int, default=0, help="樣本內交易次數少於此值的組合不列入選擇")
+    parser.add_argument("--resamples", type=int, default=1000, help="Monte-Carlo 重抽樣次數（0 表示略過）")
+    parser.add_argument("--mc-method", choices=MC_METHODS, default="bootstrap", help="重抽樣方式")
+    parser.add_argument("--mc-source", choices=("oos", "config"), default="oos",
+                        help="重抽樣的交易來源：walk-forward 樣本外交易，或 config.py 參數的完整歷史回測")
+    parser.add_argument("--workers", type=int, default=None, help="進程數（預設為 CPU 核心數）")
+    parser.add_argument("--capital", type=float, default=BACKTEST_INITIAL_CAPITAL, help="初始資金")
+    parser.add_argument("--fee-rate", type=float, default=BACKTEST_FEE_RATE, help="手續費率（每邊）")
+    parser.add_argument("--out-dir", default="robustness", help="結果輸出目錄")
+    args = parser.parse_args()
+
+    try:
+        space = dict(parse_param_spec(spec) for spec in args.param)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.csv:
+        ohlcv = load_ohlcv(args.csv)
+    elif args.fetch:
+        since_ms = int(datetime.strptime(args.since, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp() * 1000)
+        ohlcv = fetch_history(TRADING_PAIR, TIMEFRAME, since_ms)
+    else:
+        ohlcv = random_ohlcv(args.synthetic)
+
+    try:
+        windows = walk_forward_windows(len(ohlcv), args.train, args.test, args.step, args.anchored)
+    except ValueError as e:
+        parser.error(str(e))
+    base_params = StrategyParams.from_config()
+    combos = build_combinations(space, base_params, args.random, args.seed) if space else [base_params]
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    backtest_kwargs = {"initial_capital": args.capital, "fee_rate": args.fee_rate}
+    with BacktestPool(ohlcv, combos + [base_params], args.workers, backtest_kwargs) as pool:
+        print(f"窗口 {len(windows)} 個，每窗口參數組合 {len(combos)} 組，指標序列 {pool.series_count} 條，"
+              f"K線 {len(ohlcv)} 根，進程數 {pool.workers}")
+        windows_df, returns = walk_forward(pool, ohlcv, windows, combos, base_params, list(space), args.out_dir,
+                                           args.sort, args.min_trades, args.capital)
+        print_walk_forward_summary(windows_df, windows)
+
+        if args.mc_source == "config":
+            _, row = next(iter(pool.evaluate_ranges([("config", base_params, 0, len(ohlcv), True)])))
+            returns = trade_returns(row["trades_list"], args.capital)
+        if args.resamples > 0 and len(returns):
+            mc_start = time.perf_counter()
+            mc = monte_carlo(pool, returns, args.resamples, args.mc_method, args.seed,
+                             os.path.join(args.out_dir, "monte_carlo.csv"))
+            print(f"Monte-Carlo {args.mc_method} 重抽樣 {args.resamples} 次，耗時 {time.perf_counter() - mc_start:.1f} 秒")
+            print_monte_carlo_summary(mc, returns)
+        elif args.resamples > 0:
+            print("沒有交易可供重抽樣")
+    print(f"完成，總耗時 {time.perf_counter() - start:.1f} 秒，結果已寫入 {args.out_dir}/")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""
+宣告式策略規則引擎：每條規則為 (指標, 比較運算子, 門檻, 動作)，編譯成實盤逐筆判斷與回測向量化判斷共用的規則集。
+
+- Rule：例如 Rule("rsi", "<", "rsi_buy", ENTER)；門檻可為數字、StrategyParams 欄位名稱或另一個指標序列（"highest_break" 等）
+- Strategy：進場類型名稱、方向、止損方式（STOP_FIXED 開倉價 ± ATR 固定止損止盈 / STOP_TRAILING ATR 移動止損）與規則；
+  同一策略的多條 ENTER（或 EXIT）規則須同時成立，策略依登錄順序決定優先權
+- RuleSet：以 StrategyParams 編譯規則集，提供
+  entry_signal / exit_signal（實盤每輪以最新指標值判斷）、entry_signal_at_price（盤中報價以 RSI 觸發價判斷）、
+  entry_codes / exit_masks（回測對整段K線一次算出所有策略的訊號，相同條件只比較一次）
+內建 DEFAULT_STRATEGIES 即 RSI 多單 / 突破多單 / RSI 空單 / 突破空單；config.STRATEGIES 可改用自訂規則（見 load_strategies）。
+指標值為 None 或 NaN（暖機期間）時條件一律不成立。
+"""
+import operator
+from dataclasses import dataclass
+
+import numpy as np
+
+from strategy_rules import StrategyParams, RSI_LONG, BREAKOUT_LONG, RSI_SHORT, BREAKOUT_SHORT
+
+ENTER = "enter"
+EXIT = "exit"
+STOP_FIXED = "atr_fixed"  # 開倉價 ± ATR × STOP_MULT / LIMIT_MULT 止損止盈，每根K線依 ATR 更新
+STOP_TRAILING = "atr_trailing"  # 收盤價 ∓ ATR × ATR_MULT 移動止損，只往有利方向移動
+# state_store 記錄的進場方式（決定重啟還原與持倉訊息使用的止損止盈算法）
+STOP_LABELS = {STOP_FIXED: "RSI", STOP_TRAILING: "Breakout"}
+
+INDICATORS = ("close", "rsi", "atr", "highest_break", "lowest_break")
+SERIES_THRESHOLDS = ("atr", "highest_break", "lowest_break")  # 可作為門檻的指標序列
+EXIT_INDICATORS = ("close", "rsi")  # 平倉規則以剛收盤K線的值判斷，只支援收盤價與 RSI
+COMPARATORS = {
+    "<": (operator.lt, np.less),
+    "<=": (operator.le, np.less_equal),
+    ">": (operator.gt, np.greater),
+    ">=": (operator.ge, np.greater_equal),
+}
+PARAM_FIELDS = tuple(StrategyParams.__dataclass_fields__)
+
+
+@dataclass(frozen=True)
+class Rule:
+    """一條規則：indicator comparator threshold 成立時執行 action（ENTER / EXIT）。"""
+    indicator: str
+    comparator: str
+    threshold: object
+    action: str = ENTER
+
+    def __post_init__(self):
+        if self.indicator not in INDICATORS:
+            raise ValueError(f"未知的指標: {self.indicator}（可用: {', '.join(INDICATORS)}）")
+        if self.comparator not in COMPARATORS:
+            raise ValueError(f"未知的比較運算子: {self.comparator}（可用: {', '.join(COMPARATORS)}）")
+        if self.action not in (ENTER, EXIT):
+            raise ValueError(f"未知的動作: {self.action}（可用: {ENTER}, {EXIT}）")
+        if isinstance(self.threshold, str):
+            if self.threshold not in PARAM_FIELDS and self.threshold not in SERIES_THRESHOLDS:
+                raise ValueError(f"未知的門檻: {self.threshold}（可為數字、策略參數 {', '.join(PARAM_FIELDS)} 或指標 {', '.join(SERIES_THRESHOLDS)}）")
+            if self.threshold in SERIES_THRESHOLDS and (self.indicator == "rsi" or self.action == EXIT):
+                raise ValueError(f"{self.indicator} {self.action} 規則的門檻必須為數字或策略參數: {self.threshold}")
+        elif not isinstance(self.threshold, (int, float)):
+            raise ValueError(f"門檻必須為數字或名稱: {self.threshold!r}")
+        if self.action == EXIT and self.indicator not in EXIT_INDICATORS:
+            raise ValueError(f"平倉規則只支援 {', '.join(EXIT_INDICATORS)}: {self.indicator}")
+
+    @property
+    def threshold_key(self):
+        """RSI 觸發價（IncrementalIndicators.rsi_levels）使用的名稱：策略參數名稱，或數字門檻的字串。"""
+        return self.threshold if isinstance(self.threshold, str) else f"{self.threshold:g}"
+
+
+@dataclass(frozen=True)
+class Strategy:
+    """
+    一種進場策略。name 即持倉的進場類型（ctx.pos_entry_type），title 為通知標題（預設「名稱 多單 / 空單」）；
+    block_after_exit 為真時，此策略依 EXIT 規則平倉的那根K線不再以此策略進場（符合條件時也不改用其他策略）。
+    """
+    name: str
+    side: str
+    stop: str
+    rules: tuple
+    title: str = None
+    block_after_exit: bool = False
+
+    def __post_init__(self):
+        if self.side not in ("long", "short"):
+            raise ValueError(f"{self.name}: side 必須為 long 或 short")
+        if self.stop not in STOP_LABELS:
+            raise ValueError(f"{self.name}: stop 必須為 {' 或 '.join(STOP_LABELS)}")
+        rules = tuple(rule if isinstance(rule, Rule) else Rule(*rule) for rule in self.rules)
+        if not any(rule.action == ENTER for rule in rules):
+            raise ValueError(f"{self.name}: 至少需要一條進場（{ENTER}）規則")
+        object.__setattr__(self, "rules", rules)
+        if self.title is None:
+            object.__setattr__(self, "title", f"{self.name} {'多單' if self.side == 'long' else '空單'}")
+
+    @property
+    def entry_rules(self):
+        return tuple(rule for rule in self.rules if rule.action == ENTER)
+
+    @property
+    def exit_rules(self):
+        return tuple(rule for rule in self.rules if rule.action == EXIT)
+
+    @property
+    def label(self):
+        return STOP_LABELS[self.stop]
+
+    @property
+    def signal(self):
+        """Discord 通知的開倉 / 平倉信號欄位（'RSI'、'Breakout 空' 等）。"""
+        return self.label if self.side == "long" else f"{self.label} 空"
+
+
+DEFAULT_STRATEGIES = (
+    Strategy(RSI_LONG, "long", STOP_FIXED, (Rule("rsi", "<", "rsi_buy", ENTER), Rule("rsi", ">", "exit_rsi", EXIT)),
+             title="RSI 多單", block_after_exit=True),
+    Strategy(BREAKOUT_LONG, "long", STOP_TRAILING, (Rule("close", ">", "highest_break", ENTER),), title="突破多單"),
+    Strategy(RSI_SHORT, "short", STOP_FIXED, (Rule("rsi", ">", "rsi_sell", ENTER), Rule("rsi", "<", "exit_rsi_short", EXIT)),
+             title="RSI 空單"),
+    Strategy(BREAKOUT_SHORT, "short", STOP_TRAILING, (Rule("close", "<", "lowest_break", ENTER),), title="突破空單"),
+)
+
+
+def load_strategies(entries=None):
+    """
+    由 config.STRATEGIES 建立 Strategy 列表（None 時為 DEFAULT_STRATEGIES），每個項目為 Strategy 或 dict：
+    {"name": "rsi_deep", "side": "long", "stop": "atr_fixed", "title": "深度 RSI 多單",
+     "rules": [["rsi", "<", 30, "enter"], ["close", ">", "lowest_break", "enter"], ["rsi", ">", "exit_rsi", "exit"]]}。
+    """
+    if entries is None:
+        return DEFAULT_STRATEGIES
+    strategies = []
+    for entry in entries:
+        strategies.append(entry if isinstance(entry, Strategy) else Strategy(**dict(entry)))
+    names = [strategy.name for strategy in strategies]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"STRATEGIES 重複的策略名稱: {', '.join(duplicates)}")
+    if not strategies:
+        raise ValueError("STRATEGIES 至少需要一個策略")
+    return tuple(strategies)
+
+
+def live_values(indicators, close):
+    """IncrementalIndicators 目前K線的指標值（RuleSet.entry_signal 的 values）。"""
+    return {"close": close, "rsi": indicators.rsi, "atr": indicators.atr,
+            "highest_break": indicators.highest_break, "lowest_break": indicators.lowest_break}
+
+
+def _defined(value):
+    return value is not None and value == value
+
+
+class RuleSet:
+    """
+    以 StrategyParams 編譯的規則集。每個條件編譯為 (指標, 比較運算子, 門檻數值或指標名稱, 門檻是否為指標, 觸發價名稱)，
+    實盤以 Python 純量比較，回測以 NumPy 對整段序列比較。
+    """
+
+    def __init__(self, strategies=DEFAULT_STRATEGIES, params=None):
+        self.strategies = tuple(strategies)
+        self.params = params or StrategyParams.from_config()
+        self._by_name = {strategy.name: strategy for strategy in self.strategies}
+        self._entry = [tuple(self._compile(rule) for rule in s.entry_rules) for s in self.strategies]
+        self._exit = {s.name: tuple(self._compile(rule) for rule in s.exit_rules) for s in self.strategies if s.exit_rules}
+
+    def _compile(self, rule):
+        threshold = rule.threshold
+        is_series = threshold in SERIES_THRESHOLDS
+        if not is_series:
+            threshold = float(getattr(self.params, threshold) if isinstance(threshold, str) else threshold)
+        return rule.indicator, rule.comparator, threshold, is_series, rule.threshold_key
+
+    def strategy(self, name):
+        """進場類型對應的 Strategy；未登錄（或無持倉 None）時回傳 None。"""
+        return self._by_name.get(name)
+
+    def rsi_levels(self):
+        """IncrementalIndicators 需預先計算觸發價的 RSI 門檻：{觸發價名稱: 門檻}。"""
+        levels = {}
+        for clauses in list(self._entry) + list(self._exit.values()):
+            for indicator, _, threshold, _, key in clauses:
+                if indicator == "rsi":
+                    levels[key] = threshold
+        return levels
+
+    # === 實盤：純量判斷 === #
+    @staticmethod
+    def _holds(clause, values):
+        indicator, comparator, threshold, is_series, _ = clause
+        left = values.get(indicator)
+        right = values.get(threshold) if is_series else threshold
+        return _defined(left) and _defined(right) and COMPARATORS[comparator][0](left, right)
+
+    def first_entry(self, values):
+        """依登錄順序第一個所有進場規則都成立的策略名稱（不考慮 block_after_exit），都不成立時回傳 None。"""
+        for strategy, clauses in zip(self.strategies, self._entry):
+            if all(self._holds(clause, values) for clause in clauses):
+                return strategy.name
+        return None
+
+    def entry_signal(self, values, blocked=False):
+        """
+        無持倉時的進場判斷，回傳策略名稱或 None。values 為 {指標: 值}（見 live_values）；
+        blocked（本K棒已有 block_after_exit 策略平倉）時，第一個成立的策略若為 block_after_exit 則不進場。
+        """
+        name = self.first_entry(values)
+        if name is not None and blocked and self._by_name[name].block_after_exit:
+            return None
+        return name
+
+    def entry_signal_at_price(self, rsi_prices, price, values, blocked=False):
+        """
+        與 entry_signal 相同的判斷，但以盤中價格 price 取代收盤價，RSI 條件改為 price 與觸發價 rsi_prices[名稱] 比較
+        （RSI 隨收盤價單調遞增，RSI < 門檻等同 price < 觸發價）；rsi_prices 為空（暖機期間）時 RSI 條件不成立。
+        ATR 與突破高低點沿用 values 中目前K線的值。
+        """
+        values = dict(values, close=price)
+        name = None
+        for strategy, clauses in zip(self.strategies, self._entry):
+            if all(self._holds_at_price(clause, values, rsi_prices, price) for clause in clauses):
+                name = strategy.name
+                break
+        if name is not None and blocked and self._by_name[name].block_after_exit:
+            return None
+        return name
+
+    def _holds_at_price(self, clause, values, rsi_prices, price):
+        indicator, comparator, _, _, key = clause
+        if indicator != "rsi":
+            return self._holds(clause, values)
+        trigger = rsi_prices.get(key) if rsi_prices else None
+        return trigger is not None and COMPARATORS[comparator][0](price, trigger)
+
+    def exit_signal(self, name, values):
+        """K 棒收盤時的平倉判斷：values 為剛收盤K線的 {"rsi": ..., "close": ...}；策略沒有平倉規則時回傳 False。"""
+        clauses = self._exit.get(name)
+        return bool(clauses) and all(self._holds(clause, values) for clause in clauses)
+
+    def describe(self, name, values, action=ENTER):
+        """成立條件的文字說明（事件日誌用），例如 'rsi=45.20 < rsi_buy(47.00)'。"""
+        clauses = self._entry[self.strategies.index(self._by_name[name])] if action == ENTER else self._exit.get(name, ())
+        parts = []
+        for indicator, comparator, threshold, is_series, key in clauses:
+            right = values.get(threshold) if is_series else threshold
+            left = values.get(indicator)
+            left_text = f"{left:.2f}" if _defined(left) else "N/A"
+            right_text = f"{right:.2f}" if _defined(right) else "N/A"
+            if is_series or key in PARAM_FIELDS:
+                right_text = f"{key}({right_text})"
+            parts.append(f"{indicator}={left_text} {comparator} {right_text}")
+        return ", ".join(parts)
+
+    # === 回測：向量化判斷 === #
+    @staticmethod
+    def _mask(clauses, arrays, cache):
+        """多個條件同時成立的布林序列；相同條件（指標、運算子、門檻）在同一次計算中只比較一次。"""
+        mask = None
+        for indicator, comparator, threshold, is_series, _ in clauses:
+            key = (indicator, comparator, threshold)
+            clause_mask = cache.get(key)
+            if clause_mask is None:
+                right = arrays[threshold] if is_series else threshold
+                clause_mask = COMPARATORS[comparator][1](arrays[indicator], right)  # NaN 比較結果為 False
+                cache[key] = clause_mask
+            mask = clause_mask if mask is None else mask & clause_mask
+        return mask
+
+    def entry_codes(self, arrays):
+        """
+        對整段序列計算每根K線的進場策略：回傳 int8 陣列，值為 self.strategies 的索引（優先權最高者），無訊號為 -1。
+        arrays 為 {指標: 等長 NumPy 陣列}；block_after_exit 由呼叫端依平倉位置處理（見 backtest.simulate）。
+        """
+        n = len(arrays["close"])
+        codes = np.full(n, -1, dtype=np.int8)
+        cache = {}
+        # 由優先權低到高寫入，較早登錄的策略覆蓋較晚的策略
+        for index in reversed(range(len(self.strategies))):
+            codes[self._mask(self._entry[index], arrays, cache)] = index
+        return codes
+
+    def exit_masks(self, arrays):
+        """對整段序列計算各策略的平倉條件：{策略名稱: 布林陣列}（以每根K線收盤時的值判斷），沒有平倉規則的策略不列入。"""
+        cache = {}
+        return {name: self._mask(clauses, arrays, cache) for name, clauses in self._exit.items()}
@@ -0,0 +1,191 @@
+"""
+本地狀態儲存：單一 SQLite 資料庫（WAL 模式），取代 stats.json / position_entry_type.json / notified_orders.json。
+
+資料表：
+- stats：勝負統計（key / value）
+- positions：持倉中繼資料（positionId 為主鍵：交易對、進場方式、策略進場類型、止損價）
+- notified_orders：已通知的平倉單 orderId（主鍵查詢，不再線性掃描整個列表）
+- candle_flags：每根 K 線的旗標（例如本K棒已有 RSI 多單平倉），主鍵 (symbol, name, kline_time)
+
+每次寫入都在交易（transaction）中完成，程式中斷不會留下寫到一半的狀態。
+首次啟動時自動匯入舊的 JSON 檔，匯入後改名為 *.migrated。
+"""
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from config import STATE_DB_FILE
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS stats (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS positions (
+    position_id TEXT PRIMARY KEY,
+    symbol TEXT,
+    entry_type TEXT,
+    strategy TEXT,
+    stop_loss REAL,
+    opened_at REAL,
+    updated_at REAL,
+    closed_at REAL
+);
+CREATE INDEX IF NOT EXISTS positions_symbol_open ON positions (symbol, closed_at);
+CREATE TABLE IF NOT EXISTS notified_orders (
+    order_id TEXT PRIMARY KEY,
+    symbol TEXT,
+    notified_at REAL
+);
+CREATE TABLE IF NOT EXISTS candle_flags (
+    symbol TEXT NOT NULL,
+    name TEXT NOT NULL,
+    kline_time INTEGER NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (symbol, name, kline_time)
+);
+"""
+
+
+class StateStore:
+    """
+    SQLite 狀態儲存。所有方法皆為同步呼叫，單次讀寫只需數十微秒，可直接在事件循環中使用。
+    """
+
+    def __init__(self, path=STATE_DB_FILE):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # isolation_level=None：自行以 BEGIN / COMMIT 控制交易
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    @contextmanager
+    def transaction(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def close(self):
+        self.conn.close()
+
+    # === 勝負統計 === #
+    def get_stats(self):
+        """回傳 (win_count, loss_count)。"""
+        rows = dict(self.conn.execute("SELECT key, value FROM stats").fetchall())
+        return rows.get("win_count", 0), rows.get("loss_count", 0)
+
+    def save_stats(self, win_count, loss_count):
+        with self.transaction() as conn:
+            conn.executemany("INSERT OR REPLACE INTO stats (key, value) VALUES (?, ?)",
+                             [("win_count", win_count), ("loss_count", loss_count)])
+
+    # === 持倉中繼資料 === #
+    def get_position(self, position_id):
+        row = self.conn.execute("SELECT * FROM positions WHERE position_id = ?", (str(position_id),)).fetchone()
+        return dict(row) if row is not None else None
+
+    def position_entry_type(self, position_id, default=None):
+        """持倉的進場方式（'RSI' / 'Breakout'），沒有紀錄時回傳 default。"""
+        row = self.conn.execute("SELECT entry_type FROM positions WHERE position_id = ?", (str(position_id),)).fetchone()
+        return row[0] if row is not None and row[0] is not None else default
+
+    def save_position(self, position_id, symbol, entry_type, strategy=None, stop_loss=None):
+        """新增或更新持倉紀錄（重新開倉的同一 positionId 會清除 closed_at）。"""
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute(
+                """INSERT INTO positions (position_id, symbol, entry_type, strategy, stop_loss, opened_at, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(position_id) DO UPDATE SET
+                       symbol = excluded.symbol, entry_type = excluded.entry_type,
+                       strategy = COALESCE(excluded.strategy, positions.strategy),
+                       stop_loss = COALESCE(excluded.stop_loss, positions.stop_loss),
+                       updated_at = excluded.updated_at, closed_at = NULL""",
+                (str(position_id), symbol, entry_type, strategy, stop_loss, now, now))
+
+    def update_stop_loss(self, position_id, stop_loss):
+        with self.transaction() as conn:
+            conn.execute("UPDATE positions SET stop_loss = ?, updated_at = ? WHERE position_id = ?",
+                         (stop_loss, time.time(), str(position_id)))
+
+    def close_position(self, position_id):
+        with self.transaction() as conn:
+            conn.execute("UPDATE positions SET closed_at = ?, updated_at = ? WHERE position_id = ?",
+                         (time.time(), time.time(), str(position_id)))
+
+    # === 已通知平倉單 === #
+    def is_order_notified(self, order_id):
+        return self.conn.execute("SELECT 1 FROM notified_orders WHERE order_id = ?", (str(order_id),)).fetchone() is not None
+
+    def mark_order_notified(self, order_id, symbol=None):
+        """記錄已通知的 orderId，回傳 True 表示首次記錄（先前未通知過）。"""
+        with self.transaction() as conn:
+            cursor = conn.execute("INSERT OR IGNORE INTO notified_orders (order_id, symbol, notified_at) VALUES (?, ?, ?)",
+                                  (str(order_id), symbol, time.time()))
+        return cursor.rowcount == 1
+
+    # === K 線旗標 === #
+    def set_candle_flag(self, symbol, name, kline_time, value=True):
+        with self.transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO candle_flags (symbol, name, kline_time, value) VALUES (?, ?, ?, ?)",
+                         (symbol, name, int(kline_time), int(bool(value))))
+
+    def candle_flags(self, symbol, name, since=None):
+        """回傳 {kline_time(毫秒): bool}，since 指定時只取該時間之後的旗標。"""
+        rows = self.conn.execute(
+            "SELECT kline_time, value FROM candle_flags WHERE symbol = ? AND name = ? AND kline_time >= ?",
+            (symbol, name, since if since is not None else 0)).fetchall()
+        return {row[0]: bool(row[1]) for row in rows}
+
+    def prune_candle_flags(self, before):
+        """刪除 kline_time 早於 before（毫秒）的旗標。"""
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM candle_flags WHERE kline_time < ?", (int(before),))
+
+    # === 舊 JSON 檔匯入 === #
+    def migrate_json(self, stats_file=None, position_entry_type_file=None, notified_orders_file=None):
+        """
+        首次啟動時匯入舊的 JSON 狀態檔（只執行一次），匯入成功的檔案改名為 *.migrated。
+        回傳已匯入的檔案列表。
+        """
+        if self.conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            return []
+        loaded = {}
+        for name, path in (("stats", stats_file), ("positions", position_entry_type_file), ("orders", notified_orders_file)):
+            if path and os.path.exists(path):
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        loaded[name] = (path, json.load(f))
+                except (IOError, ValueError) as e:
+                    print(f"[StateStore] 無法讀取 {path}，略過匯入: {e}")
+        now = time.time()
+        with self.transaction() as conn:
+            if "stats" in loaded:
+                stats = loaded["stats"][1]
+                conn.executemany("INSERT OR REPLACE INTO stats (key, value) VALUES (?, ?)",
+                                 [("win_count", int(stats.get("win_count", 0))), ("loss_count", int(stats.get("loss_count", 0)))])
+            if "positions" in loaded:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO positions (position_id, entry_type, opened_at, updated_at) VALUES (?, ?, ?, ?)",
+                    [(str(pid), entry_type, now, now) for pid, entry_type in loaded["positions"][1].items()])
+            if "orders" in loaded:
+                conn.executemany("INSERT OR IGNORE INTO notified_orders (order_id, notified_at) VALUES (?, ?)",
+                                 [(str(oid), now) for oid in loaded["orders"][1]])
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)", (str(now),))
+        for path, _ in loaded.values():
+            os.replace(path, path + ".migrated")
+            print(f"[StateStore] 已匯入 {path}")
+        return [path for path, _ in loaded.values()]
@@ -0,0 +1,87 @@
+"""
+策略參數與止損止盈計算（純函數，不含任何 API 呼叫）。
+
+實盤 execute_trading_strategy 與回測 backtest.py 共用：
+- StrategyParams：config.py 策略參數
+- RSI 單（固定止損止盈）以開倉價 ± ATR 倍數設定止損止盈
+- 突破單 ATR 移動止損
+進出場條件由 rule_engine.py 的宣告式規則（指標、比較運算子、門檻、動作）判斷。
+"""
+from dataclasses import dataclass, asdict, replace
+
+# 進場類型（與 current_pos_entry_type 相同）
+RSI_LONG = "rsi"
+BREAKOUT_LONG = "breakout"
+RSI_SHORT = "rsi_short"
+BREAKOUT_SHORT = "breakout_short"
+
+
+# config.py 參數名稱 -> StrategyParams 欄位
+CONFIG_FIELDS = {
+    "RSI_BUY": "rsi_buy",
+    "rsiSell": "rsi_sell",
+    "EXIT_RSI": "exit_rsi",
+    "exitRSI_short": "exit_rsi_short",
+    "RSI_LEN": "rsi_len",
+    "ATR_LEN": "atr_len",
+    "ATR_MULT": "atr_mult",
+    "STOP_MULT": "stop_mult",
+    "LIMIT_MULT": "limit_mult",
+    "BREAKOUT_LOOKBACK": "breakout_lookback",
+}
+# 長度類參數必須為整數
+INT_FIELDS = ("rsi_len", "atr_len", "breakout_lookback")
+
+
+@dataclass(frozen=True)
+class StrategyParams:
+    """策略參數，欄位對應 config.py 同名參數（見 CONFIG_FIELDS）。"""
+    rsi_buy: float = 47  # RSI_BUY
+    rsi_sell: float = 53  # rsiSell
+    exit_rsi: float = 44  # EXIT_RSI
+    exit_rsi_short: float = 51  # exitRSI_short
+    rsi_len: int = 12  # RSI_LEN
+    atr_len: int = 12  # ATR_LEN
+    atr_mult: float = 3.25  # ATR_MULT
+    stop_mult: float = 1.0  # STOP_MULT
+    limit_mult: float = 4  # LIMIT_MULT
+    breakout_lookback: int = 3  # BREAKOUT_LOOKBACK
+
+    @classmethod
+    def from_config(cls):
+        import config
+        return cls(**{field: getattr(config, name) for name, field in CONFIG_FIELDS.items()})
+
+    def to_dict(self):
+        return asdict(self)
+
+    def with_values(self, **changes):
+        return replace(self, **changes)
+
+
+def rsi_stop_take_profit(params, side, entry_price, atr):
+    """RSI 單止損 / 止盈 = 開倉價 ± ATR × 倍數，回傳 (stop_loss, take_profit)。"""
+    if side == "long":
+        return entry_price - atr * params.stop_mult, entry_price + atr * params.limit_mult
+    return entry_price + atr * params.stop_mult, entry_price - atr * params.limit_mult
+
+
+def breakout_stop(params, side, close, atr):
+    """突破單（移動）止損價 = 收盤價 ∓ ATR × ATR_MULT。"""
+    if side == "long":
+        return close - atr * params.atr_mult
+    return close + atr * params.atr_mult
+
+
+def trailing_stop_update(params, side, close, atr, current_stop):
+    """
+    突破單移動止損：新止損只往有利方向移動，回傳新止損價；不需調整時回傳 None。
+    """
+    if current_stop is None:
+        return None
+    new_stop = breakout_stop(params, side, close, atr)
+    if side == "long" and new_stop > current_stop:
+        return new_stop
+    if side == "short" and new_stop < current_stop:
+        return new_stop
+    return None
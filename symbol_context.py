@@ -0,0 +1,97 @@
+"""
+單一交易對的策略執行環境。
+
+原本 current_pos_entry_type、current_stop_loss_price、current_position_id_global、last_checked_kline_time
+等狀態都是模組全域變數，一個程序只能交易一個合約。SymbolContext 把這些狀態收進每個交易對各自的物件，
+主程式為 config.SYMBOLS 中的每個交易對建立一個 SymbolContext 並各自以一個 asyncio task 執行；
+HTTP 連線池、Discord 客戶端、K 線連線與請求速率額度由所有交易對共用。
+"""
+import asyncio
+
+from config import SYMBOLS, TIMEFRAME, LEVERAGE, WALLET_PERCENTAGE, QUANTITY_PRECISION, MARGIN_COIN, STRATEGIES
+from indicators import IncrementalIndicators
+from rule_engine import RuleSet, load_strategies
+from strategy_rules import StrategyParams
+
+
+def trading_pair_for(symbol, margin_coin=MARGIN_COIN):
+    """Bitunix 交易符號轉 ccxt 交易對：'ETHUSDT' -> 'ETH/USDT'。"""
+    if "/" in symbol:
+        return symbol
+    if symbol.endswith(margin_coin):
+        return f"{symbol[:-len(margin_coin)]}/{margin_coin}"
+    raise ValueError(f"無法由 {symbol} 推導交易對，請在 SYMBOLS 中指定 trading_pair")
+
+
+class SymbolContext:
+    """單一交易對的設定、指標引擎與持倉狀態。"""
+
+    def __init__(self, symbol, trading_pair=None, timeframe=TIMEFRAME, margin_coin=MARGIN_COIN, leverage=LEVERAGE,
+                 wallet_percentage=WALLET_PERCENTAGE, quantity_precision=QUANTITY_PRECISION, params=None, strategies=None):
+        self.symbol = symbol
+        self.trading_pair = trading_pair or trading_pair_for(symbol, margin_coin)
+        self.timeframe = timeframe
+        self.margin_coin = margin_coin
+        self.leverage = leverage
+        self.wallet_percentage = wallet_percentage
+        self.quantity_precision = quantity_precision
+        self.params = params or StrategyParams.from_config()
+        # 進出場規則集（strategies 省略時使用 config.STRATEGIES），與 backtest.py 共用同一套規則
+        self.rules = RuleSet(load_strategies(STRATEGIES if strategies is None else strategies), self.params)
+        # 增量指標引擎：保存 Wilder 平滑狀態，每輪只更新最後一根K線；每根K線收盤時預先算出規則用到的各 RSI 門檻的觸發價
+        self.indicators = IncrementalIndicators(self.params.rsi_len, self.params.atr_len, self.params.breakout_lookback,
+                                                self.rules.rsi_levels())
+
+        # === 持倉狀態（原模組全域變數） ===
+        self.pos_entry_type = None  # 記錄持倉的進場信號類型 ('rsi' / 'breakout' / 'rsi_short' / 'breakout_short')
+        self.stop_loss_price = None  # 記錄當前持倉的止損價格
+        self.position_id = None  # 記錄當前持倉的 positionId
+        self.tpsl_order_ids = []  # 本程式為當前持倉設置的 TP/SL 條件單 orderId（備援取消時不需再查詢）
+        self.last_checked_kline_time = None  # 記錄上一次檢查的K棒時間（開盤時間毫秒）
+        self.entry_price_long = None  # 多單開倉價
+        self.entry_price_short = None  # 空單開倉價
+        self.long_action_taken_on_kline_time = {}  # K棒開盤時間毫秒 -> 本K棒是否已有 block_after_exit 策略（預設 RSI 多單）平倉
+
+        # === 行情與排程 ===
+        self.market_stream = None  # MARKET_DATA_MODE = "websocket" 時的 MarketStream
+        self.stream_task = None
+        self.market_update_event = asyncio.Event()
+        self.scheduler = None  # CandleScheduler：K線收盤對齊的喚醒排程（主循環啟動時建立）
+        self.last_eval_time = 0.0
+
+        # === Discord 持倉訊息 ===
+        self.position_message = None  # 已發送的 discord.Message，直接編輯不需再 fetch_message
+        self.position_message_hash = None  # 上次送出的內容雜湊（不含時間欄位）
+        self.position_message_state = None  # 上次送出時的持倉狀態（方向、數量、進場方式）
+        self.position_message_edit_time = 0.0
+
+    def __repr__(self):
+        return f"SymbolContext({self.symbol!r}, {self.trading_pair!r}, {self.timeframe!r})"
+
+    def reset_position_state(self):
+        """平倉後清除持倉相關狀態。"""
+        self.pos_entry_type = None
+        self.stop_loss_price = None
+        self.position_id = None
+        self.tpsl_order_ids = []
+
+
+def load_symbol_contexts(entries=None):
+    """
+    由 config.SYMBOLS 建立 SymbolContext 列表。
+    每個項目可為交易符號字串（'ETHUSDT'），或含 symbol 與覆寫欄位的 dict，
+    例如 {"symbol": "BTCUSDT", "leverage": 10, "wallet_percentage": 0.2, "quantity_precision": 3}。
+    """
+    entries = SYMBOLS if entries is None else entries
+    contexts = []
+    seen = set()
+    for entry in entries:
+        options = {"symbol": entry} if isinstance(entry, str) else dict(entry)
+        symbol = options.get("symbol")
+        if not symbol:
+            raise ValueError(f"SYMBOLS 項目缺少 symbol: {entry}")
+        if symbol in seen:
+            raise ValueError(f"SYMBOLS 重複的交易符號: {symbol}")
+        seen.add(symbol)
+        contexts.append(SymbolContext(**options))
+    return contexts
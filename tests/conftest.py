@@ -0,0 +1,31 @@
+import os
+import re
+import sys
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 測試直接匯入專案根目錄的模組（market_stream、private_stream ...）
+sys.path.insert(0, ROOT)
+
+
+def _load_config():
+    """
+    config.py 的 DISCORD_CHANNEL_ID 是留給使用者填寫的空白（尚未填入時無法匯入），
+    測試時以 0 代入後載入，其餘設定維持原樣。
+    """
+    try:
+        import config  # noqa: F401
+        return
+    except SyntaxError:
+        pass
+    path = os.path.join(ROOT, "config.py")
+    with open(path, encoding="utf-8") as f:
+        source = re.sub(r"^DISCORD_CHANNEL_ID\s*=\s*#", "DISCORD_CHANNEL_ID = 0  #", f.read(), flags=re.M)
+    module = types.ModuleType("config")
+    module.__file__ = path
+    exec(compile(source, path, "exec"), module.__dict__)
+    sys.modules["config"] = module
+
+
+_load_config()
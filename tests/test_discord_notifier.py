@@ -0,0 +1,47 @@
+import asyncio
+
+from discord_notifier import DiscordNotifier, MAX_EMBED_CHARS_PER_MESSAGE, embed_length
+
+
+class FakeResponse:
+    status = 200
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSession:
+    """記錄每次 Webhook 請求送出的 Embed 數量與總字數。"""
+
+    def __init__(self):
+        self.batches = []
+
+    def post(self, url, json, timeout):
+        self.batches.append(json["embeds"])
+        return FakeResponse()
+
+
+def test_batches_are_capped_by_total_embed_length():
+    session = FakeSession()
+
+    async def scenario():
+        notifier = DiscordNotifier("https://example.invalid/webhook", batch_delay=0, session=session)
+        for i in range(6):
+            notifier.notify({"title": f"#{i}", "description": "x" * 2500})
+        notifier.notify({"title": "oversized", "description": "y" * 7000})
+        await notifier.close()
+        return notifier
+
+    notifier = asyncio.run(scenario())
+    assert notifier.sent == 7
+    assert [len(batch) for batch in session.batches] == [2, 2, 2, 1]
+    for batch in session.batches:
+        assert sum(embed_length(embed) for embed in batch) <= MAX_EMBED_CHARS_PER_MESSAGE
+    # 單一 Embed 超過上限時截短內文
+    assert embed_length(session.batches[-1][0]) == MAX_EMBED_CHARS_PER_MESSAGE
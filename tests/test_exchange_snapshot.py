@@ -0,0 +1,56 @@
+import asyncio
+
+from bitunix_client import ExchangeSnapshot
+
+
+class SlowClient:
+    """第一個查詢等到 release 才回應，之後的查詢立即回應；每次回應帶遞增的版本號。"""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def get(self, path, params):
+        self.calls += 1
+        version = self.calls
+        if version == 1:
+            await self.release.wait()
+        return {"code": 0, "data": [{"version": version}]}
+
+
+def test_response_in_flight_during_invalidate_is_not_cached():
+    async def scenario():
+        client = SlowClient()
+        snapshot = ExchangeSnapshot(client)
+        stale_read = asyncio.create_task(snapshot.pending_positions("ETHUSDT"))
+        await asyncio.sleep(0)
+        # 查詢進行中下單：清除快照
+        snapshot.invalidate("ETHUSDT")
+        fresh = await asyncio.wait_for(snapshot.pending_positions("ETHUSDT"), timeout=5)
+        client.release.set()
+        stale = await stale_read
+        cached = await snapshot.pending_positions("ETHUSDT")
+        return client, stale, fresh, cached
+
+    client, stale, fresh, cached = asyncio.run(scenario())
+    assert stale["data"][0]["version"] == 1
+    assert fresh["data"][0]["version"] == 2
+    # 下單前的回應晚到也不會覆蓋快取
+    assert cached["data"][0]["version"] == 2
+    assert client.calls == 2
+
+
+def test_concurrent_reads_share_one_request():
+    async def scenario():
+        client = SlowClient()
+        snapshot = ExchangeSnapshot(client)
+        reads = [asyncio.create_task(snapshot.pending_positions("ETHUSDT")) for _ in range(3)]
+        await asyncio.sleep(0)
+        client.release.set()
+        results = await asyncio.gather(*reads)
+        return client, results, await snapshot.pending_positions("ETHUSDT")
+
+    client, results, cached = asyncio.run(scenario())
+    assert client.calls == 1
+    assert all(r["data"][0]["version"] == 1 for r in results)
+    assert cached["data"][0]["version"] == 1
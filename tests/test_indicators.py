@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+import talib
+
+from indicators import IncrementalIndicators, VERIFY_RTOL, indicator_arrays, random_ohlcv, verify_against_talib, verify_rsi_prices
+
+RSI_LEN, ATR_LEN, BREAKOUT_LEN = 14, 14, 20
+
+
+@pytest.fixture(scope="module")
+def ohlcv():
+    return random_ohlcv(3000, seed=3)
+
+
+@pytest.mark.parametrize("rsi_len, atr_len, breakout_len", [(RSI_LEN, ATR_LEN, BREAKOUT_LEN), (2, 1, 1), (30, 7, 55)])
+def test_incremental_engine_matches_talib(ohlcv, rsi_len, atr_len, breakout_len):
+    # 逐根比對，含盤中先以開盤價更新再覆寫
+    assert verify_against_talib(ohlcv, rsi_len, atr_len, breakout_len, rtol=VERIFY_RTOL) == 0
+
+
+def test_sync_matches_full_series(ohlcv):
+    rsi, atr, highest, lowest = indicator_arrays(ohlcv, RSI_LEN, ATR_LEN, BREAKOUT_LEN)
+    engine = IncrementalIndicators(RSI_LEN, ATR_LEN, BREAKOUT_LEN)
+    # 以滑動緩衝區逐根同步（實盤的呼叫方式），最後一根與整段計算一致
+    for end in range(200, len(ohlcv) + 1, 97):
+        engine.sync(ohlcv[:end])
+        np.testing.assert_allclose([engine.rsi, engine.atr], [rsi[end - 1], atr[end - 1]], rtol=VERIFY_RTOL, atol=0)
+        assert (engine.highest_break, engine.lowest_break) == (highest[end - 1], lowest[end - 1])
+
+
+@pytest.mark.parametrize("level", [30.0, 44.0, 70.0])
+def test_rsi_price_round_trip(ohlcv, level):
+    engine = IncrementalIndicators(RSI_LEN, ATR_LEN, BREAKOUT_LEN).seed(ohlcv[:500])
+    price = engine.rsi_price(level)
+    assert price is not None and price > 0
+    row = ohlcv[499]
+    engine.update(row[0], max(row[2], price), min(row[3], price), price)
+    assert engine.rsi == pytest.approx(level, abs=1e-6)
+    # 以觸發價作為目前 K 線收盤，TA-Lib 算出的 RSI 也等於門檻
+    close = ohlcv[:500, 4].copy()
+    close[-1] = price
+    assert talib.RSI(close, timeperiod=RSI_LEN)[-1] == pytest.approx(level, abs=1e-6)
+
+
+def test_rsi_prices_consistent_across_history(ohlcv):
+    assert verify_rsi_prices(ohlcv, RSI_LEN, (30.0, 44.0, 56.0, 70.0)) == 0
@@ -0,0 +1,127 @@
+import asyncio
+
+import market_stream
+from market_stream import MarketStream, ReplayServer
+
+TF_MS = 60_000  # 1m
+
+
+def kline(i, closed=True, close=100.0):
+    return {"stream": "ethusdt@kline_1m",
+            "data": {"e": "kline", "k": {"t": i * TF_MS, "o": "100", "h": "101", "l": "99", "c": str(close), "v": "1", "x": closed}}}
+
+
+def ticker(price):
+    return {"stream": "ethusdt@miniTicker", "data": {"e": "24hrMiniTicker", "c": str(price)}}
+
+
+class ListStore:
+    """與 CandleStore 相同介面（last_timestamp / update / apply_price）的簡單 K 線表。"""
+
+    def __init__(self):
+        self.rows = {}
+
+    @property
+    def last_timestamp(self):
+        return int(max(self.rows)) if self.rows else None
+
+    def update(self, rows):
+        for row in rows:
+            self.rows[row[0]] = list(row)
+
+    def apply_price(self, price):
+        row = self.rows[max(self.rows)]
+        row[4] = price
+        row[2], row[3] = max(row[2], price), min(row[3], price)
+
+
+class RestFeed:
+    """
+    以固定數據代替 Binance REST 的 CandleFeed：第 n 次 refresh() 補上 histories[n] 的 K 線
+    （超過時沿用最後一份），並記錄呼叫次數。
+    """
+
+    def __init__(self, *histories):
+        self.histories = histories
+        self.stores = {}
+        self.refreshes = 0
+        self.persisted = 0
+
+    def store(self, symbol, timeframe):
+        return self.stores.setdefault((symbol, timeframe), ListStore())
+
+    async def refresh(self, symbol, timeframe):
+        store = self.store(symbol, timeframe)
+        store.update(self.histories[min(self.refreshes, len(self.histories) - 1)])
+        self.refreshes += 1
+        return store
+
+    def persist(self, symbol, timeframe):
+        self.persisted += 1
+
+
+def rest_rows(indexes):
+    return [[float(i * TF_MS), 100.0, 101.0, 99.0, 100.0, 1.0] for i in indexes]
+
+
+async def run_stream(server, feed, expected_updates):
+    updates = []
+
+    async def on_update(kind, closed):
+        updates.append((kind, closed))
+        if len(updates) == expected_updates:
+            stream.stop()
+
+    stream = MarketStream(feed, "ETH/USDT", "1m", on_update=on_update, url=server.url)
+    task = asyncio.create_task(stream.run())
+    try:
+        await asyncio.wait_for(task, timeout=10)
+    finally:
+        task.cancel()
+    return stream, updates
+
+
+def test_reconnects_after_drop_and_backfills_each_connection(monkeypatch):
+    monkeypatch.setattr(market_stream, "RECONNECT_DELAY_SECONDS", 0)
+    frames = [kline(5, closed=False), ticker(102.5), kline(5), kline(6, closed=False), ticker(98.0)]
+
+    async def scenario():
+        server = await ReplayServer(frames, drop_after=2).start()
+        feed = RestFeed(rest_rows(range(0, 5)))
+        try:
+            stream, updates = await run_stream(server, feed, len(frames))
+        finally:
+            await server.stop()
+        return server, feed, stream, updates
+
+    server, feed, stream, updates = asyncio.run(scenario())
+    assert server.connections == 3
+    assert stream.reconnects == 2
+    # 每次（重新）連線都先以 REST 補齊
+    assert feed.refreshes == server.connections
+    assert [kind for kind, _ in updates] == ["kline", "ticker", "kline", "kline", "ticker"]
+    store = feed.store("ETH/USDT", "1m")
+    assert sorted(store.rows) == [i * TF_MS for i in range(7)]
+    assert store.rows[6 * TF_MS][4] == 98.0 and store.rows[6 * TF_MS][3] == 98.0
+    assert feed.persisted == 1  # 只有收盤的 K 線寫入快取
+    assert not stream.live
+
+
+def test_kline_gap_triggers_rest_backfill(monkeypatch):
+    monkeypatch.setattr(market_stream, "RECONNECT_DELAY_SECONDS", 0)
+    # 連線時 REST 只到第 4 根；推送第 5 根後漏收第 6、7 根，直接收到第 8 根
+    frames = [kline(5), kline(8, closed=False)]
+
+    async def scenario():
+        server = await ReplayServer(frames).start()
+        feed = RestFeed(rest_rows(range(0, 5)), rest_rows(range(0, 8)))
+        try:
+            stream, updates = await run_stream(server, feed, len(frames))
+        finally:
+            await server.stop()
+        return feed, stream, updates
+
+    feed, stream, updates = asyncio.run(scenario())
+    assert len(updates) == 2
+    assert feed.refreshes == 2  # 連線時一次、偵測到缺口一次
+    assert sorted(feed.store("ETH/USDT", "1m").rows) == [i * TF_MS for i in range(9)]
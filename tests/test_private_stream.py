@@ -0,0 +1,87 @@
+import asyncio
+import time
+
+import private_stream
+from private_stream import PrivateStream, PrivateStandInServer
+
+API_KEY = "test-key"
+SECRET_KEY = "test-secret"
+
+
+async def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("等待條件逾時")
+        await asyncio.sleep(0.01)
+
+
+async def stop_stream(stream, task, server):
+    stream.stop()
+    await server.disconnect_all()
+    await asyncio.wait_for(task, timeout=5)
+
+
+def test_login_with_wrong_secret_is_rejected(monkeypatch):
+    monkeypatch.setattr(private_stream, "RECONNECT_DELAY_SECONDS", 0.01)
+
+    async def scenario():
+        server = await PrivateStandInServer(API_KEY, SECRET_KEY).start()
+        stream = PrivateStream(API_KEY, "wrong-secret", url=server.url)
+        task = asyncio.create_task(stream.run())
+        try:
+            # 登入被拒時不訂閱，斷線後重連再試
+            await wait_until(lambda: stream.reconnects >= 2)
+            live = stream.live
+        finally:
+            await stop_stream(stream, task, server)
+            await server.stop()
+        return server, live
+
+    server, live = asyncio.run(scenario())
+    assert not live
+    assert server.logins == 0
+    assert not server.subscriptions
+
+
+def test_order_push_resolves_position_and_close_profit():
+    async def scenario():
+        server = await PrivateStandInServer(API_KEY, SECRET_KEY).start()
+        stream = PrivateStream(API_KEY, SECRET_KEY, url=server.url)
+        task = asyncio.create_task(stream.run())
+        try:
+            await wait_until(lambda: stream.live and server.subscriptions == {"order", "position", "tpsl"} and server._clients)
+            waiter = asyncio.create_task(stream.wait_position_id("9001", timeout=5))
+            # 開倉訂單推送沒有 positionId，由下一則同交易對、同方向的持倉推送對應
+            await server.push("order", {"orderId": "9001", "symbol": "ETHUSDT", "side": "BUY", "orderStatus": "FILLED", "price": "2500"})
+            await server.push("position", {"event": "OPEN", "positionId": "P1", "symbol": "ETHUSDT", "side": "LONG", "qty": "0.1"})
+            position_id = await waiter
+            # 平倉：訂單推送帶 positionId 與成交價，止盈止損推送帶觸發類型，持倉推送帶已實現盈虧
+            closed_waiter = asyncio.create_task(stream.wait_position_closed("P1", timeout=5))
+            await server.push("order", {"orderId": "9002", "positionId": "P1", "symbol": "ETHUSDT", "side": "SELL",
+                                        "orderStatus": "FILLED", "reductionOnly": True, "avgPrice": "2600"})
+            await server.push("tpsl", {"event": "CLOSE", "positionId": "P1", "orderId": "T1", "symbol": "ETHUSDT", "type": "TAKE_PROFIT"})
+            await server.push("position", {"event": "CLOSE", "positionId": "P1", "symbol": "ETHUSDT", "side": "LONG", "realizedPNL": "9.5"})
+            closed = await closed_waiter
+        finally:
+            await stop_stream(stream, task, server)
+            await server.stop()
+        return server, stream, position_id, closed
+
+    server, stream, position_id, closed = asyncio.run(scenario())
+    assert server.logins == 1
+    assert position_id == "P1"
+    assert stream.order_positions["9001"] == "P1"
+    assert stream.order_positions["9002"] == "P1"
+    assert closed == {"profit": 9.5, "close_price": "2600", "trigger_type": "TAKE_PROFIT"}
+
+
+def test_wait_times_out_without_push():
+    async def scenario():
+        stream = PrivateStream(API_KEY, SECRET_KEY)
+        return await stream.wait_position_id("missing", timeout=0.05), stream._order_waiters
+
+    position_id, waiters = asyncio.run(scenario())
+    # 逾時回傳 None（呼叫端退回 REST 輪詢），且不留下等待中的 Future
+    assert position_id is None
+    assert not waiters
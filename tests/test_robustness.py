@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from robustness import walk_forward_windows, trade_returns, _resample_chunk
+
+
+def trade(pnl):
+    """backtest 交易明細格式（pnl 在第 9 欄）。"""
+    return (0, 0, "long", "RSI", 100.0, 100.0, 1.0, 0.0, pnl, "exit")
+
+
+def test_rolling_windows_step_by_test_length():
+    assert walk_forward_windows(1000, train=400, test=200) == [
+        (0, 400, 400, 600),
+        (200, 600, 600, 800),
+        (400, 800, 800, 1000),
+    ]
+
+
+def test_anchored_windows_keep_train_start_at_zero():
+    windows = walk_forward_windows(1000, train=400, test=200, step=300, anchored=True)
+    assert windows == [(0, 400, 400, 600), (0, 700, 700, 900)]
+
+
+@pytest.mark.parametrize("train, test", [(0, 100), (100, 0), (-1, 100)])
+def test_windows_reject_non_positive_lengths(train, test):
+    with pytest.raises(ValueError):
+        walk_forward_windows(1000, train, test)
+
+
+def test_windows_reject_too_little_history():
+    with pytest.raises(ValueError):
+        walk_forward_windows(500, train=400, test=200)
+
+
+def test_trade_returns_compound_on_cash_before_each_trade():
+    returns = trade_returns([trade(100.0), trade(-220.0)], initial_capital=1000.0)
+    np.testing.assert_allclose(returns, [0.1, -0.2])
+    assert len(trade_returns([], 1000.0)) == 0
+
+
+def test_trade_returns_clamp_at_total_loss():
+    # 爆倉加手續費超過全部資金時視為歸零
+    returns = trade_returns([trade(-1005.0)], initial_capital=1000.0)
+    assert returns.tolist() == [-1.0]
+
+
+def test_resample_chunk_is_deterministic_per_seed():
+    returns = np.array([0.05, -0.02, 0.1, -0.08, 0.03])
+    first = _resample_chunk((0, 50, returns, "bootstrap", np.random.SeedSequence(7)))
+    second = _resample_chunk((0, 50, returns, "bootstrap", np.random.SeedSequence(7)))
+    assert first[0] == second[0] == 0
+    np.testing.assert_array_equal(first[1], second[1])
+    np.testing.assert_array_equal(first[2], second[2])
+
+
+def test_shuffle_keeps_final_return():
+    returns = np.array([0.05, -0.02, 0.1, -0.08, 0.03])
+    offset, final, max_drawdown = _resample_chunk((250, 100, returns, "shuffle", np.random.SeedSequence(1)))
+    assert offset == 250
+    np.testing.assert_allclose(final, np.prod(1 + returns) - 1)
+    # 只打亂順序，回撤仍會隨順序變動
+    assert len(max_drawdown) == 100 and (max_drawdown >= 0).all()
@@ -0,0 +1,85 @@
+import asyncio
+
+import bitunix_trading_bot as bot
+from bitunix_client import get_client, register_client
+from event_journal import EventJournal
+from indicators import random_ohlcv
+from matching_engine import PaperExchange
+from paper_trading import PaperClient
+from private_stream import PrivateStream
+from state_store import StateStore
+from symbol_context import SymbolContext
+
+API_KEY = "test-key"
+SECRET_KEY = "test-secret"
+
+
+def test_close_with_stream_delivered_profit(tmp_path, monkeypatch):
+    monkeypatch.setattr(bot, "state_store", StateStore(str(tmp_path / "state.db")))
+    monkeypatch.setattr(bot, "event_journal", EventJournal(str(tmp_path / "events.jsonl")))
+    monkeypatch.setattr(bot, "win_count", 0)
+    monkeypatch.setattr(bot, "loss_count", 0)
+    exchange = PaperExchange(1000)
+    exchange.set_price("ETHUSDT", 2500.0)
+    register_client(PaperClient(exchange, API_KEY, SECRET_KEY))
+    stream = PrivateStream(API_KEY, SECRET_KEY)
+    stream.live = True
+    monkeypatch.setitem(bot.private_streams, API_KEY, stream)
+    ctx = SymbolContext("ETHUSDT")
+    strategy = ctx.rules.strategy("rsi")
+
+    async def scenario():
+        opened = await bot.send_order(API_KEY, SECRET_KEY, "ETHUSDT", ctx.margin_coin, "open_long", 0.1)
+        position_id = next(iter(exchange.positions))
+        ctx.position_id = position_id
+        ctx.pos_entry_type = strategy.name
+        # 平倉推送晚於下單回應抵達，盈虧與交易所相同以字串傳送
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.05, stream.handle, {"ch": "position", "data": {
+            "event": "CLOSE", "positionId": position_id, "symbol": "ETHUSDT", "side": "LONG", "realizedPNL": "9.5"}})
+        closed = await bot.close_strategy_position(ctx, strategy, API_KEY, SECRET_KEY, 0.1, position_id, 2600.0, 60_000)
+        return opened, position_id, closed
+
+    opened, position_id, closed = asyncio.run(scenario())
+    assert opened["code"] == 0
+    assert closed is True
+    assert (bot.win_count, bot.loss_count) == (1, 0)
+    assert bot.state_store.get_stats() == (1, 0)
+    assert ctx.position_id is None and ctx.pos_entry_type is None
+    # RSI 多單平倉後本K棒不再開倉
+    assert ctx.long_action_taken_on_kline_time[60_000]
+
+
+def test_entry_lock_covers_only_sizing_and_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(bot, "state_store", StateStore(str(tmp_path / "state.db")))
+    monkeypatch.setattr(bot, "event_journal", EventJournal(str(tmp_path / "events.jsonl")))
+    exchange = PaperExchange(1000)
+    monkeypatch.setattr(bot, "paper_exchange", exchange)
+    register_client(PaperClient(exchange, API_KEY, SECRET_KEY))
+    lock_states = {"order": [], "position_id": []}
+    send_order, get_position_id = bot.send_order, bot.get_position_id_by_order_id
+
+    async def recording_send_order(*args, **kwargs):
+        lock_states["order"].append(bot.entry_lock.locked())
+        return await send_order(*args, **kwargs)
+
+    async def recording_get_position_id(*args, **kwargs):
+        lock_states["position_id"].append(bot.entry_lock.locked())
+        return await get_position_id(*args, **kwargs)
+
+    monkeypatch.setattr(bot, "send_order", recording_send_order)
+    monkeypatch.setattr(bot, "get_position_id_by_order_id", recording_get_position_id)
+    ctx = SymbolContext("ETHUSDT")
+    ohlcv = random_ohlcv(400, seed=7)
+
+    async def scenario():
+        for i in range(100, len(ohlcv)):
+            get_client(API_KEY, SECRET_KEY).snapshot.invalidate(ctx.symbol)
+            await bot.execute_trading_strategy(ctx, API_KEY, SECRET_KEY, ohlcv_data=ohlcv[i - 99:i + 1])
+            if lock_states["position_id"]:
+                break
+
+    asyncio.run(scenario())
+    # 開倉單在鎖內送出，之後等待 positionId 時已釋放
+    assert lock_states["order"][0] is True
+    assert lock_states["position_id"] and not any(lock_states["position_id"])